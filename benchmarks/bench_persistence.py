@@ -0,0 +1,168 @@
+"""
+Benchmark of the persistence of the user data (save_data, backup_data and load_data)
+Developers only!
+
+Each scenario synthesizes user data with trade handlers, trade sets and trade set history entries as the bot holds it
+in memory and measures the median time of repeated deepcopy, save_data, backup_data and load_data calls (after an
+untimed warm-up call) and of loading data that has to be converted with convert_data first, as well as the peak memory
+during the deepcopy and the size of the written file. As the user data grows with every trade set, the results are kept
+per EazeBot version in a history file, so that the persistence cost can be followed over the versions. Results are only
+compared with versions measured on the same machine and python version, and increases below a noise floor are ignored.
+
+Usage:
+    python benchmarks/bench_persistence.py           # run the default scenarios and compare with the last version
+    python benchmarks/bench_persistence.py --full    # also run the large scenarios
+    python benchmarks/bench_persistence.py --record  # store the results for the current version in the history
+    python benchmarks/bench_persistence.py --check   # exit with status 1 if there are regressions
+
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from copy import deepcopy
+
+import dill
+
+from common import create_handlers, compare, environment, load_json, same_environment, save_json, quiet_logging, \
+    use_temp_user_dir
+from eazebot.auxiliary_methods import save_data, backup_data, load_data, convert_data
+
+# name: (users, trade sets per user, levels per trade set, history entries per user)
+SCENARIOS = {
+    'users1_sets10': (1, 10, 10, 100),
+    'users10_sets10': (10, 10, 10, 100),
+    'users1_sets100': (1, 100, 10, 1000),
+    'users1_sets10_levels200': (1, 10, 200, 100),
+}
+FULL_SCENARIOS = {
+    'users10_sets100': (10, 100, 10, 1000),
+    'users1_sets1000': (1, 1000, 10, 10000),
+    'users100_sets10': (100, 10, 10, 1000),
+}
+METRICS = ['deepcopy_time', 'save_time', 'backup_time', 'load_time', 'convert_load_time', 'deepcopy_memory_mb',
+           'file_size_mb']
+# absolute increases below which the metrics are considered noise
+NOISE_FLOOR = {'deepcopy_time': 0.005, 'save_time': 0.005, 'backup_time': 0.005, 'load_time': 0.005,
+               'convert_load_time': 0.005, 'deepcopy_memory_mb': 0.1, 'file_size_mb': 0.01}
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history_persistence.json')
+
+
+def create_user_data(n_users, n_trade_sets, n_levels, n_history, user_offset) -> dict:
+    rng = random.Random(0)
+    handlers = create_handlers(n_users, 1, n_trade_sets, n_levels, user_offset=user_offset, activate=False)
+    user_data = {}
+    for th in handlers:
+        for n in range(n_history):
+            gain = rng.gauss(0, 0.01)
+            th.tradeSetHistory.append({'time': time.time() - n * 3600, 'days': rng.random() * 30,
+                                       'symbol': 'ETH/BTC', 'gain': gain, 'gainRel': gain * 100, 'quote': 'BTC',
+                                       'gainBTC': gain, 'gainUSD': gain * 40000})
+        user_data[th.user] = {'chatId': th.user, 'trade': {th.exch_name: th},
+                              'settings': {'fiat': [], 'showProfitIn': None, 'taxWarn': True}, 'lastFct': []}
+    return user_data
+
+
+def timed(repeats, fct, *args, **kwargs):
+    # median time of repeated calls, the first call is a warm-up and not timed
+    result = fct(*args, **kwargs)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fct(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def convert_and_load(user_dir):
+    # load path of user data saved on another OS or by another installation, which is converted first
+    shutil.copyfile(os.path.join(user_dir, 'data.pickle'), os.path.join(user_dir, 'converted.pickle'))
+    convert_data(from_='win', to_='linux', filename=os.path.join(user_dir, 'converted.pickle'),
+                 filenameout=os.path.join(user_dir, 'converted.pickle'))
+    with open(os.path.join(user_dir, 'converted.pickle'), 'rb') as fh:
+        return dill.load(fh)
+
+
+def run_scenario(n_users, n_trade_sets, n_levels, n_history, user_offset, repeats) -> dict:
+    user_data = create_user_data(n_users, n_trade_sets, n_levels, n_history, user_offset)
+    user_dir = tempfile.mkdtemp(prefix='eazebot_bench_data_')
+    try:
+        deepcopy_time, _ = timed(repeats, deepcopy, user_data)
+        # memory is traced separately, as tracing slows down the execution
+        tracemalloc.start()
+        deepcopy(user_data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # the warm-up save makes sure that the renaming of the last save to the backup is included
+        save_time, _ = timed(repeats, save_data, user_data, user_dir)
+        backup_time, _ = timed(repeats, backup_data, user_data, user_dir)
+        load_time, loaded = timed(repeats, load_data, user_dir=user_dir, no_dialog=True)
+        convert_time, converted = timed(repeats, convert_and_load, user_dir)
+        file_size = os.path.getsize(os.path.join(user_dir, 'data.pickle'))
+        for data in [loaded, converted]:
+            assert sum([len(ud['trade'][exch].tradeSets) for ud in data.values() for exch in ud['trade']]) == \
+                n_users * n_trade_sets, 'Loaded user data does not contain all trade sets'
+    finally:
+        shutil.rmtree(user_dir, ignore_errors=True)
+    return {'trade_sets': n_users * n_trade_sets, 'levels': n_levels, 'history': n_users * n_history,
+            'deepcopy_time': deepcopy_time, 'save_time': save_time, 'backup_time': backup_time,
+            'load_time': load_time, 'convert_load_time': convert_time, 'deepcopy_memory_mb': peak / 1e6,
+            'file_size_mb': file_size / 1e6}
+
+
+def main(sysargv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the persistence of the user data of EazeBot.')
+    parser.add_argument('--full', action='store_true', help='also run the large scenarios')
+    parser.add_argument('--scenario', action='append', help='only run the given scenario(s)')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='number of timed repetitions of each operation, of which the median is reported')
+    parser.add_argument('--output', help='file the results are written to as json')
+    parser.add_argument('--history', default=HISTORY, help='history file with the results per version')
+    parser.add_argument('--record', action='store_true', help='store the results for this version in the history')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative increase counting as regression')
+    parser.add_argument('--check', action='store_true', help='exit with status 1 if there are regressions')
+    args = parser.parse_args(sysargv)
+
+    quiet_logging()
+    use_temp_user_dir()
+    scenarios = dict(SCENARIOS, **FULL_SCENARIOS) if args.full else dict(SCENARIOS)
+    if args.scenario:
+        scenarios = {name: params for name, params in dict(SCENARIOS, **FULL_SCENARIOS).items()
+                     if name in args.scenario}
+
+    results = {}
+    for n, (name, params) in enumerate(scenarios.items()):
+        results[name] = run_scenario(*params, user_offset=100000 + 1000 * n, repeats=args.repeats)
+        print(f"{name:25s} deepcopy {results[name]['deepcopy_time']:7.3f} s  save {results[name]['save_time']:7.3f} s  "
+              f"backup {results[name]['backup_time']:7.3f} s  load {results[name]['load_time']:7.3f} s  "
+              f"convert+load {results[name]['convert_load_time']:7.3f} s  "
+              f"{results[name]['deepcopy_memory_mb']:7.2f} MB peak  {results[name]['file_size_mb']:7.2f} MB file")
+    output = {'environment': environment(), 'results': results}
+    if args.output:
+        save_json(output, args.output)
+
+    # compare with the latest other version in the history that was measured in the same environment
+    history = load_json(args.history)
+    version = output['environment']['eazebot']
+    previous = [v for v in history if v != version and
+                same_environment(output['environment'], history[v].get('environment', {}))]
+    if not previous and any([v != version for v in history]):
+        print('The other versions in the history were measured in another environment, not comparing')
+    regressions = compare(results, history[previous[-1]]['results'], METRICS, args.tolerance, NOISE_FLOOR) \
+        if previous else []
+    for name, metric, old, new in regressions:
+        print(f"Regression to {previous[-1]} in {name}: {metric} {old:.3f} -> {new:.3f} ({new / old - 1:+.0%})")
+    if args.record:
+        history[version] = output
+        save_json(history, args.history)
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark of the update cycle (tradeHandler.update) against the paper exchange
+Developers only!
+
+Each scenario creates users with trade handlers on paper exchanges, fills them with trade sets whose buy orders are
+placed, and runs several update cycles after an untimed warm-up cycle. Reported per scenario are the medians over the
+cycles of the wall time, the exchange requests and the time spent waiting in lock_trade_set per cycle, as well as the
+peak memory allocated during one cycle and the memory held by the trade handlers, trade sets and exchanges of the
+scenario. As the wall time is dominated by the fixed sleep in lock_trade_set, the wall time without the lock wait (hot
+time) is compared as well, so that slowdowns of the update code itself are not hidden by the sleep. Results are only
+compared with a baseline measured on the same machine and python version, and increases below a noise floor are
+ignored.
+
+Usage:
+    python benchmarks/bench_update.py                  # run the default scenarios and compare with the baseline
+    python benchmarks/bench_update.py --full           # also run the large scenarios
+    python benchmarks/bench_update.py --save-baseline  # store the results as new baseline
+    python benchmarks/bench_update.py --check          # exit with status 1 if there are regressions
+
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+from common import create_handlers, compare, environment, load_json, median_results, same_environment, save_json, \
+    quiet_logging, use_temp_user_dir
+from eazebot.handling import BaseTradeSet
+
+# name: (users, exchanges per user, trade sets per user and exchange, levels per trade set)
+SCENARIOS = {
+    'sets1_levels10': (1, 1, 1, 10),
+    'sets10_levels10': (1, 1, 10, 10),
+    'sets100_levels10': (1, 1, 100, 10),
+    'sets10_levels1': (1, 1, 10, 1),
+    'sets10_levels200': (1, 1, 10, 200),
+    'users5_sets10': (5, 1, 10, 10),
+    'exchanges3_sets10': (1, 3, 10, 10),
+}
+FULL_SCENARIOS = {
+    'sets1000_levels10': (1, 1, 1000, 10),
+    'sets100_levels200': (1, 1, 100, 200),
+    'users20_sets10': (20, 1, 10, 10),
+    'users20_exchanges3_sets10': (20, 3, 10, 10),
+}
+METRICS = ['wall_time', 'hot_time', 'exchange_calls', 'lock_wait']
+# absolute increases per cycle below which timings are considered noise
+NOISE_FLOOR = {'wall_time': 0.02, 'hot_time': 0.005, 'lock_wait': 0.02}
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_update.json')
+
+
+class LockTimer:
+    # measures the time spent in BaseTradeSet.lock_trade_set while active
+    def __init__(self):
+        self.total = 0
+        self.original = BaseTradeSet.lock_trade_set
+
+    def __enter__(self):
+        timer = self
+
+        def timed_lock(ts):
+            start = time.perf_counter()
+            try:
+                return timer.original(ts)
+            finally:
+                timer.total += time.perf_counter() - start
+        BaseTradeSet.lock_trade_set = timed_lock
+        return self
+
+    def __exit__(self, *args):
+        BaseTradeSet.lock_trade_set = self.original
+
+
+def run_cycle(handlers):
+    for th in handlers:
+        th.exchange.step()
+        th.lastUpdate = 0
+        th.update()
+
+
+def run_scenario(n_users, n_exchanges, n_trade_sets, n_levels, cycles, user_offset) -> dict:
+    tracemalloc.start()
+    handlers = create_handlers(n_users, n_exchanges, n_trade_sets, n_levels, user_offset=user_offset)
+    state_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    exchanges = {id(th.exchange): th.exchange for th in handlers}.values()
+    # the first cycle is not timed, as it also fills the caches (e.g. fees and prices)
+    run_cycle(handlers)
+    runs = []
+    for _ in range(cycles):
+        calls_before = sum([exchange.request_count for exchange in exchanges])
+        with LockTimer() as lock_timer:
+            start = time.perf_counter()
+            run_cycle(handlers)
+            wall_time = time.perf_counter() - start
+        runs.append({'wall_time': wall_time, 'hot_time': wall_time - lock_timer.total,
+                     'exchange_calls': sum([exchange.request_count for exchange in exchanges]) - calls_before,
+                     'lock_wait': lock_timer.total})
+    # memory is traced in an extra cycle, as tracing slows down the execution
+    tracemalloc.start()
+    run_cycle(handlers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dict({'trade_sets': n_users * n_exchanges * n_trade_sets, 'levels': n_levels, 'cycles': cycles},
+                **median_results(runs), peak_memory_mb=peak / 1e6, state_memory_mb=state_memory / 1e6)
+
+
+def main(sysargv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the update cycle of EazeBot.')
+    parser.add_argument('--full', action='store_true', help='also run the large scenarios')
+    parser.add_argument('--scenario', action='append', help='only run the given scenario(s)')
+    parser.add_argument('--cycles', type=int, default=3,
+                        help='number of timed update cycles per scenario, of which the median is reported')
+    parser.add_argument('--output', help='file the results are written to as json')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file the results are compared with')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative increase counting as regression')
+    parser.add_argument('--check', action='store_true', help='exit with status 1 if there are regressions')
+    args = parser.parse_args(sysargv)
+
+    quiet_logging()
+    use_temp_user_dir()
+    scenarios = dict(SCENARIOS, **FULL_SCENARIOS) if args.full else dict(SCENARIOS)
+    if args.scenario:
+        scenarios = {name: params for name, params in dict(SCENARIOS, **FULL_SCENARIOS).items()
+                     if name in args.scenario}
+
+    results = {}
+    for n, (name, params) in enumerate(scenarios.items()):
+        results[name] = run_scenario(*params, cycles=args.cycles, user_offset=1000 * (n + 1))
+        print(f"{name:30s} {results[name]['wall_time']:8.3f} s/cycle  {results[name]['hot_time']:8.4f} s hot/cycle  "
+              f"{results[name]['exchange_calls']:7.1f} calls/cycle  {results[name]['lock_wait']:8.3f} s lock "
+              f"wait/cycle  {results[name]['peak_memory_mb']:7.2f} MB peak  {results[name]['state_memory_mb']:7.2f} MB "
+              f"state")
+    output = {'environment': environment(), 'results': results}
+    if args.output:
+        save_json(output, args.output)
+
+    baseline = load_json(args.baseline)
+    regressions = []
+    if baseline and not same_environment(output['environment'], baseline.get('environment', {})):
+        print(f"Baseline was measured in another environment ({baseline.get('environment')}), not comparing")
+    elif baseline:
+        regressions = compare(results, baseline['results'], METRICS, args.tolerance, NOISE_FLOOR)
+    for name, metric, old, new in regressions:
+        print(f"Regression in {name}: {metric} {old:.3f} -> {new:.3f} ({new / old - 1:+.0%})")
+    if args.save_baseline:
+        save_json(output, args.baseline)
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
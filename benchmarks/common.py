@@ -0,0 +1,160 @@
+"""
+Shared helpers of the benchmark scripts, creating trade handlers with synthetic trade sets on the paper exchange
+Developers only!
+
+"""
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+
+# make the benchmarks runnable from the repository without installing eazebot
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import eazebot  # noqa: E402
+from eazebot.handling import ExchContainer, ExchangeProfile  # noqa: E402
+from eazebot.paper_exchange import PaperExchange  # noqa: E402
+from eazebot.tradeHandler import tradeHandler  # noqa: E402
+
+SYMBOLS = {'ETH/BTC': 0.06, 'BNB/BTC': 0.008, 'BTC/USDT': 40000, 'ETH/USDT': 2400, 'BNB/USDT': 320}
+
+
+def quiet_logging():
+    logging.getLogger('eazebot').setLevel(logging.ERROR)
+
+
+def use_temp_user_dir():
+    # exchange profiles are written to a temporary folder instead of the user folder
+    ExchangeProfile.user_dir = tempfile.mkdtemp(prefix='eazebot_bench_')
+    return ExchangeProfile.user_dir
+
+
+def add_paper_exchange(user, exch_name: str, seed: int = 0, volatility: float = 0.001) -> PaperExchange:
+    """
+    Adds a deterministic paper exchange with an (almost) unlimited balance to the exchange container of a user
+
+    :param user: The user id
+    :param exch_name: Name under which the exchange is added
+    :param seed: Seed of the price paths
+    :param volatility: Volatility of the price paths per step
+    :return: The paper exchange
+    """
+    # prices only move when the benchmark steps them, not with the elapsed time
+    exchange = PaperExchange({'options': {
+        'seed': seed, 'volatility': volatility, 'tickInterval': 0,
+        'balance': {'BTC': 1e9, 'USDT': 1e12, 'ETH': 1e9, 'BNB': 1e9},
+        'markets': {symbol: {'price': price} for symbol, price in SYMBOLS.items()}}})
+    exchange.apiKey = 'paper'
+    exchange.secret = 'paper'
+    ExchContainer(user).exchanges[exch_name] = exchange
+    return exchange
+
+
+def add_trade_sets(th: tradeHandler, n_trade_sets: int, n_levels: int, activate: bool = True):
+    """
+    Adds trade sets with buy levels below and sell levels above the current price, so that they are not filled
+    immediately
+
+    :param th: The trade handler
+    :param n_trade_sets: Number of trade sets
+    :param n_levels: Number of buy and sell levels per trade set
+    :param activate: If the trade sets should be activated, i.e. their buy orders placed
+    """
+    symbols = list(SYMBOLS)
+    for n in range(n_trade_sets):
+        symbol = symbols[n % len(symbols)]
+        price = th.get_price_obj(symbol).get_current_price()
+        ts = th.init_trade_set(symbol)
+        ts.name = f'bench {n}'
+        amount = 100 / price if 'USDT' in symbol else 0.01 / price
+        for i_level in range(n_levels):
+            buy_price = float(th.exchange.priceToPrecision(symbol, price * (1 - 0.05 - 0.001 * i_level)))
+            sell_price = float(th.exchange.priceToPrecision(symbol, price * (1 + 0.05 + 0.001 * i_level)))
+            level_amount = float(th.exchange.amountToPrecision(symbol, amount))
+            ts.in_trades.append({'oid': None, 'price': buy_price, 'amount': level_amount,
+                                 'actualAmount': level_amount * 0.999, 'candleAbove': None, 'candleTimeframe': '1d'})
+            ts.out_trades.append({'oid': None, 'price': sell_price, 'amount': level_amount * 0.99})
+        if activate:
+            ts.activate(False)
+
+
+def create_handlers(n_users: int, n_exchanges: int, n_trade_sets: int, n_levels: int, user_offset: int = 0,
+                    config: dict = None, activate: bool = True):
+    """
+    Creates trade handlers of several users on several paper exchanges
+
+    :param n_users: Number of users
+    :param n_exchanges: Number of exchanges per user
+    :param n_trade_sets: Number of trade sets per user and exchange
+    :param n_levels: Number of buy and sell levels per trade set
+    :param user_offset: Offset of the user ids, so that different scenarios do not share users
+    :param config: Bot configuration applied to the trade handlers
+    :param activate: If the trade sets should be activated, i.e. their buy orders placed
+    :return: List of the trade handlers
+    """
+    config = config or {'updateInterval': 1}
+    handlers = []
+    for i_user in range(n_users):
+        user = user_offset + i_user
+        for i_exchange in range(n_exchanges):
+            exch_name = f'paper{i_exchange}'
+            add_paper_exchange(user, exch_name, seed=i_exchange)
+            th = tradeHandler(exch_name, user=user)
+            th.apply_config(config)
+            add_trade_sets(th, n_trade_sets, n_levels, activate)
+            handlers.append(th)
+    return handlers
+
+
+def environment() -> dict:
+    return {'eazebot': eazebot.__version__, 'python': platform.python_version(), 'platform': platform.platform(),
+            'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def same_environment(env: dict, baseline_env: dict) -> bool:
+    # results are only comparable on the same machine and python, the EazeBot version is what is compared
+    return all([env.get(key) == baseline_env.get(key) for key in env if key != 'eazebot'])
+
+
+def median_results(runs: list) -> dict:
+    # combines the results of repeated runs into the median of each value
+    return {key: statistics.median([run[key] for run in runs]) for key in runs[0]}
+
+
+def compare(results: dict, baseline: dict, metrics, tolerance: float, noise_floor: dict = None) -> list:
+    """
+    Compares benchmark results with a baseline
+
+    :param results: Dict of scenario name -> dict of metrics
+    :param baseline: Results of the baseline run in the same format
+    :param metrics: Names of the metrics that are compared (higher is worse)
+    :param tolerance: Relative increase above which a metric counts as regression
+    :param noise_floor: Dict of metric -> absolute increase below which a metric does not count as regression, so
+        that the noise of very short timings is not reported
+    :return: List of (scenario, metric, baseline value, new value) of all regressions
+    """
+    noise_floor = noise_floor or {}
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in metrics:
+            old, new = baseline[name].get(metric), result.get(metric)
+            if old and new is not None and new > old * (1 + tolerance) and new - old > noise_floor.get(metric, 0):
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def load_json(file: str) -> dict:
+    if not os.path.isfile(file):
+        return {}
+    with open(file, 'r') as fh:
+        return json.load(fh)
+
+
+def save_json(data: dict, file: str):
+    with open(file, 'w') as fh:
+        json.dump(data, fh, indent=2)
@@ -44,9 +44,11 @@ from telegram.ext import (Updater, CommandHandler, MessageHandler, Filters,
 from telegram.error import BadRequest
 
 from eazebot.tradeHandler import tradeHandler
-from eazebot.handling import ValueType, ExchContainer, DateFilter, TempTradeSet, BaseTradeSet, RegularBuy, OrderType
+from eazebot.handling import ValueType, ExchContainer, DateFilter, TempTradeSet, BaseTradeSet, RegularBuy, OrderType, \
+    ExchangeProfile, PriceHistoryStore
 from eazebot.auxiliary_methods import clean_data, load_data, save_data, backup_data, is_higher_version, ChangeLog, \
     MessageContainer
+from eazebot.monitoring import write_prometheus_file, api_feature, set_api_feature
 
 MAINMENU, SETTINGS, SYMBOL_OR_RAW, NUMBER, DAILY_CANDLE, INFO, DATE, TS_NAME = range(8)
 
@@ -59,9 +61,118 @@ class STATE(Enum):
     UPDATING = 3
 
 
+def setup_user_dir(config: Dict, user_dir: str):
+    # points the files kept per exchange (profiles, price history, traffic, paper exchange state) to the user folder
+    ExchangeProfile.user_dir = user_dir
+    ExchContainer.paper_dir = user_dir
+    if config.get('persistPriceHistory', False):
+        PriceHistoryStore.directory = os.path.join(user_dir, 'priceHistory')
+    if config.get('recordTraffic', False):
+        ExchContainer.traffic_dir = os.path.join(user_dir, 'traffic')
+
+
+def add_exchanges(config: Dict, user_dir: str, user_data: Dict):
+    """
+    Adds (or updates) the exchanges of a user from the APIs.json file of the user and creates their trade handlers
+
+    :param config: The bot configuration
+    :param user_dir: The user folder containing the APIs.json files
+    :param user_data: The data of the user, messages are only sent if it contains the message container
+    """
+    if 'msgs' in user_data:
+        user_data['msgs'].send(which='dialog',
+                                       text='Adding/Updating exchanges, please wait...',
+                                       parse_mode='markdown')
+    idx = [i for i, x in enumerate(config['telegramUserId']) if x == user_data['chatId']][0] + 1
+    if idx == 1:
+        api_file = os.path.join(user_dir, "APIs.json")
+    else:
+        api_file = os.path.join(user_dir, "APIs%d.json" % idx)
+    with open(api_file, "r") as fin:
+        apis = json.load(fin)
+
+    if isinstance(apis, dict):
+        # transform old style api json to new style
+        keys = list(apis.keys())
+        has_key = [re.search(r'(?<=^apiKey).*', val).group(0) for val in keys if
+                   re.search(r'(?<=^apiKey).*', val, re.IGNORECASE) is not None]
+        has_secret = [re.search(r'(?<=^apiSecret).*', val).group(0) for val in keys if
+                      re.search(r'(?<=^apiSecret).*', val, re.IGNORECASE) is not None]
+
+        apis_tmp = []
+        for a in set(has_key).intersection(set(has_secret)):
+            exch_params = {'exchange': a.lower(), 'key': apis['apiKey%s' % a], 'secret': apis['apiSecret%s' % a]}
+            if 'apiUid%s' % a in apis:
+                exch_params['uid'] = apis['apiUid%s' % a]
+            if 'apiPassword%s' % a in apis:
+                exch_params['password'] = apis['apiPassword%s' % a]
+            apis_tmp.append(exch_params)
+        apis = apis_tmp
+        with open(api_file, "w") as fin:
+            json.dump(apis, fin)
+
+    available_exchanges = {val['exchange']: val for val in apis
+                           if 'key' in val and 'secret' in val and 'exchange' in val}
+    has_password = [key for key in available_exchanges if 'password' in available_exchanges[key]]
+    has_uid = [key for key in available_exchanges if 'uid' in available_exchanges[key]]
+
+    has_key = list(available_exchanges.keys())
+    has_secret = list(available_exchanges.keys())
+
+    if len(available_exchanges) > 0:
+        exch_container = ExchContainer(user_data['chatId'])
+        logger.info('Found exchanges with keys %s, secrets %s, uids %s, password %s' % (
+            has_key, has_secret, has_uid, has_password))
+        authenticated_exchanges = []
+        for exch_name in available_exchanges:
+            exch_params = available_exchanges[exch_name]
+            exch_params.pop('exchange')
+            exch_container.add(exch_name, **exch_params)
+            # if no tradeHandler object has been created yet, create one, but also check for correct authentication
+            if exch_name not in user_data['trade']:
+                user_data['trade'][exch_name] = tradeHandler(exch_name,
+                                                             user=user_data['chatId'])
+            else:
+                # necessary for backward compatibility
+                user_data['trade'][exch_name].set_user(user_data['chatId'])
+            user_data['trade'][exch_name].apply_config(config)
+
+            if not user_data['trade'][exch_name].authenticated and \
+                    not user_data['trade'][exch_name].tradeSets:
+                logger.warning('Authentication failed for %s' % exch_name)
+                user_data['trade'].pop(exch_name)
+            else:
+                authenticated_exchanges.append(exch_name)
+        if 'msgs' in user_data:
+            user_data['msgs'].send(which='dialog',
+                                   text='Exchanges %s added/updated' % authenticated_exchanges,
+                                   parse_mode='markdown')
+    else:
+        if 'msgs' in user_data:
+            user_data['msgs'].send(which='dialog',
+                                   text='No exchange found to add',
+                                   parse_mode='markdown')
+
+    old_exchanges = set(user_data['trade'].keys()) - set(available_exchanges.keys())
+    removed_exchanges = []
+    for exch in old_exchanges:
+        if len(user_data['trade'][exch].tradeSets) == 0:
+            user_data['trade'].pop(exch)
+            removed_exchanges.append(exch)
+        else:
+            user_data['trade'][exch].set_user(user_data['chatId'])
+    if len(removed_exchanges) > 0:
+        if 'msgs' in user_data:
+            user_data['msgs'].send(which='dialog',
+                                   text='Old exchanges %s with no tradeSets removed' % removed_exchanges,
+                                   parse_mode='markdown')
+
+
+
 class EazeBot:
     def __init__(self, config: Dict, user_dir: str = 'user_data'):
         self.user_dir = user_dir
+        setup_user_dir(config, user_dir)
         self.__config__ = config
         self.temp_ts = {}
         with open(os.path.join(os.path.dirname(__file__), '__init__.py')) as fh:
@@ -170,7 +281,7 @@ class EazeBot:
         query.message.delete()
         if 'Yes' in query.data:
             query.answer(
-                'Please give the price above which the daily candle should close in order to initiate the buy!')
+                'Please give the price above which the candle should close in order to initiate the buy!')
             return NUMBER
         else:
             query.answer()
@@ -300,12 +411,14 @@ class EazeBot:
         return InlineKeyboardMarkup(
             [[InlineKeyboardButton("Clear Trade History", callback_data='resetTSH|%s|XXX' % exch)]])
 
+    @api_feature('status render')
     def print_trade_status(self, update: Union[Update, None], context: CallbackContext, only_this_ts=None):
         context.user_data['msgs'].delete_msgs(which='status', note=only_this_ts)
         for iex, ex in enumerate(context.user_data['trade']):
             ct = context.user_data['trade'][ex]
             if only_this_ts is not None and only_this_ts not in ct.tradeSets:
                 continue
+            ct.wake_up()
             count = 0
             for iTs in ct.tradeSets:
                 ts = ct.tradeSets[iTs]
@@ -356,44 +469,36 @@ class EazeBot:
                                            note=f'history_{ex}')
         return MAINMENU
 
+    @api_feature('balance check')
     def check_balance(self, update: Update, context: CallbackContext, exchange=None):
         if exchange:
             ct = context.user_data['trade'][exchange]
+            ct.wake_up(refresh=False)
             ct.update_balance()
-            if ct.exchange.has['fetchTickers']:
-                tickers = ct.safe_run(ct.exchange.fetchTickers)
-                func = lambda sym: tickers[sym] if sym in tickers else ct.safe_run(
-                    lambda: ct.exchange.fetchTicker(sym))  # includes a hot fix for some ccxt problems
-            else:
-                func = lambda sym: ct.safe_run(lambda: ct.exchange.fetchTicker(sym))
             coins = list(ct.balance['total'].keys())
+            # fetch all prices needed for the valuation at once
+            ct.fetch_tickers(ct.conversion.get_symbols(
+                [c for c in coins if ct.balance['total'][c] and ct.balance['total'][c] > 0], 'BTC'))
             string = '*Balance on %s (>%g BTC):*\n' % (exchange, self.__config__['minBalanceInBTC'])
             no_check_coins = []
             for c in coins:
-                btc_pair = '%s/BTC' % c
-                btc_pair2 = 'BTC/%s' % c
                 if ct.balance['total'][c] > 0:
-                    if c == 'BTC' and ct.balance['total'][c] > self.__config__['minBalanceInBTC']:
-                        string += '*%s:* %s _(free: %s)_\n' % (
-                            c, ct.nf.cost2Prec('ETH/BTC', ct.balance['total'][c]),
-                            ct.nf.cost2Prec('ETH/BTC', ct.balance['free'][c]))
-                    elif btc_pair2 in ct.exchange.symbols and ct.exchange.markets[btc_pair2]['active']:
-                        last_price = func(btc_pair2)['last']
-                        if last_price is not None and ct.balance['total'][c] / last_price > self.__config__[
-                            'minBalanceInBTC']:
-                            string += '*%s:* %s _(free: %s)_\n' % (c, ct.nf.cost2Prec(btc_pair2,
-                                                                                      ct.balance['total'][c]),
-                                                                   ct.nf.cost2Prec(btc_pair2, ct.balance['free'][c]))
-                    elif btc_pair in ct.exchange.symbols and ct.exchange.markets[btc_pair]['active']:
-                        last_price = func(btc_pair)['last']
-                        if last_price is not None and last_price * ct.balance['total'][c] > self.__config__[
-                            'minBalanceInBTC']:
-                            string += '*%s:* %s _(free: %s)_\n' % (c, ct.nf.amount2Prec(btc_pair,
-                                                                                        ct.balance['total'][c]),
-                                                                   ct.nf.amount2Prec(btc_pair, ct.balance['free'][c]))
-                    elif not (btc_pair2 in ct.exchange.symbols and ct.exchange.markets[btc_pair2]['active']) and not (
-                            btc_pair in ct.exchange.symbols and ct.exchange.markets[btc_pair]['active']):
-                        # handles cases where BTCpair and BTCpair2 do not exist or are not active
+                    if c == 'BTC':
+                        if ct.balance['total'][c] > self.__config__['minBalanceInBTC']:
+                            string += '*%s:* %s _(free: %s)_\n' % (
+                                c, ct.nf.cost2Prec('ETH/BTC', ct.balance['total'][c]),
+                                ct.nf.cost2Prec('ETH/BTC', ct.balance['free'][c]))
+                        continue
+                    value_btc, curr = ct.convert_amount(ct.balance['total'][c], c, 'BTC')
+                    if curr == 'BTC':
+                        if value_btc > self.__config__['minBalanceInBTC']:
+                            symbol, inverted = ct.conversion.get_path(c, 'BTC')[0]
+                            # the coin is the quote currency of inverted pairs, so it is formatted as cost
+                            fmt = ct.nf.cost2Prec if inverted else ct.nf.amount2Prec
+                            string += '*%s:* %s _(free: %s)_\n' % (c, fmt(symbol, ct.balance['total'][c]),
+                                                                   fmt(symbol, ct.balance['free'][c]))
+                    else:
+                        # handles cases where there is no (active) conversion path to BTC
                         if self.__config__['minBalanceInBTC'] == 0:
                             string += '*%s:* %0.4f _(free: %0.4f)_\n' % (
                                 c, ct.balance['total'][c], ct.balance['free'][c])
@@ -401,7 +506,7 @@ class EazeBot:
                             no_check_coins.append(c)
             if len(no_check_coins) > 0:
                 string += f"\nYou have some coins ({', '.join(no_check_coins)}) which do not have a (currently) " \
-                          f"active BTC trading pair, and could thus not be filtered.\n"
+                          f"active trading path to BTC, and could thus not be filtered.\n"
             try:
                 context.user_data['msgs'].send(which='balance',
                                                text=string,
@@ -433,14 +538,17 @@ class EazeBot:
                                            reply_markup=InlineKeyboardMarkup(buttons),
                                            parse_mode='markdown')
 
+    @api_feature('trade set dialog')
     def create_trade_set(self, update: Update, context: CallbackContext, exchange=None, symbol_or_raw=None):
         # check if user is registered and has any authenticated exchange
         if 'trade' in context.user_data and len(context.user_data['trade']) > 0:
             # check if exchange was already chosen
             if exchange:
                 ct = context.user_data['trade'][exchange]
+                ct.wake_up()
                 if symbol_or_raw is not None:
                     if re.match(r'^\w+/\w+\n.*QUANTITY', symbol_or_raw, re.DOTALL):
+                        set_api_feature('signal parsing')
                         current = 'quantity'
                         match = re.search(r'^QUANTITY (?P<quan>([0-9]*[.])?[0-9]+)$', symbol_or_raw, re.MULTILINE)
                         if match is not None:
@@ -471,13 +579,16 @@ class EazeBot:
 
                                         coin_currency = re.search(".*(?=/)", symbol).group(0)
                                         amount_per_buy = []
-                                        for price in entries:
-                                            amount = quantity / (len(entries) * price)
-                                            fee = ct.exchange.calculate_fee(symbol, 'limit', 'buy', amount, price,
-                                                                            'maker')
-                                            if fee['currency'] == coin_currency and not ct.is_paid_by_exchange_token(
-                                                    fee['cost'], coin_currency):
-                                                amount -= fee['cost']
+                                        amounts = [quantity / (len(entries) * price) for price in entries]
+                                        fee_costs, fee_currency = ct.fees.calculate(symbol, 'buy', amounts, entries,
+                                                                                    'maker')
+                                        if fee_currency == coin_currency:
+                                            paid_by_token = ct.fee_token.are_paid(fee_costs, coin_currency)
+                                        else:
+                                            paid_by_token = [True] * len(amounts)
+                                        for amount, fee_cost, is_paid in zip(amounts, fee_costs, paid_by_token):
+                                            if not is_paid:
+                                                amount -= fee_cost
                                             amount_per_buy.append(float(ct.exchange.amountToPrecision(
                                                 symbol, amount)))
 
@@ -577,6 +688,7 @@ class EazeBot:
 
     def ask_amount(self, user_data, exch, uid_ts, utid, direction, bot_or_query):
         ct = user_data['trade'][exch]
+        ct.wake_up()
         ts = ct.tradeSets[uid_ts]
         temp_ts = self.temp_ts[utid]
         coin = ts.coinCurrency
@@ -599,7 +711,7 @@ class EazeBot:
         elif direction == 'buy':
             # free balance is free currency minus cost for coins that will be bought
             if ct.get_balance(currency) is not None:
-                bal = ct.get_balance(currency) - ts.sum_buy_costs('notinitiated')
+                bal = ct.get_balance(currency, exclude=uid_ts) - ts.sum_buy_costs('notinitiated')
                 unsure = ' '
             else:
                 # estimate the amount of free coins... this is wrong if more than one trade uses this coin
@@ -656,13 +768,14 @@ class EazeBot:
 
     def add_init_balance(self, bot, user_data, exch, uid_ts, input_type=None, response=None, fct=None, utid=None):
         ct = user_data['trade'][exch]
+        ct.wake_up()
         if input_type is None:
             random.seed()
             utid = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(10))
             self.temp_ts[utid] = TempTradeSet()
             user_data['lastFct'].append(lambda res: self.add_init_balance(bot, user_data, exch, uid_ts, 'initCoins',
                                                                           res, fct, utid))
-            bal = ct.get_balance(ct.tradeSets[uid_ts].coinCurrency)
+            bal = ct.get_balance(ct.tradeSets[uid_ts].coinCurrency, exclude=uid_ts)
             user_data['msgs'].send(which='dialog',
                                    text="You already have %s that you want to add to the trade set? "
                                         "How much is it (found %s free %s on %s)?" % (
@@ -780,8 +893,8 @@ class EazeBot:
                 user_data['lastFct'].append(
                     lambda res: self.ask_pos(context, exch, uid_ts, direction, 'candleAbove', res, utid))
                 user_data['msgs'].send(which='dialog',
-                                       text='Do you want to make this a timed buy (buy only if daily candle closes '
-                                            'above X)',
+                                       text=f"Do you want to make this a timed buy (buy only if "
+                                            f"{self.__config__.get('candleTimeframe', '1d')} candle closes above X)",
                                        reply_markup=InlineKeyboardMarkup([[
                                            InlineKeyboardButton(
                                                "Yes",
@@ -883,92 +996,7 @@ class EazeBot:
         self.add_exchanges(context.user_data)
 
     def add_exchanges(self, user_data: Dict):
-        if 'msgs' in user_data:
-            user_data['msgs'].send(which='dialog',
-                                           text='Adding/Updating exchanges, please wait...',
-                                           parse_mode='markdown')
-        idx = [i for i, x in enumerate(self.__config__['telegramUserId']) if x == user_data['chatId']][0] + 1
-        if idx == 1:
-            api_file = os.path.join(self.user_dir, "APIs.json")
-        else:
-            api_file = os.path.join(self.user_dir, "APIs%d.json" % idx)
-        with open(api_file, "r") as fin:
-            apis = json.load(fin)
-
-        if isinstance(apis, dict):
-            # transform old style api json to new style
-            keys = list(apis.keys())
-            has_key = [re.search(r'(?<=^apiKey).*', val).group(0) for val in keys if
-                       re.search(r'(?<=^apiKey).*', val, re.IGNORECASE) is not None]
-            has_secret = [re.search(r'(?<=^apiSecret).*', val).group(0) for val in keys if
-                          re.search(r'(?<=^apiSecret).*', val, re.IGNORECASE) is not None]
-
-            apis_tmp = []
-            for a in set(has_key).intersection(set(has_secret)):
-                exch_params = {'exchange': a.lower(), 'key': apis['apiKey%s' % a], 'secret': apis['apiSecret%s' % a]}
-                if 'apiUid%s' % a in apis:
-                    exch_params['uid'] = apis['apiUid%s' % a]
-                if 'apiPassword%s' % a in apis:
-                    exch_params['password'] = apis['apiPassword%s' % a]
-                apis_tmp.append(exch_params)
-            apis = apis_tmp
-            with open(api_file, "w") as fin:
-                json.dump(apis, fin)
-
-        available_exchanges = {val['exchange']: val for val in apis
-                               if 'key' in val and 'secret' in val and 'exchange' in val}
-        has_password = [key for key in available_exchanges if 'password' in available_exchanges[key]]
-        has_uid = [key for key in available_exchanges if 'uid' in available_exchanges[key]]
-
-        has_key = list(available_exchanges.keys())
-        has_secret = list(available_exchanges.keys())
-
-        if len(available_exchanges) > 0:
-            exch_container = ExchContainer(user_data['chatId'])
-            logger.info('Found exchanges with keys %s, secrets %s, uids %s, password %s' % (
-                has_key, has_secret, has_uid, has_password))
-            authenticated_exchanges = []
-            for exch_name in available_exchanges:
-                exch_params = available_exchanges[exch_name]
-                exch_params.pop('exchange')
-                exch_container.add(exch_name, **exch_params)
-                # if no tradeHandler object has been created yet, create one, but also check for correct authentication
-                if exch_name not in user_data['trade']:
-                    user_data['trade'][exch_name] = tradeHandler(exch_name,
-                                                                 user=user_data['chatId'])
-                else:
-                    # necessary for backward compatibility
-                    user_data['trade'][exch_name].set_user(user_data['chatId'])
-
-                if not user_data['trade'][exch_name].authenticated and \
-                        not user_data['trade'][exch_name].tradeSets:
-                    logger.warning('Authentication failed for %s' % exch_name)
-                    user_data['trade'].pop(exch_name)
-                else:
-                    authenticated_exchanges.append(exch_name)
-            if 'msgs' in user_data:
-                user_data['msgs'].send(which='dialog',
-                                       text='Exchanges %s added/updated' % authenticated_exchanges,
-                                       parse_mode='markdown')
-        else:
-            if 'msgs' in user_data:
-                user_data['msgs'].send(which='dialog',
-                                       text='No exchange found to add',
-                                       parse_mode='markdown')
-
-        old_exchanges = set(user_data['trade'].keys()) - set(available_exchanges.keys())
-        removed_exchanges = []
-        for exch in old_exchanges:
-            if len(user_data['trade'][exch].tradeSets) == 0:
-                user_data['trade'].pop(exch)
-                removed_exchanges.append(exch)
-            else:
-                user_data['trade'][exch].set_user(user_data['chatId'])
-        if len(removed_exchanges) > 0:
-            if 'msgs' in user_data:
-                user_data['msgs'].send(which='dialog',
-                                       text='Old exchanges %s with no tradeSets removed' % removed_exchanges,
-                                       parse_mode='markdown')
+        add_exchanges(self.__config__, self.user_dir, user_data)
 
     def get_remote_version(self):
         try:
@@ -1011,6 +1039,8 @@ class EazeBot:
                       'changes:</b>\n' \
                       '%s\n\n' % (remote_version, 'and PyPi' if on_py_pi else '(not yet on PyPi)', version_message)
             buttons.append(InlineKeyboardButton("*Update bot*", callback_data='settings|updateBot'))
+        for ex, accounting in ExchContainer(context.user_data['chatId']).accounting.items():
+            string += f"\n<b>{ex}</b> {accounting.get_info()}"
         string += '\n<b>Reward my efforts on this bot by donating some cryptos!</b>'
         context.user_data['msgs'].send(which='botInfo',
                                        text=string,
@@ -1018,7 +1048,18 @@ class EazeBot:
                                        reply_markup=InlineKeyboardMarkup([buttons]))
         return MAINMENU
 
+    def stats_cmd(self, update: Update, context: CallbackContext):
+        if 'trade' not in context.user_data or 'msgs' not in context.user_data:
+            return
+        string = '<b>Durations of the trade set updates</b>\n'
+        for ex, ct in context.user_data['trade'].items():
+            string += ct.stats.get_info({i_ts: ts.name for i_ts, ts in ct.tradeSets.items()})
+        if len(context.user_data['trade']) == 0:
+            string += 'No exchange found'
+        context.user_data['msgs'].send(which='botInfo', text=string, parse_mode='html')
+
     # job functions
+    @api_feature('tax check')
     def check_for_updates_and_tax(self, context):
         self.updater = context.job.context
         remote_version, version_message, on_py_pi = self.get_remote_version()
@@ -1043,9 +1084,10 @@ class EazeBot:
                     for iex, ex in enumerate(self.updater.dispatcher.user_data[user]['trade']):
                         self.updater.dispatcher.user_data[user]['trade'][ex].update(special_check=2)
 
+    @api_feature('update cycle')
     def update_trade_sets(self, context):
         self.updater = context.job.context
-        logger.info('Updating trade sets...')
+        logger.debug('Updating trade sets...')
         for user in self.updater.dispatcher.user_data:
             if user in self.__config__['telegramUserId'] and 'trade' in self.updater.dispatcher.user_data[user]:
                 for iex, ex in enumerate(self.updater.dispatcher.user_data[user]['trade']):
@@ -1053,17 +1095,71 @@ class EazeBot:
                         self.updater.dispatcher.user_data[user]['trade'][ex].update()
                     except Exception as e:
                         logger.error(traceback.print_exc())
-        logger.info('Finished updating trade sets...')
+        logger.debug('Finished updating trade sets...')
+        for user in self.updater.dispatcher.user_data:
+            if user in self.__config__['telegramUserId']:
+                for ex, accounting in ExchContainer(user).accounting.items():
+                    logger.debug(f"API calls on {ex} since the last update: {accounting.cycle_summary()}")
+        if self.__config__['statsFile']:
+            self.write_stats_file()
 
+    def write_stats_file(self):
+        stats, labels = [], []
+        for user in self.updater.dispatcher.user_data:
+            if user in self.__config__['telegramUserId'] and 'trade' in self.updater.dispatcher.user_data[user]:
+                for ex, ct in self.updater.dispatcher.user_data[user]['trade'].items():
+                    stats.append(ct.stats)
+                    labels.append({'user': str(user)})
+        try:
+            write_prometheus_file(self.__config__['statsFile'], stats, labels)
+        except OSError as e:
+            logger.error(f"Could not write update statistics to {self.__config__['statsFile']}: {e}")
+
+    @api_feature('stop-loss watcher')
+    def watch_stop_losses(self, context):
+        self.updater = context.job.context
+        # trade handlers are grouped by exchange, so that the tickers of one exchange are only fetched once per run
+        handlers = {}
+        for user in self.updater.dispatcher.user_data:
+            if user in self.__config__['telegramUserId'] and 'trade' in self.updater.dispatcher.user_data[user]:
+                for ex, th in self.updater.dispatcher.user_data[user]['trade'].items():
+                    if not th.down:
+                        handlers.setdefault(ex, []).append(th)
+        for ex, ths in handlers.items():
+            try:  # make sure other exchanges are checked too, even if one has a problem
+                symbols = set().union(*[th.trigger_index.get_symbols(th.user, 'sl') for th in ths])
+                if len(symbols) == 0:
+                    continue
+                prices = ths[0].fetch_tickers(symbols)
+                for th in ths:
+                    th.check_stop_losses(prices)
+            except Exception as e:
+                logger.error('Stop-loss watcher failed on %s: %s' % (ex, e))
+
+    @api_feature('candle triggers')
+    def check_candle_triggers(self, context):
+        self.updater = context.job.context
+        for user in self.updater.dispatcher.user_data:
+            if user in self.__config__['telegramUserId'] and 'trade' in self.updater.dispatcher.user_data[user]:
+                for ex, th in self.updater.dispatcher.user_data[user]['trade'].items():
+                    try:  # make sure other exchanges are checked too, even if one has a problem
+                        th.check_candle_triggers()
+                    except Exception as e:
+                        logger.error('Checking candle triggers failed on %s: %s' % (ex, e))
+
+    @api_feature('balance update')
     def update_balance(self, context):
         self.updater = context.job.context
         logger.info('Updating balances...')
         for user in self.updater.dispatcher.user_data:
             if user in self.__config__['telegramUserId'] and 'trade' in self.updater.dispatcher.user_data[user]:
                 for iex, ex in enumerate(self.updater.dispatcher.user_data[user]['trade']):
+                    if self.updater.dispatcher.user_data[user]['trade'][ex].is_dormant():
+                        continue
                     self.updater.dispatcher.user_data[user]['trade'][ex].update_balance()
         logger.info('Finished updating balances...')
 
+    @api_feature('candle check')
     def check_candle(self, context, which=1):
         self.updater = context.job.context
         logger.info('Checking candles for all trade sets...')
@@ -1129,6 +1225,7 @@ class EazeBot:
                                                                   callback_data='settings|cancel')]]))
         return MAINMENU
 
+    @api_feature('dialog')
     def inline_button_callback(self, update: Update, context: CallbackContext, query=None, response=None):
         if query is None:
             query = update.callback_query
@@ -1252,6 +1349,7 @@ class EazeBot:
                         uid_ts)  # it is no uidTS but the chosen symbol..i was too lazy to use new variable ;-)
 
                 elif command == '1':  # donations
+                    set_api_feature('donation')
                     if len(args) > 0:
                         if exch == 'xxx':
                             # get all exchange names that list the chosen coin and ask user from where to withdraw
@@ -1655,6 +1753,7 @@ class EazeBot:
         # %% start telegram API, add handlers to dispatcher and start bot
         self.updater.dispatcher.add_handler(conv_handler)
         self.updater.dispatcher.add_handler(CommandHandler('exit', self.ask_stop_bot_message))
+        self.updater.dispatcher.add_handler(CommandHandler('stats', self.stats_cmd))
         self.updater.dispatcher.add_handler(unknown_handler)
         self.updater.dispatcher.user_data = clean_data(load_data(no_dialog=True), self.__config__['telegramUserId'])
 
@@ -1667,9 +1766,19 @@ class EazeBot:
                 self.add_exchanges(self.updater.dispatcher.user_data[user])
 
         # start a job updating the trade sets each interval
-        self.updater.job_queue.run_repeating(self.update_trade_sets, interval=60 * self.__config__['updateInterval'],
+        # (with adaptive scheduling, the job runs at the minimum interval and only checks the trade sets that are due)
+        self.updater.job_queue.run_repeating(self.update_trade_sets,
+                                             interval=self.__config__['minUpdateInterval'] or
+                                             60 * self.__config__['updateInterval'],
                                              first=5,
                                              context=self.updater)
+        # start a job watching the price based stop-losses in short intervals
+        if self.__config__['slWatchInterval'] > 0:
+            self.updater.job_queue.run_repeating(self.watch_stop_losses, interval=self.__config__['slWatchInterval'],
+                                                 first=30,
+                                                 context=self.updater)
+        # start a job checking the candle-above buy levels whenever a candle closed
+        self.updater.job_queue.run_repeating(self.check_candle_triggers, interval=60, first=40, context=self.updater)
         # start a job checking for updates once a day
         self.updater.job_queue.run_repeating(self.check_for_updates_and_tax, interval=60 * 60 * 24, first=20,
                                              context=self.updater)
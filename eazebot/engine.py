@@ -0,0 +1,209 @@
+"""Headless engine, running the trade set surveillance of EazeBot without Telegram"""
+import datetime
+import logging
+import threading
+import time
+import traceback
+from typing import Dict, List
+
+from eazebot.auxiliary_methods import clean_data, load_data, save_data, backup_data
+from eazebot.bot import add_exchanges, setup_user_dir
+from eazebot.handling import BaseTradeSet
+from eazebot.monitoring import api_feature
+from eazebot.tradeHandler import tradeHandler
+
+logger = logging.getLogger(__name__)
+
+
+class Engine:
+    """
+    Loads the user data and exchanges like the Telegram bot and runs the same update jobs, but is controlled by its
+    Python methods instead of Telegram messages. The users are given by the telegramUserId setting, as it is the key of
+    their data in the data.pickle file.
+    """
+    # seconds after the start until the jobs run the first time
+    start_delay = 5
+
+    def __init__(self, config: Dict, user_dir: str = 'user_data'):
+        setup_user_dir(config, user_dir)
+        self.user_dir = user_dir
+        self.__config__ = config
+        self.user_data = {}
+        self._stop = threading.Event()
+
+    @property
+    def users(self) -> List:
+        return self.__config__['telegramUserId']
+
+    def load(self):
+        # loads the saved user data and adds the exchanges of all users
+        self.user_data = clean_data(load_data(user_dir=self.user_dir, no_dialog=True), self.users)
+        for user in self.users:
+            user_data = self.user_data.setdefault(user, {})
+            if 'trade' not in user_data:
+                user_data.update({'chatId': user, 'trade': {},
+                                  'settings': {'fiat': [], 'showProfitIn': None, 'taxWarn': True}, 'lastFct': []})
+            user_data['chatId'] = user
+            # exchanges are added from the APIs.json files exactly as by the bot (no messages are sent without Telegram)
+            add_exchanges(self.__config__, self.user_dir, user_data)
+
+    def save(self):
+        save_data(self.user_data, user_dir=self.user_dir)
+
+    def backup(self):
+        backup_data(self.user_data, user_dir=self.user_dir, max_count=self.__config__.get('maxBackupFileCount', 12))
+
+    # trade set operations
+
+    def get_trade_handler(self, exchange: str, user=None) -> tradeHandler:
+        """
+        Returns the trade handler of an exchange
+
+        :param exchange: Name of the exchange as in the APIs.json file
+        :param user: The user (default: the first user)
+        :return: The tradeHandler
+        """
+        user = self.users[0] if user is None else user
+        if exchange not in self.user_data.get(user, {}).get('trade', {}):
+            raise ValueError(f"Exchange {exchange} has not been added for user {user}")
+        th = self.user_data[user]['trade'][exchange]
+        th.wake_up()
+        return th
+
+    def get_trade_sets(self, exchange: str, user=None) -> Dict[str, BaseTradeSet]:
+        return self.get_trade_handler(exchange, user).tradeSets
+
+    def get_trade_set_info(self, exchange: str, i_ts: str, user=None) -> str:
+        user = self.users[0] if user is None else user
+        return self.get_trade_handler(exchange, user).get_trade_set_info(
+            i_ts, self.user_data[user]['settings']['showProfitIn'])
+
+    def new_trade_set(self, exchange: str, symbol: str, user=None, **kwargs) -> BaseTradeSet:
+        """
+        Creates and activates a new trade set
+
+        :param exchange: Name of the exchange
+        :param symbol: The trading pair, e.g. ETH/BTC
+        :param user: The user (default: the first user)
+        :param kwargs: Levels, amounts and stop-loss as accepted by tradeHandler.new_trade_set
+        :return: The trade set
+        """
+        return self.get_trade_handler(exchange, user).new_trade_set(symbol, **kwargs)
+
+    def activate_trade_set(self, exchange: str, i_ts: str, user=None) -> bool:
+        return self.get_trade_sets(exchange, user)[i_ts].activate()
+
+    def deactivate_trade_set(self, exchange: str, i_ts: str, cancel_orders: int = 1, user=None):
+        return self.get_trade_sets(exchange, user)[i_ts].deactivate(cancel_orders)
+
+    def delete_trade_set(self, exchange: str, i_ts: str, sell_all: bool = False, user=None) -> bool:
+        return self.get_trade_handler(exchange, user).delete_trade_set(i_ts, sell_all=sell_all)
+
+    def sell_all_now(self, exchange: str, i_ts: str, user=None) -> bool:
+        """
+        Cancels all orders of the trade set, sells its coins at market price and deletes it
+
+        :return: True if the coins were sold and the trade set deleted, False if the sell order is still open (the trade
+            set stays active and is updated until it is filled)
+        """
+        return self.delete_trade_set(exchange, i_ts, sell_all=True, user=user)
+
+    # update jobs
+
+    def trade_handlers(self) -> List[tradeHandler]:
+        return [th for user in self.users for th in self.user_data.get(user, {}).get('trade', {}).values()]
+
+    @api_feature('update cycle')
+    def update(self, special_check: int = 0):
+        self._update(special_check)
+
+    @api_feature('candle check')
+    def check_candle(self):
+        # daily check of the close stop-losses and candle-above levels
+        self._update(special_check=1)
+
+    def _update(self, special_check: int):
+        for th in self.trade_handlers():
+            try:  # make sure other exchanges are checked too, even if one has a problem
+                th.update(special_check=special_check)
+            except Exception:
+                logger.error(traceback.format_exc())
+
+    @api_feature('tax check')
+    def check_tax(self):
+        # warns if filled buy levels approach the 1 year holding period
+        for user in self.users:
+            if self.user_data[user]['settings']['taxWarn']:
+                for th in self.user_data[user]['trade'].values():
+                    try:
+                        th.update(special_check=2)
+                    except Exception:
+                        logger.error(traceback.format_exc())
+
+    @api_feature('stop-loss watcher')
+    def watch_stop_losses(self):
+        for th in self.trade_handlers():
+            if th.down:
+                continue
+            try:
+                th.check_stop_losses()
+            except Exception as e:
+                logger.error('Stop-loss watcher failed on %s: %s' % (th.exch_name, e))
+
+    @api_feature('candle triggers')
+    def check_candle_triggers(self):
+        for th in self.trade_handlers():
+            try:
+                th.check_candle_triggers()
+            except Exception as e:
+                logger.error('Checking candle triggers failed on %s: %s' % (th.exch_name, e))
+
+    def stop(self):
+        self._stop.set()
+
+    @staticmethod
+    def _run_due(jobs: List, next_runs: List):
+        for n, (interval, job) in enumerate(jobs):
+            if time.time() >= next_runs[n]:
+                next_runs[n] = time.time() + interval
+                job()
+
+    def _watch(self, jobs: List):
+        # runs the stop-loss watcher and candle triggers, so that they are not delayed by a slow update cycle
+        next_runs = [time.time() + self.start_delay] * len(jobs)
+        while not self._stop.is_set():
+            self._run_due(jobs, next_runs)
+            self._stop.wait(1)
+
+    def run(self):
+        """
+        Runs the update jobs until stop() is called. The stop-loss watcher and the candle triggers run in their own
+        thread like the concurrent jobs of the bot. The user data is saved every 5 minutes and when stopped.
+        """
+        config = self.__config__
+        jobs = [[config.get('minUpdateInterval', 0) or 60 * config['updateInterval'], self.update],
+                [5 * 60, self.save],
+                [60 * 60 * 24 * config.get('extraBackupInterval', 7), self.backup]]
+        watch_jobs = [[60, self.check_candle_triggers]]
+        if config.get('slWatchInterval', 10) > 0:
+            watch_jobs.append([config.get('slWatchInterval', 10), self.watch_stop_losses])
+        next_runs = [time.time() + self.start_delay] * len(jobs)
+        day = datetime.datetime.utcnow().date()
+        self._stop.clear()
+        watcher = threading.Thread(target=self._watch, args=(watch_jobs,), name='engine-watcher', daemon=True)
+        watcher.start()
+        logger.info('Headless engine started')
+        try:
+            while not self._stop.is_set():
+                self._run_due(jobs, next_runs)
+                if datetime.datetime.utcnow().date() != day:
+                    # daily candle check and 1 year buy period warning
+                    day = datetime.datetime.utcnow().date()
+                    self.check_candle()
+                    self.check_tax()
+                self._stop.wait(1)
+        finally:
+            self._stop.set()
+            watcher.join()
+            self.save()
+            logger.info('Headless engine stopped')
@@ -1,12 +1,18 @@
 import datetime
+import json
+import os
 import random
+from bisect import bisect_left, bisect_right
 
 import ccxt
+from ccxt.base.decimal_to_precision import SIGNIFICANT_DIGITS, TICK_SIZE
 from dateparser import parse as dateparse
-from ccxt import InsufficientFunds, OrderNotFound, ExchangeError
+from ccxt import InsufficientFunds, OrderNotFound, ExchangeError, NetworkError
 import numpy as np
 import re
+import requests
 import string
+import threading
 import time
 from enum import Flag, auto
 from typing import Union, Dict, Optional
@@ -16,14 +22,44 @@ from typing import TYPE_CHECKING
 from telegram import Update
 from telegram.ext.filters import MessageFilter
 
+from eazebot.monitoring import ApiAccounting
+
 if TYPE_CHECKING:
     from .tradeHandler import tradeHandler
 
 logger = logging.getLogger(__name__)
 
+# exchange-specific order type and stop price parameter of native stop-limit orders for exchanges where ccxt offers no
+# unified method for creating them
+NATIVE_STOP_ORDERS = {'binance': ('STOP_LOSS_LIMIT', 'stopPrice')}
+# limit price of native stop-limit sell orders relative to the stop price
+NATIVE_STOP_LIMIT_RATIO = 0.99
+
+
+def serialize_requests(exchange: ccxt.Exchange):
+    """
+    Sends the requests of a ccxt exchange one after another. The rate limiter and the nonce of ccxt are not thread-safe,
+    but the exchange instance of a user is shared by concurrent jobs, sells and order placements. Only the requests are
+    serialized, so that e.g. the waits of concurrent sells for their orders to fill still overlap.
+
+    :param exchange: The exchange, whose fetch2 is wrapped
+    """
+    lock = threading.Lock()
+    fetch2 = exchange.fetch2
+
+    def serialized_fetch2(path, api='public', method='GET', params={}, headers=None, body=None):
+        # fetch2 waits for the rate limiter, signs the request with a new nonce and sends it
+        with lock:
+            return fetch2(path, api, method, params, headers, body)
+    exchange.fetch2 = serialized_fetch2
+
 
 class ExchContainer:
     _saved_instances = {}
+    # if set, the traffic of all exchanges is recorded to this folder (see eazebot/traffic.py)
+    traffic_dir = None
+    # if set, the state of the paper exchanges is saved to this folder
+    paper_dir = None
 
     def __new__(cls, user=None):
         if not user in cls._saved_instances:
@@ -33,12 +69,47 @@ class ExchContainer:
     def __init__(self, user=None):
         if not hasattr(self, 'exchanges'):
             self.exchanges = {}
+            # API call accounting per exchange name
+            self.accounting = {}
+            self.traffic = {}
+            self.user = user
             self.logger_extras = {'chatId': user}
 
-    def add(self, exch_name, key, secret=None, password=None, uid=None):
-        self.exchanges[exch_name] = getattr(ccxt, exch_name)({'enableRateLimit': True, 'options': {
-                'adjustForTimeDifference': True}})  # 'nonce': ccxt.Exchange.milliseconds,
+    def add(self, exch_name, key, secret=None, password=None, uid=None, options=None, traffic=None):
+        """
+        Creates the ccxt exchange object of an exchange
+
+        :param exch_name: Name of the exchange (ccxt id or 'paper')
+        :param key: API key
+        :param secret: API secret
+        :param password: API password (only needed on some exchanges)
+        :param uid: API uid (only needed on some exchanges)
+        :param options: Options of the ccxt exchange
+        :param traffic: Tuple of (file, 'record' or 'replay') to record or replay the traffic of the exchange. If not
+            given, the traffic is recorded if traffic_dir is set.
+        """
+        previous = self.traffic.pop(exch_name, None)
+        if hasattr(previous, 'close'):
+            # the recorder of the replaced exchange object would keep the traffic file open
+            previous.close()
+        if exch_name == 'paper':
+            # simulated exchange for paper trading
+            from eazebot.paper_exchange import PaperExchange
+            options = dict(options or {})
+            if self.paper_dir and 'stateFile' not in options:
+                options['stateFile'] = os.path.join(self.paper_dir, f"paper_{self.user}.json")
+            self.exchanges[exch_name] = PaperExchange({'options': options})
+        else:
+            self.exchanges[exch_name] = getattr(ccxt, exch_name)({'enableRateLimit': True, 'options': {
+                    'adjustForTimeDifference': True, **(options or {})}})  # 'nonce': ccxt.Exchange.milliseconds,
         exchange = self.exchanges[exch_name]
+        if traffic is None and self.traffic_dir:
+            traffic = (os.path.join(self.traffic_dir, f"{self.user}_{exch_name}.jsonl.gz"), 'record')
+        if traffic is not None:
+            from eazebot.traffic import install
+            self.traffic[exch_name] = install(exchange, *traffic)
+        self.accounting[exch_name] = ApiAccounting(exchange)
+        serialize_requests(exchange)
         if key:
             exchange.apiKey = key
         if secret:
@@ -55,6 +126,129 @@ class ExchContainer:
             raise ValueError(f"Exchange {exch_name} has not been initialized yet. Missing api credentials?")
 
 
+class ExchangeProfile:
+    """
+    Learned call variants and cached capabilities of an exchange class. The profiles are saved in the user folder, so
+    that calls directly use the variant that works for the exchange.
+    """
+    _saved_instances = {}
+    _lock = threading.Lock()
+    _options_lock = threading.Lock()
+    user_dir = 'user_data'
+    file_name = 'exchangeProfiles.json'
+
+    def __new__(cls, exch_id: str):
+        if exch_id not in cls._saved_instances:
+            cls._saved_instances[exch_id] = super().__new__(cls)
+        return cls._saved_instances[exch_id]
+
+    def __init__(self, exch_id: str):
+        if not hasattr(self, 'exch_id'):
+            self.exch_id = exch_id
+            self.variants = {}
+            self.supported = {}
+            profile = self.load_all().get(exch_id, {})
+            # learned variants are only valid for the ccxt version they were learned with
+            if profile.get('ccxt') == ccxt.__version__:
+                self.variants = profile.get('variants', {})
+                self.supported = profile.get('supported', {})
+
+    @classmethod
+    def load_all(cls) -> Dict:
+        path = os.path.join(cls.user_dir, cls.file_name)
+        if not os.path.isfile(path):
+            return {}
+        try:
+            with open(path, 'r') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        with self._lock:
+            profiles = self.load_all()
+            profiles[self.exch_id] = {'ccxt': ccxt.__version__, 'variants': self.variants,
+                                      'supported': self.supported}
+            try:
+                with open(os.path.join(self.user_dir, self.file_name), 'w') as fh:
+                    json.dump(profiles, fh, indent=2)
+            except OSError as e:
+                logger.warning(f"Could not save exchange profiles: {e}")
+
+    def set_variant(self, method: str, variant: str):
+        if self.variants.get(method) != variant:
+            self.variants[method] = variant
+            self.save()
+
+    def call(self, method: str, func, typed_params: Dict):
+        """
+        Calls an exchange method in the variant known to work, i.e. plain or with the order type as parameter. If this
+        fails, the other variant is tried and learned if it works, as exchanges might need the order type only for some
+        orders.
+
+        :param method: Name of the exchange method
+        :param func: Function calling the exchange method with the params dictionary given as argument
+        :param typed_params: Params of the variant that needs the order type
+        :return: Return value of the exchange method
+        """
+        variant = self.variants.get(method, 'plain')
+        other = 'plain' if variant == 'type' else 'type'
+        params = {'plain': {}, 'type': typed_params}
+        try:
+            result = func(params[variant])
+        except OrderNotFound as e:
+            raise e
+        except ExchangeError as e:
+            try:
+                result = func(params[other])
+            except ExchangeError:
+                # the error of the known variant is more meaningful
+                raise e
+            self.set_variant(method, other)
+            return result
+        self.set_variant(method, variant)
+        return result
+
+    def supports(self, exchange: ccxt.Exchange, features: list) -> bool:
+        # checks (and remembers) if the exchange supports all features
+        key = ','.join(features)
+        if key not in self.supported:
+            self.supported[key] = all([exchange.has[x] for x in features])
+            self.save()
+        return self.supported[key]
+
+    @classmethod
+    def create_market_buy_order(cls, exchange: ccxt.Exchange, symbol: str, amount: float, price: float,
+                                cost: float = None, params: Dict = None) -> Dict:
+        """
+        Places a market buy order. Exchanges that expect the cost instead of the amount get the cost if it is given
+        (e.g. for buys of a fixed amount of the quote currency), otherwise ccxt calculates it from amount and price.
+
+        :param exchange: The ccxt exchange instance
+        :param symbol: The market symbol
+        :param amount: Amount to buy
+        :param price: Current price, used by ccxt to calculate the cost from the amount
+        :param cost: Optional cost to spend instead of buying the amount
+        :param params: Extra parameters of the order
+        :return: The order response
+        """
+        params = params or {}
+        if 'createMarketBuyOrderRequiresPrice' not in exchange.options:
+            # the exchange assumes the amount as input
+            return exchange.createMarketBuyOrder(symbol, amount, params=params)
+        # the exchange assumes the cost as input, the option is only changed for this order and the instance is shared
+        # by all threads of the user
+        with cls._options_lock:
+            old_val = exchange.options['createMarketBuyOrderRequiresPrice']
+            exchange.options['createMarketBuyOrderRequiresPrice'] = cost is None
+            try:
+                if cost is None:
+                    return exchange.createOrder(symbol, 'market', 'buy', amount, price, params=params)
+                return exchange.createMarketBuyOrder(symbol, cost, params=params)
+            finally:
+                exchange.options['createMarketBuyOrderRequiresPrice'] = old_val
+
+
 class TempTradeSet:
     def __init__(self):
         self.amount = None
@@ -124,9 +318,110 @@ class OrderType(Flag):
     LIMIT = auto()
 
 
+class MarketTable:
+    """
+    Precision steps and limits of all markets of an exchange, compiled into arrays whenever the markets are (re)loaded,
+    so that whole level arrays can be rounded and validated at once.
+    """
+    limit_types = ('amount', 'price', 'cost')
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.markets = None
+        self.index = {}
+        # precision of amount and price, interpreted according to the precision mode of the exchange
+        self.precision = np.empty((0, 2))
+        # min and max of amount, price and cost, missing limits are -inf/inf
+        self.limits = np.empty((0, 3, 2))
+        self.has_limits = np.empty((0, 3), dtype=bool)
+
+    def refresh(self) -> bool:
+        # recompiles the table if the exchange markets have been reloaded since the last compilation
+        if self.exchange.markets is self.markets:
+            return False
+        markets = self.exchange.markets or {}
+        self.index = {symbol: n for n, symbol in enumerate(markets)}
+        self.precision = np.full((len(markets), 2), np.nan)
+        self.limits = np.tile(np.array([-np.inf, np.inf]), (len(markets), 3, 1))
+        self.has_limits = np.zeros((len(markets), 3), dtype=bool)
+        for symbol, n in self.index.items():
+            precision = markets[symbol].get('precision') or {}
+            limits = markets[symbol].get('limits') or {}
+            for i_what, what in enumerate(('amount', 'price')):
+                if precision.get(what) is not None:
+                    self.precision[n, i_what] = precision[what]
+            for i_typ, typ in enumerate(self.limit_types):
+                if typ in limits:
+                    self.has_limits[n, i_typ] = True
+                    if limits[typ].get('min') is not None:
+                        self.limits[n, i_typ, 0] = limits[typ]['min']
+                    # a max of 0 means there is no upper limit
+                    if limits[typ].get('max'):
+                        self.limits[n, i_typ, 1] = limits[typ]['max']
+        self.markets = self.exchange.markets
+        return True
+
+    def has_limit(self, symbol: str, typ: str) -> bool:
+        self.refresh()
+        return bool(self.has_limits[self.index[symbol], self.limit_types.index(typ)])
+
+    def check(self, symbol: str, typ: str, values) -> np.ndarray:
+        """
+        Checks if quantities are within the limits of the market
+
+        :param symbol: The market symbol
+        :param typ: 'amount', 'price' or 'cost'
+        :param values: Single quantity or array of quantities
+        :return: Boolean array, True where the quantity is accepted by the exchange
+        """
+        self.refresh()
+        low, high = self.limits[self.index[symbol], self.limit_types.index(typ)]
+        values = np.asarray(values, dtype=float)
+        return (values >= low) & (values <= high)
+
+    def check_levels(self, symbol: str, amounts, prices) -> np.ndarray:
+        # checks amount, price and cost of all levels at once
+        amounts = np.asarray(amounts, dtype=float)
+        prices = np.asarray(prices, dtype=float)
+        return self.check(symbol, 'amount', amounts) & self.check(symbol, 'price', prices) & \
+            self.check(symbol, 'cost', amounts * prices)
+
+    def round(self, symbol: str, values, what: str) -> np.ndarray:
+        """
+        Rounds quantities the way the exchange does, i.e. amounts and costs are truncated and prices are rounded
+
+        :param symbol: The market symbol
+        :param values: Single quantity or array of quantities
+        :param what: 'amount', 'price' or 'cost'
+        :return: Array of rounded quantities
+        """
+        self.refresh()
+        values = np.asarray(values, dtype=float)
+        precision = self.precision[self.index[symbol], 0 if what == 'amount' else 1]
+        if np.isnan(precision):
+            return values
+        if self.exchange.precisionMode == TICK_SIZE:
+            step = precision
+        elif self.exchange.precisionMode == SIGNIFICANT_DIGITS:
+            with np.errstate(divide='ignore'):
+                magnitude = np.floor(np.log10(np.abs(np.where(values == 0, 1, values))))
+            step = 10 ** (magnitude - precision + 1)
+        else:
+            step = 10 ** -precision
+        # the small offset prevents floating point errors from truncating values that are already on the grid
+        if what == 'price':
+            return np.round(values / step) * step
+        else:
+            return np.trunc(values / step + 1e-9 * np.sign(values)) * step
+
+
 class NumberFormatter:
+    max_cached = 4096
+
     def __init__(self, exchange):
         self.exchange = exchange
+        self.table = MarketTable(exchange)
+        self.cache = {}
         self.amount2Prec = lambda a, b: self.x_to_prec(a, b, 'amount')
         self.price2Prec = lambda a, b: self.x_to_prec(a, b, 'price')
         self.cost2Prec = lambda a, b: self.x_to_prec(a, b, 'cost')
@@ -135,6 +430,15 @@ class NumberFormatter:
     def x_to_prec(self, pair, x, what):
         if x is None:
             return 'N/A'
+        # formatted values are remembered until the markets are reloaded, as the same values are rendered repeatedly
+        if self.table.refresh() or len(self.cache) > self.max_cached:
+            self.cache = {}
+        key = (pair, x, what)
+        if key not in self.cache:
+            self.cache[key] = self._x_to_prec(pair, x, what)
+        return self.cache[key]
+
+    def _x_to_prec(self, pair, x, what):
         if what == 'amount':
             fct = self.exchange.amountToPrecision
         elif what == 'cost':
@@ -160,6 +464,277 @@ class NumberFormatter:
             return stri
 
 
+class ConversionGraph:
+    """
+    Graph of the currencies of an exchange with the active markets as edges. Conversion paths between currencies are
+    searched through liquid hub currencies and remembered until the markets are reloaded.
+    """
+    hubs = ('BTC', 'USDT', 'ETH', 'BNB', 'BUSD', 'USDC', 'USD', 'EUR')
+    max_hops = 3
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.markets = None
+        # currency -> {neighbour currency: (symbol, inverted)}
+        self.edges = {}
+        self.paths = {}
+
+    def refresh(self):
+        # rebuilds the graph if the exchange markets have been reloaded
+        if self.exchange.markets is self.markets:
+            return
+        self.edges = {}
+        for symbol, market in (self.exchange.markets or {}).items():
+            if not market.get('active', True) or market.get('base') is None or market.get('quote') is None:
+                continue
+            self.edges.setdefault(market['base'], {})[market['quote']] = (symbol, False)
+            self.edges.setdefault(market['quote'], {})[market['base']] = (symbol, True)
+        self.paths = {}
+        self.markets = self.exchange.markets
+
+    def get_path(self, currency: str, target_currency: str) -> Optional[list]:
+        """
+        Gets the shortest conversion path between two currencies, only using hub currencies as intermediate steps
+
+        :param currency: Currency to convert from
+        :param target_currency: Currency to convert to
+        :return: List of (symbol, inverted) tuples or None if there is no path. Inverted means that the amount has to
+        be divided by the price of the symbol.
+        """
+        self.refresh()
+        key = (currency, target_currency)
+        if key not in self.paths:
+            self.paths[key] = self._search(currency, target_currency)
+        return self.paths[key]
+
+    def _search(self, currency: str, target_currency: str) -> Optional[list]:
+        if currency == target_currency:
+            return []
+        # breadth first search, so the first path found has the fewest hops
+        visited = {currency}
+        front = [(currency, [])]
+        for _ in range(self.max_hops):
+            new_front = []
+            for cur, path in front:
+                for neighbour, edge in self.edges.get(cur, {}).items():
+                    if neighbour == target_currency:
+                        return path + [edge]
+                    if neighbour not in visited and neighbour in self.hubs:
+                        visited.add(neighbour)
+                        new_front.append((neighbour, path + [edge]))
+            front = new_front
+        return None
+
+    def get_symbols(self, currencies, target_currency: str) -> set:
+        # gets all symbols needed to convert the currencies into the target currency
+        return {symbol for currency in currencies for symbol, _ in (self.get_path(currency, target_currency) or [])}
+
+
+class CandleCache:
+    """
+    Closed OHLCV candles per symbol and timeframe. Candles are fetched incrementally, i.e. only when a new candle has
+    closed and only from the last cached candle on. Only the candle data is shared, the exchange instance and the
+    function running the requests are given by the caller, as they belong to the user.
+    """
+    _saved_instances = {}
+    max_candles = 500
+    # weekly candles start on Monday, i.e. four days after the beginning of the unix epoch
+    week_offset = 4 * 24 * 60 * 60 * 1000
+
+    def __new__(cls, exchange: ccxt.Exchange):
+        # candles are public data, so one cache is shared by all users of an exchange
+        key = cls.data_key(exchange)
+        if key not in cls._saved_instances:
+            cls._saved_instances[key] = super().__new__(cls)
+        return cls._saved_instances[key]
+
+    def __init__(self, exchange: ccxt.Exchange):
+        if not hasattr(self, 'candles'):
+            self.candles = {}
+            self._lock = threading.Lock()
+
+    @staticmethod
+    def data_key(exchange: ccxt.Exchange):
+        # simulated exchanges generate their own prices, so their candles are not shared with other instances
+        return exchange if getattr(exchange, 'simulated', False) else exchange.id
+
+    @staticmethod
+    def duration(timeframe: str) -> float:
+        # duration of a candle in ms
+        return ccxt.Exchange.parse_timeframe(timeframe) * 1000
+
+    def get_closed(self, exchange: ccxt.Exchange, symbol: str, timeframe: str, run=None) -> np.ndarray:
+        """
+        Gets the cached closed candles of a symbol, fetching the candles closed since the last call
+
+        :param exchange: The ccxt exchange instance used for fetching the candles
+        :param symbol: The market symbol
+        :param timeframe: The candle timeframe, e.g. '1d'
+        :param run: Optional function that executes the exchange requests, e.g. with error handling
+        :return: Array of closed candles with the ccxt OHLCV columns (timestamp, open, high, low, close, volume)
+        """
+        run = run if run is not None else lambda func: func()
+        now = time.time() * 1000
+        duration = self.duration(timeframe)
+        with self._lock:
+            candles = self.candles.get((symbol, timeframe))
+            if candles is not None and len(candles) > 0 and candles[-1, 0] + 2 * duration > now:
+                # no candle has closed since the last fetch
+                return candles
+            since = candles[-1, 0] + duration if candles is not None and len(candles) > 0 else None
+            if timeframe == '1w' and '1w' not in (exchange.timeframes or {}):
+                new = self._aggregate_weeks(self._fetch(exchange, run, symbol, '1d', since))
+            else:
+                new = self._fetch(exchange, run, symbol, timeframe, since)
+            new = new[new[:, 0] + duration <= now]
+            if candles is not None:
+                new = np.concatenate([candles, new[new[:, 0] > candles[-1, 0]]]) if len(candles) > 0 else new
+            self.candles[(symbol, timeframe)] = new[-self.max_candles:]
+            return self.candles[(symbol, timeframe)]
+
+    @staticmethod
+    def _fetch(exchange: ccxt.Exchange, run, symbol: str, timeframe: str, since) -> np.ndarray:
+        ohlcv = run(lambda: exchange.fetch_ohlcv(symbol, timeframe, since=None if since is None else int(since)))
+        return np.array(ohlcv, dtype=float).reshape(-1, 6)
+
+    def _aggregate_weeks(self, daily: np.ndarray) -> np.ndarray:
+        # combines daily candles into weekly candles for exchanges that do not provide them
+        week_starts = (daily[:, 0] - self.week_offset) // self.duration('1w') * self.duration('1w') + self.week_offset
+        weeks = []
+        for start in np.unique(week_starts):
+            days = daily[week_starts == start]
+            weeks.append([start, days[0, 1], days[:, 2].max(), days[:, 3].min(), days[-1, 4], days[:, 5].sum()])
+        return np.array(weeks, dtype=float).reshape(-1, 6)
+
+
+class PriceHistory:
+    """
+    Fixed-size ring buffer of the recent ticks (time, last, bid, ask) of a symbol. Appending is O(1) and the memory is
+    bounded. If a file is given, the buffer is memory-mapped, so that the history survives restarts.
+    """
+    columns = ('time', 'last', 'bid', 'ask')
+
+    def __init__(self, size: int = 2880, file: str = None):
+        """
+
+        :param size: Maximum number of ticks kept
+        :param file: Optional .npy file the buffer is memory-mapped to
+        """
+        self.size = size
+        shape = (size + 1, len(self.columns))
+        if file is not None and os.path.isfile(file):
+            buffer = np.lib.format.open_memmap(file, mode='r+')
+            if buffer.shape != shape:
+                buffer = None
+        else:
+            buffer = None
+        if buffer is None:
+            buffer = np.lib.format.open_memmap(file, mode='w+', dtype=float, shape=shape) if file is not None else \
+                np.zeros(shape)
+        # the first row holds the number of ticks appended so far, the other rows are the ring buffer
+        self.buffer = buffer
+        self.data = buffer[1:]
+
+    @property
+    def count(self) -> int:
+        return int(self.buffer[0, 0])
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def append(self, last: float, bid: float = None, ask: float = None, tick_time: float = None):
+        if last is None:
+            return
+        if tick_time is None:
+            tick_time = time.time()
+        count = self.count
+        if count > 0 and self.data[(count - 1) % self.size, 0] >= tick_time:
+            # tick is not newer than the last one, e.g. a cached ticker
+            return
+        self.data[count % self.size] = (tick_time, last, np.nan if bid is None else bid, np.nan if ask is None else ask)
+        self.buffer[0, 0] = count + 1
+
+    def get(self, minutes: float = None) -> np.ndarray:
+        """
+        Gets the ticks in chronological order
+
+        :param minutes: Optional window, only ticks of the last minutes are returned
+        :return: Array with the columns time, last, bid and ask
+        """
+        count = self.count
+        if count <= self.size:
+            ticks = self.data[:count]
+        else:
+            start = count % self.size
+            ticks = np.concatenate([self.data[start:], self.data[:start]])
+        if minutes is not None:
+            ticks = ticks[ticks[:, 0] >= time.time() - 60 * minutes]
+        return np.array(ticks)
+
+    def min(self, minutes: float) -> Optional[float]:
+        ticks = self.get(minutes)
+        return float(ticks[:, 1].min()) if len(ticks) else None
+
+    def max(self, minutes: float) -> Optional[float]:
+        ticks = self.get(minutes)
+        return float(ticks[:, 1].max()) if len(ticks) else None
+
+    def ret(self, minutes: float) -> Optional[float]:
+        # relative price change over the window
+        ticks = self.get(minutes)
+        return float(ticks[-1, 1] / ticks[0, 1] - 1) if len(ticks) > 1 else None
+
+    def volatility(self, minutes: float) -> Optional[float]:
+        """
+        Realized volatility of the log returns in the window, scaled to one day
+
+        :param minutes: Window in minutes
+        :return: Daily volatility or None if there are not enough ticks
+        """
+        ticks = self.get(minutes)
+        if len(ticks) < 3:
+            return None
+        elapsed = (ticks[-1, 0] - ticks[0, 0]) / 86400
+        if elapsed < minutes / 4 / 1440:
+            # ticks need to cover at least a quarter of the window to give a sensible estimate
+            return None
+        return float(np.sqrt(np.sum(np.diff(np.log(ticks[:, 1])) ** 2) / elapsed))
+
+
+class PriceHistoryStore:
+    """
+    Price histories of all symbols of an exchange, shared by all users of the exchange
+    """
+    _saved_instances = {}
+    # folder the histories are memory-mapped to, histories are only kept in memory if None
+    directory = None
+
+    def __new__(cls, exch_id: str):
+        if exch_id not in cls._saved_instances:
+            cls._saved_instances[exch_id] = super().__new__(cls)
+        return cls._saved_instances[exch_id]
+
+    def __init__(self, exch_id: str):
+        if not hasattr(self, 'histories'):
+            self.exch_id = exch_id
+            self.histories = {}
+            self._lock = threading.Lock()
+
+    def get(self, symbol: str) -> PriceHistory:
+        with self._lock:
+            if symbol not in self.histories:
+                file = None
+                if self.directory is not None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    file = os.path.join(self.directory, f"{self.exch_id}_{symbol.replace('/', '-')}.npy")
+                self.histories[symbol] = PriceHistory(file=file)
+            return self.histories[symbol]
+
+    def add_ticker(self, symbol: str, ticker: Dict):
+        self.get(symbol).append(ticker['last'], ticker.get('bid'), ticker.get('ask'),
+                                ticker['timestamp'] / 1000 if ticker.get('timestamp') else None)
+
+
 class Price:
     def __init__(self, currency, current: float, price_time: datetime.datetime = None, high: float = None,
                  low: float = None):
@@ -237,14 +812,62 @@ class BaseSL:
         return price_obj.get_current_price() < self.value
 
 
-class DailyCloseSL(BaseSL):
+class CloseSL(BaseSL):
+    """
+    Stop-loss that is evaluated on the close of candles of a timeframe
+    """
+    timeframe = None
+
+    def __init__(self, value: float):
+        super().__init__(value)
+        # close time (in ms) of the last candle that was evaluated, so that only candles closing afterwards count
+        self.checked_until = time.time() * 1000
+
+    def next_close(self) -> float:
+        # close time (in ms) of the first candle that was not evaluated yet, 0 if unknown
+        checked_until = getattr(self, 'checked_until', None)
+        if checked_until is None:
+            return 0
+        duration = CandleCache.duration(self.timeframe)
+        offset = CandleCache.week_offset if self.timeframe == '1w' else 0
+        return ((checked_until - offset) // duration + 1) * duration + offset
+
+    def is_close_below(self, candles: np.ndarray, duration: float) -> bool:
+        """
+        Checks if any closed candle that was not evaluated yet closed below the stop-loss. This also catches candles
+        that closed while the bot was not running.
+
+        :param candles: Array of closed candles with the ccxt OHLCV columns
+        :param duration: Duration of a candle in ms
+        :return: Boolean if the stop-loss is reached
+        """
+        if len(candles) == 0:
+            return False
+        close_times = candles[:, 0] + duration
+        checked_until = getattr(self, 'checked_until', None)
+        if checked_until is None:
+            # stop-losses created before the candle cache existed only evaluate the last candle
+            new = candles[-1:]
+        else:
+            new = candles[close_times > checked_until]
+        if len(new) == 0:
+            return False
+        self.checked_until = close_times[-1]
+        return bool(np.any(new[:, 4] < self.value))
+
+
+class DailyCloseSL(CloseSL):
+    timeframe = '1d'
+
     def is_below(self, price_obj) -> bool:
         end = datetime.datetime.combine(datetime.date.today(), datetime.time(0, 1, 0))
         begin = end - datetime.timedelta(minutes=2)
         return super().is_below(price_obj) and begin < price_obj.time < end
 
 
-class WeeklyCloseSL(BaseSL):
+class WeeklyCloseSL(CloseSL):
+    timeframe = '1w'
+
     def is_below(self, price_obj) -> bool:
         end = datetime.datetime.combine(datetime.date.today(), datetime.time(0, 1, 0))
         begin = end - datetime.timedelta(minutes=2)
@@ -276,6 +899,604 @@ class TrailingSL(BaseSL):
         self.calculate_new_value(price_obj)
         return super().is_below(price_obj)
 
+    def get_anchor(self) -> float:
+        """
+        Returns the highest price seen so far, i.e. the price from which the current stop-loss value was derived
+
+        """
+        if self.kind == ValueType.ABSOLUTE:
+            return self.value + self.delta
+        else:
+            return self.value / (1 - self.delta)
+
+
+class _SortedKeys:
+    """
+    Two parallel lists, one with sorted float values and one with the keys belonging to them
+    """
+    def __init__(self):
+        self.values = []
+        self.keys = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value: float, key):
+        idx = bisect_right(self.values, value)
+        self.values.insert(idx, value)
+        self.keys.insert(idx, key)
+
+    def remove(self, value: float, key):
+        idx = bisect_left(self.values, value)
+        while idx < len(self.values) and self.values[idx] == value:
+            if self.keys[idx] == key:
+                break
+            idx += 1
+        else:
+            # value was changed outside of the index, fall back to searching the key
+            idx = self.keys.index(key)
+        self.values.pop(idx)
+        self.keys.pop(idx)
+
+    def below(self, value: float) -> list:
+        # keys of all entries with a value strictly lower than the given one
+        return self.keys[:bisect_left(self.values, value)]
+
+    def above(self, value: float) -> list:
+        # keys of all entries with a value strictly higher than the given one
+        return self.keys[bisect_right(self.values, value):]
+
+
+class _SymbolTriggers:
+    def __init__(self):
+        self.sl = _SortedKeys()
+        self.trailing_anchors = _SortedKeys()
+        self.trailing_values = _SortedKeys()
+        # candle-above buy levels per candle timeframe
+        self.candle = {}
+        self.trailing = {}
+
+    def is_empty(self):
+        return not (len(self.sl) or len(self.trailing) or any([len(keys) for keys in self.candle.values()]))
+
+
+class TriggerIndex:
+    """
+    Per-symbol index of all stop-loss values, trailing stop-loss anchors and candle-above buy levels of the trade sets
+    of one user on one exchange. A price tick is matched against the sorted values with bisection, so only the trade
+    sets that actually crossed a trigger are returned. The index is kept up to date by the trade sets whenever their
+    stop-loss, buy levels or active state change.
+
+    Entries are keyed by (user, trade set uid) for stop-losses and (user, trade set uid, level index) for candle-above
+    buy levels. Close-based stop-losses are not indexed as they are only evaluated on candle closes.
+    """
+    _saved_instances = {}
+
+    def __new__(cls, exch_name=None, user=None):
+        if (exch_name, user) not in cls._saved_instances:
+            cls._saved_instances[(exch_name, user)] = super().__new__(cls)
+        return cls._saved_instances[(exch_name, user)]
+
+    def __init__(self, exch_name=None, user=None):
+        if not hasattr(self, 'symbols'):
+            self.exch_name = exch_name
+            self.user = user
+            self.symbols = {}
+            # remembers what was registered for each trade set, to be able to remove it again
+            self.registered = {}
+            # the index is shared by the update jobs and the stop-loss watcher of the user
+            self._lock = threading.Lock()
+
+    def get_symbols(self, user=None, what='sl') -> set:
+        """
+        Returns the symbols that have stop-loss (what='sl') or candle-above (what='candle') triggers registered
+
+        :param user: Optional user to restrict the symbols to
+        :param what: 'sl' or 'candle'
+        """
+        kinds = ('sl', 'trailing') if what == 'sl' else (what,)
+        symbols = set()
+        with self._lock:
+            for (usr, _), (symbol, entries) in self.registered.items():
+                if (user is None or usr == user) and any(entry[0] in kinds for entry in entries):
+                    symbols.add(symbol)
+        return symbols
+
+    def remove_trade_set(self, user, uid):
+        with self._lock:
+            self._remove_trade_set(user, uid)
+
+    def _remove_trade_set(self, user, uid):
+        key = (user, uid)
+        if key not in self.registered:
+            return
+        symbol, entries = self.registered.pop(key)
+        triggers = self.symbols[symbol]
+        for kind, value, entry_key, timeframe in entries:
+            if kind == 'sl':
+                triggers.sl.remove(value, entry_key)
+            elif kind == 'candle':
+                triggers.candle[timeframe].remove(value, entry_key)
+                if len(triggers.candle[timeframe]) == 0:
+                    triggers.candle.pop(timeframe)
+            elif kind == 'trailing':
+                _, anchor, value = triggers.trailing.pop(entry_key)
+                triggers.trailing_anchors.remove(anchor, entry_key)
+                triggers.trailing_values.remove(value, entry_key)
+        if triggers.is_empty():
+            self.symbols.pop(symbol)
+
+    def update_trade_set(self, user, ts: 'BaseTradeSet'):
+        """
+        (Re-)registers all triggers of a trade set. Inactive trade sets are removed from the index.
+
+        :param user: telegram chat ID of the user owning the trade set
+        :param ts: The trade set
+        """
+        with self._lock:
+            self._remove_trade_set(user, ts.get_uid())
+            if ts.is_active():
+                self._add_trade_set(user, ts)
+
+    def _add_trade_set(self, user, ts: 'BaseTradeSet'):
+        key = (user, ts.get_uid())
+        triggers = self.symbols.setdefault(ts.symbol, _SymbolTriggers())
+        entries = []
+        if isinstance(ts.sl, TrailingSL):
+            self._add_trailing(triggers, ts.sl, key)
+            entries.append(('trailing', ts.sl.value, key, None))
+        elif ts.sl is not None and not isinstance(ts.sl, (DailyCloseSL, WeeklyCloseSL)):
+            triggers.sl.add(ts.sl.value, key)
+            entries.append(('sl', ts.sl.value, key, None))
+        for i_trade, trade in enumerate(ts.in_trades):
+            if trade['oid'] is None and trade['candleAbove'] is not None:
+                timeframe = trade.get('candleTimeframe', '1d')
+                triggers.candle.setdefault(timeframe, _SortedKeys()).add(trade['candleAbove'], key + (i_trade,))
+                entries.append(('candle', trade['candleAbove'], key + (i_trade,), timeframe))
+        if entries:
+            self.registered[key] = (ts.symbol, entries)
+        if triggers.is_empty():
+            self.symbols.pop(ts.symbol)
+
+    @staticmethod
+    def _add_trailing(triggers: _SymbolTriggers, sl: TrailingSL, key):
+        # anchor and value are remembered as indexed, as the stop-loss object might be changed outside of the index
+        triggers.trailing[key] = (sl, sl.get_anchor(), sl.value)
+        triggers.trailing_anchors.add(sl.get_anchor(), key)
+        triggers.trailing_values.add(sl.value, key)
+
+    def _raise_trailing(self, symbol, price_obj: Price):
+        # raises all trailing stop-losses whose anchor is below the current price
+        triggers = self.symbols[symbol]
+        for key in triggers.trailing_anchors.below(price_obj.current_price):
+            sl, anchor, value = triggers.trailing.pop(key)
+            triggers.trailing_anchors.remove(anchor, key)
+            triggers.trailing_values.remove(value, key)
+            sl.calculate_new_value(price_obj)
+            self._add_trailing(triggers, sl, key)
+
+    def sl_triggered(self, symbol, price_obj: Price) -> list:
+        """
+        Updates the trailing stop-losses of the symbol with the price tick and returns the keys of all trade sets whose
+        stop-loss is above the current price.
+
+        :param symbol: The symbol of the price tick
+        :param price_obj: The price object of the tick
+        :return: list of (user, trade set uid) tuples
+        """
+        with self._lock:
+            if symbol not in self.symbols:
+                return []
+            self._raise_trailing(symbol, price_obj)
+            triggers = self.symbols[symbol]
+            return triggers.sl.above(price_obj.current_price) + triggers.trailing_values.above(price_obj.current_price)
+
+    def get_candle_timeframes(self, user=None) -> set:
+        """
+        Returns the symbols and timeframes that have candle-above triggers registered
+
+        :param user: Optional user to restrict the symbols to
+        :return: set of (symbol, timeframe) tuples
+        """
+        result = set()
+        with self._lock:
+            for (usr, _), (symbol, entries) in self.registered.items():
+                if user is None or usr == user:
+                    result.update([(symbol, entry[3]) for entry in entries if entry[0] == 'candle'])
+        return result
+
+    def candle_triggered(self, symbol, close: float, timeframe: str = '1d') -> list:
+        """
+        Returns the keys of all candle-above buy levels of the symbol and timeframe lying below the given candle close
+
+        :param symbol: The symbol of the candle
+        :param close: The close price of the candle
+        :param timeframe: The timeframe of the candle
+        :return: list of (user, trade set uid, buy level index) tuples
+        """
+        with self._lock:
+            if symbol not in self.symbols or timeframe not in self.symbols[symbol].candle:
+                return []
+            return self.symbols[symbol].candle[timeframe].below(close)
+
+
+class TradeSetScheduler:
+    """
+    Computes the next check time of each trade set from the distance of the current price to its nearest level and the
+    recent volatility, so that trade sets near a trigger are checked often and far-away ones rarely
+    """
+    # minutes of price history used for the volatility estimate
+    volatility_window = 4 * 60
+
+    def __init__(self, min_interval: float = 60, max_interval: float = 60, safety: float = 0.25):
+        """
+
+        :param min_interval: Minimum time between two checks of a trade set in seconds
+        :param max_interval: Maximum time between two checks of a trade set in seconds
+        :param safety: Fraction of the expected time the price needs to reach the nearest level, after which the trade
+        set is checked again
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.safety = safety
+        self.next_check = {}
+
+    def set_intervals(self, min_interval: float, max_interval: float):
+        self.min_interval = min(min_interval, max_interval)
+        self.max_interval = max_interval
+
+    def is_enabled(self) -> bool:
+        return self.min_interval < self.max_interval
+
+    def is_due(self, uid, now: float = None) -> bool:
+        if not self.is_enabled():
+            return True
+        if now is None:
+            now = time.time()
+        return self.next_check.get(uid, 0) <= now
+
+    def remove(self, uid):
+        self.next_check.pop(uid, None)
+
+    @staticmethod
+    def nearest_level_distance(ts: 'BaseTradeSet', price: float) -> Union[float, None]:
+        # relative (logarithmic) distance of the price to the nearest not filled level or stop-loss of the trade set
+        levels = [trade['price'] for trade in ts.in_trades + ts.out_trades
+                  if trade['oid'] != 'filled' and trade['price'] is not None and trade['price'] > 0]
+        if ts.sl is not None and ts.sl.value is not None and ts.sl.value > 0:
+            levels.append(ts.sl.value)
+        if len(levels) == 0 or not price:
+            return None
+        return float(np.min(np.abs(np.log(np.array(levels) / price))))
+
+    @staticmethod
+    def daily_volatility(price_obj: Price) -> Union[float, None]:
+        # Parkinson estimate of the daily volatility from the 24h high and low of the ticker
+        high, low = price_obj.get_high_price(), price_obj.get_low_price()
+        if not high or not low or high <= low:
+            return None
+        return float(np.log(high / low) / np.sqrt(4 * np.log(2)))
+
+    def schedule(self, ts: 'BaseTradeSet', price_obj: Union[Price, None], history: PriceHistory = None) -> float:
+        """
+        Sets the next check time of a trade set
+
+        :param ts: The trade set
+        :param price_obj: The latest price object of the trade set's symbol
+        :param history: Optional price history of the symbol, whose recent volatility is preferred over the 24h range
+        :return: The time in seconds until the next check
+        """
+        now = time.time()
+        interval = self.max_interval
+        if price_obj is not None:
+            distance = self.nearest_level_distance(ts, price_obj.get_current_price())
+            volatility = history.volatility(self.volatility_window) if history is not None else None
+            if not volatility:
+                volatility = self.daily_volatility(price_obj)
+            if distance is not None and volatility:
+                # a random walk needs about (distance / volatility)^2 days to move the distance
+                interval = self.safety * (distance / volatility) ** 2 * 86400
+        if isinstance(ts.sl, (DailyCloseSL, WeeklyCloseSL)):
+            # close-based stop-losses need a check right after the close of their candle, i.e. after midnight UTC
+            interval = min(interval, ts.sl.next_close() / 1000 - now + 5)
+        if ts.regular_buy is not None:
+            interval = min(interval, ts.regular_buy.next_time.timestamp() - now)
+        interval = float(np.clip(interval, self.min_interval, self.max_interval))
+        self.next_check[ts.get_uid()] = now + interval
+        return interval
+
+
+class BalanceLedger:
+    """
+    Locally maintained balance of an exchange. Order placements, cancels and fills are applied as deltas, so that the
+    balance only needs to be fetched from the exchange periodically or after unexpected events (e.g. market orders
+    with unknown costs or insufficient funds errors).
+
+    The funds reserved by the trade sets are cached per currency. The cache is cleared by every ledger event and when a
+    trade set is (de)activated or unlocked, as the trade sets change together with these.
+    """
+    def __init__(self, reconcile_interval: float = 15 * 60):
+        """
+
+        :param reconcile_interval: Maximum time in seconds after which the balance is fetched from the exchange again
+        """
+        self.balance = {}
+        self.reconcile_interval = reconcile_interval
+        self.last_reconcile = 0
+        self.dirty = True
+        self._reserved = {}
+        # counts the cache invalidations, so that a reserved amount calculated meanwhile is not cached
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def set(self, balance: Dict):
+        # sets the balance as fetched from the exchange
+        with self._lock:
+            self.balance = balance if balance is not None else {}
+            self.last_reconcile = time.time()
+            self.dirty = False
+            self._invalidate()
+
+    def mark_dirty(self):
+        self.dirty = True
+        self.invalidate()
+
+    def invalidate(self):
+        # clears the cached reserved funds, e.g. after a trade set changed
+        with self._lock:
+            self._invalidate()
+
+    def _invalidate(self):
+        self._reserved = {}
+        self._generation += 1
+
+    def needs_reconcile(self) -> bool:
+        return self.dirty or time.time() - self.last_reconcile > self.reconcile_interval
+
+    def _add(self, coin: str, free: float = 0, used: float = 0):
+        with self._lock:
+            if coin not in self.balance:
+                self.balance[coin] = {'free': 0, 'used': 0, 'total': 0}
+            entry = self.balance[coin]
+            entry['free'] = (entry['free'] or 0) + free
+            entry['used'] = (entry['used'] or 0) + used
+            entry['total'] = entry['free'] + entry['used']
+            self._invalidate()
+            # ccxt balances also contain the values per balance type
+            for typ in ['free', 'used', 'total']:
+                if typ in self.balance:
+                    self.balance[typ][coin] = entry[typ]
+
+    def order_placed(self, symbol: str, side: str, amount: float, price: float):
+        coin, currency = symbol.split('/')
+        if side == 'buy':
+            self._add(currency, free=-amount * price, used=amount * price)
+        else:
+            self._add(coin, free=-amount, used=amount)
+
+    def order_canceled(self, symbol: str, side: str, amount: float, price: float):
+        self.order_placed(symbol, side, -amount, price)
+
+    def order_filled(self, symbol: str, side: str, amount: float, price: float, cost: float = None,
+                     received: float = None):
+        """
+        Applies a filled limit order to the balance
+
+        :param symbol: Symbol of the order
+        :param side: 'buy' or 'sell'
+        :param amount: Amount of the order
+        :param price: Limit price of the order
+        :param cost: Actual cost of the order, if known
+        :param received: Amount of coins received from a buy order after fees, if known
+        """
+        coin, currency = symbol.split('/')
+        if side == 'buy':
+            refund = amount * price - cost if cost else 0
+            self._add(currency, free=refund, used=-amount * price)
+            self._add(coin, free=received if received is not None else amount)
+        else:
+            self._add(coin, used=-amount)
+            self._add(currency, free=cost if cost else amount * price)
+
+    def reserved(self, currency: str, trade_sets: Dict[str, 'BaseTradeSet'], exclude=None) -> float:
+        """
+        Funds of a currency in the free balance that are committed to active trade sets, i.e. costs of buy levels that
+        are not placed yet and coins that the trade sets hold but not yet sell
+
+        :param currency: The currency
+        :param trade_sets: All trade sets of the exchange
+        :param exclude: Optional uid of a trade set not to take into account
+        :return: The reserved amount
+        """
+        with self._lock:
+            reserved = self._reserved.get(currency)
+            generation = self._generation
+        if reserved is None:
+            reserved = sum([self.reserved_by(currency, ts) for ts in list(trade_sets.values())])
+            with self._lock:
+                if generation == self._generation:
+                    self._reserved[currency] = reserved
+        if exclude in trade_sets:
+            reserved -= self.reserved_by(currency, trade_sets[exclude])
+        return reserved
+
+    @staticmethod
+    def reserved_by(currency: str, ts: 'BaseTradeSet') -> float:
+        # funds of a currency reserved by a single trade set
+        if not ts.is_active():
+            return 0
+        if ts.baseCurrency == currency:
+            return ts.sum_buy_costs('notinitiated', subtract_fee=False)
+        elif ts.coinCurrency == currency:
+            # coins of a native stop-loss order are already locked by the exchange and not in the free balance
+            sl_amount = ts.sl_order['amount'] if ts.sl_order is not None else 0
+            return max(ts.coins_avail() - sl_amount, 0)
+        return 0
+
+
+class FeeSchedule:
+    """
+    Maker and taker fee rates of the account per symbol. The rates are fetched from the exchange (if supported) and
+    refreshed after a time to live, so that account specific fee tiers are used and fees of whole level arrays can be
+    calculated without calling the exchange.
+    """
+    def __init__(self, exchange: ccxt.Exchange, ttl: float = 6 * 60 * 60):
+        """
+
+        :param exchange: The ccxt exchange instance
+        :param ttl: Time in seconds after which the account fees are fetched again
+        """
+        self.exchange = exchange
+        self.ttl = ttl
+        self.rates = {}
+        self.default_rates = None
+        self.loaded_at = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        # fetches the account fees if they are older than the time to live
+        with self._lock:
+            if not force and time.time() - self.loaded_at < self.ttl:
+                return
+            self.loaded_at = time.time()
+            if not self.exchange.has.get('fetchTradingFees') or not self.exchange.apiKey:
+                return
+            try:
+                fees = self.exchange.fetch_trading_fees()
+            except (ExchangeError, NetworkError) as e:
+                logger.warning(f"Could not fetch trading fees from {self.exchange.name}, market fees are used: {e}")
+                return
+            if fees.get('maker') is not None and fees.get('taker') is not None:
+                # some exchanges only return the fees of the account for all symbols
+                self.default_rates = {'maker': fees['maker'], 'taker': fees['taker']}
+            self.rates = {symbol: {'maker': fee['maker'], 'taker': fee['taker']} for symbol, fee in fees.items()
+                          if isinstance(fee, dict) and fee.get('maker') is not None and fee.get('taker') is not None}
+
+    def get_rate(self, symbol: str, taker_or_maker: str = 'taker') -> float:
+        self.refresh()
+        if symbol in self.rates:
+            return self.rates[symbol][taker_or_maker]
+        elif self.default_rates is not None:
+            return self.default_rates[taker_or_maker]
+        else:
+            return self.exchange.markets[symbol][taker_or_maker]
+
+    def calculate(self, symbol: str, side: str, amounts, prices, taker_or_maker: str = 'taker'):
+        """
+        Calculates the fees of multiple orders of a symbol at once, the same way ccxt's calculate_fee does
+
+        :param symbol: The market symbol
+        :param side: 'buy' or 'sell'
+        :param amounts: Array of order amounts
+        :param prices: Array of order prices
+        :param taker_or_maker: 'taker' or 'maker'
+        :return: Tuple of the fee cost array and the fee currency
+        """
+        amounts = np.asarray(amounts, dtype=float)
+        prices = np.asarray(prices, dtype=float)
+        rate = self.get_rate(symbol, taker_or_maker)
+        if type(self.exchange).calculate_fee is not ccxt.Exchange.calculate_fee:
+            # exchange calculates fees in its own way, so only the rate is corrected
+            fees = [self.exchange.calculate_fee(symbol, 'limit', side, amount, price, taker_or_maker)
+                    for amount, price in zip(np.atleast_1d(amounts), np.broadcast_to(prices, np.shape(
+                        np.atleast_1d(amounts))))]
+            costs = np.array([fee['cost'] * rate / fee['rate'] if fee['rate'] else fee['cost'] for fee in fees])
+            return costs.reshape(amounts.shape), fees[0]['currency'] if fees else self.exchange.markets[symbol][
+                'quote']
+        market = self.exchange.markets[symbol]
+        fee_side = market.get('feeSide', 'quote')
+        currency = market['quote']
+        if fee_side == 'base':
+            costs = amounts
+        elif fee_side == 'get' and side == 'buy' or fee_side == 'give' and side == 'sell':
+            costs = amounts
+            currency = market['base']
+        else:
+            costs = amounts * prices
+        return costs * rate, currency
+
+    def calculate_fee(self, symbol: str, side: str, amount: float, price: float, taker_or_maker: str = 'taker') -> Dict:
+        # calculates the fee of a single order, returning a dictionary like ccxt's calculate_fee
+        costs, currency = self.calculate(symbol, side, amount, price, taker_or_maker)
+        return {'type': taker_or_maker, 'currency': currency, 'rate': self.get_rate(symbol, taker_or_maker),
+                'cost': float(costs)}
+
+
+class FeeTokenResolver:
+    """
+    Resolves if trading fees are paid with the token of the exchange (e.g. BNB on Binance). The fee payment setting of
+    the account and the token prices are cached for a time to live, instead of being requested for every order.
+    """
+    fee_tokens = {'binance': 'BNB'}
+    session = requests.Session()
+
+    def __init__(self, th: 'tradeHandler', ttl: float = 10 * 60):
+        """
+
+        :param th: The trade handler of the exchange
+        :param ttl: Time in seconds after which the fee payment setting and token prices are requested again
+        """
+        self.th = th
+        self.ttl = ttl
+        self.burn_active = None
+        self.burn_time = 0
+        self.token_prices = {}
+
+    @property
+    def token(self) -> Optional[str]:
+        return self.fee_tokens.get(self.th.exchange.id)
+
+    def is_burn_active(self) -> bool:
+        # checks if paying fees with the exchange token is activated in the account
+        if self.token is None:
+            return False
+        if time.time() - self.burn_time > self.ttl:
+            self.burn_active = bool(self.th.exchange.request('bnbBurn', api='sapi', method='GET')['spotBNBBurn'])
+            self.burn_time = time.time()
+        return self.burn_active
+
+    def get_token_price(self, currency: str) -> float:
+        """
+        Gets the price of a currency in the exchange token, from the price cache of the exchange if there is a market
+        or otherwise from cryptocompare
+
+        :param currency: Currency name
+        :return: Price of one unit of the currency in the exchange token
+        """
+        token = self.token
+        if currency == token:
+            return 1
+        if f'{currency}/{token}' in self.th.exchange.markets:
+            return self.th.get_price_obj(f'{currency}/{token}').get_current_price()
+        elif f'{token}/{currency}' in self.th.exchange.markets:
+            return 1 / self.th.get_price_obj(f'{token}/{currency}').get_current_price()
+        if currency not in self.token_prices or time.time() - self.token_prices[currency][1] > self.ttl:
+            price = self.session.get('https://min-api.cryptocompare.com/data/price',
+                                     params={'fsym': currency, 'tsyms': token}).json()[token]
+            self.token_prices[currency] = (price, time.time())
+        return self.token_prices[currency][0]
+
+    def are_paid(self, costs, fee_currency: str) -> list:
+        """
+        Checks for multiple fees if they are paid with the exchange token, i.e. if the payment is activated and the
+        token balance is sufficient
+
+        :param costs: List of fee costs
+        :param fee_currency: Currency name in which the fees are paid
+        :return: List of booleans
+        """
+        costs = list(costs)
+        try:
+            if self.is_burn_active():
+                price = self.get_token_price(fee_currency)
+                balance = self.th.get_balance(self.token)
+                # add a factor of 5 to the fee to avoid problems with token market fluctuations, and multiple orders
+                # that are set
+                return [balance is not None and 5 * price * cost < balance for cost in costs]
+        except Exception as e:
+            logger.error(f'Failed to check for fee payment:\n{e}', extra=self.th.logger_extras)
+        return [False] * len(costs)
+
 
 class RegularBuy:
     def __init__(self, amount: float, currency: str, order_type: OrderType,
@@ -307,7 +1528,9 @@ class RegularBuy:
 class BaseTradeSet:
 
     attributes_to_save = ('__active', '__virgin', 'in_trades', 'out_trades', 'createdAt', 'init_coins', 'init_price',
-                          'sl', 'show_filled_orders', 'regular_buy')
+                          'sl', 'show_filled_orders', 'regular_buy', 'sl_order')
+    # makes checking and setting the updating flag atomic (class attribute, as the trade sets are pickled)
+    _lock_guard = threading.Lock()
 
     def __init__(self, symbol: str,
                  trade_handler: 'tradeHandler' = None,
@@ -341,6 +1564,7 @@ class BaseTradeSet:
         self.init_coins = 0
         self.init_price = None
         self.sl = None
+        self.sl_order = None
         self.__active = False
         self.__virgin = True
         self.updating = False
@@ -406,6 +1630,9 @@ class BaseTradeSet:
             _, self.init_coins, self.init_price, self.sl, self.show_filled_orders, self.regular_buy = state
         elif isinstance(state, dict):
             for key in self.attributes_to_save:
+                if key not in state:
+                    # attribute was added after the trade set was saved, keep the default
+                    continue
                 setattr(self, key if not key.startswith('__') else f'_BaseTradeSet{key}', state[key])
         else:
             raise TypeError(f'Unknown state type {type(state)}')
@@ -435,22 +1662,36 @@ class BaseTradeSet:
         # avoids two processes changing a tradeset at the same time
         count = 0
         mystamp = time.time()
-        self.waiting.append(mystamp)
+        with self._lock_guard:
+            self.waiting.append(mystamp)
         time.sleep(0.2)
-        while self.updating or self.waiting[0] < mystamp:
+        while True:
+            with self._lock_guard:
+                if count > 60:  # 60 sec max wait
+                    logger.warning(
+                        'Waiting for tradeSet update (%s on %s) to finish timed out after 1 min.. '
+                        'Resetting updating variable now.' % (
+                            self.symbol, self.th.exchange.name))
+                if count > 60 or not self.updating and self.waiting[0] >= mystamp:
+                    self.updating = True
+                    self.waiting.remove(mystamp)
+                    return
             count += 1
             time.sleep(1)
-            if count > 60:  # 60 sec max wait
-                logger.warning(
-                    'Waiting for tradeSet update (%s on %s) to finish timed out after 1 min.. '
-                    'Resetting updating variable now.' % (
-                        self.symbol, self.th.exchange.name))
-                break
-        self.updating = True
-        self.waiting.remove(mystamp)
 
     def unlock_trade_set(self):
         self.updating = False
+        self.invalidate_reserved()
+
+    def invalidate_reserved(self):
+        # the funds reserved by this trade set might have changed
+        if self.th is not None and hasattr(self.th, 'ledger'):
+            self.th.ledger.invalidate()
+
+    def update_triggers(self):
+        # keeps the stop-loss and candle-above triggers of this trade set up to date in the exchange's trigger index
+        if self.th is not None and hasattr(self.th, 'trigger_index'):
+            self.th.trigger_index.update_trade_set(self.th.user, self)
 
     def is_active(self):
         return self.__active
@@ -484,6 +1725,7 @@ class BaseTradeSet:
             return wasactive
         self.__virgin = False
         self.__active = True
+        self.invalidate_reserved()
         if verbose and not wasactive:
             total_buy_cost = self.cost_in() + self.sum_buy_costs('notfilled')
             prt_str = 'Estimated return if all trades are executed: %s %s' % (
@@ -507,6 +1749,7 @@ class BaseTradeSet:
             logger.error('Cannot activate trade set due to insufficient funds!',
                          extra=self.th.logger_extras)
             self.deactivate()
+        self.update_triggers()
         return wasactive
 
     def deactivate(self, cancel_orders=0):
@@ -516,7 +1759,10 @@ class BaseTradeSet:
         if cancel_orders:
             self.cancel_buy_orders(delete_orders=cancel_orders == 2)
             self.cancel_sell_orders(delete_orders=cancel_orders == 2)
+            self.cancel_sl_order()
         self.__active = False
+        self.invalidate_reserved()
+        self.update_triggers()
         return wasactive
 
     def num_buy_levels(self, order='all'):
@@ -529,8 +1775,10 @@ class BaseTradeSet:
         return self.get_trade_param('amount', 'sum', 'buy', order, subtract_fee)
 
     def coins_avail(self):
+        # coins sold by filled sell levels or (partly) executed stop-loss orders are not available anymore
         return self.sum_buy_amounts(order='filled', subtract_fee=True) + self.init_coins - \
-               self.sum_sell_amounts(order='open', subtract_fee=False)
+               self.sum_sell_amounts(order='open', subtract_fee=False) - \
+               self.sum_sell_amounts(order='filled', subtract_fee=False)
 
     def sum_sell_amounts(self, order='all', subtract_fee=True):
         return self.get_trade_param('amount', 'sum', 'sell', order, subtract_fee)
@@ -640,6 +1888,7 @@ class BaseTradeSet:
                         i_ts=self.get_uid())
                 except InsufficientFunds:
                     response = self.sell_free_bal()
+                self.th.ledger.mark_dirty()
             else:
                 if price is None:
                     price = self.safe_run(
@@ -650,9 +1899,10 @@ class BaseTradeSet:
                         i_ts=self.get_uid())
                 except InsufficientFunds:
                     response = self.sell_free_bal()
+                self.th.ledger.mark_dirty()
             if response is not None:
-                time.sleep(5)  # give exchange 5 sec for trading the order
-                order_info = self.fetch_order(response['id'], 'SELL')
+                # give exchange up to 5 sec for trading the order
+                order_info = self.wait_for_order(response, 'SELL', timeout=5)
 
                 if order_info['status'].lower() in ['closed', 'filled', 'canceled']:
                     if order_info['type'] == 'market' and self.th.exchange.has['fetchMyTrades'] is not False:
@@ -681,123 +1931,312 @@ class BaseTradeSet:
         return sold
 
     def cancel_sell_orders(self, oid=None, delete_orders=False):
+        return self.cancel_orders('sell', oid, delete_orders)
+
+    def supports_native_sl(self) -> bool:
+        # only fixed stop-losses can be placed as native stop order, close-based and trailing SLs are polled by the bot
+        if type(self.sl) is not BaseSL or not getattr(self.th, 'native_sl', False):
+            return False
+        return bool(self.th.exchange.has.get('createStopLimitOrder')) or self.th.exchange.id in NATIVE_STOP_ORDERS
+
+    def place_sl_order(self):
+        """
+        Places an exchange-native stop-limit sell order for all coins available in this trade set at the stop-loss
+        """
         self.th.update_down_state(True)
-        return_val = 1
-        if self.num_sell_levels() > 0:
-            count = 0
-            for iTrade, trade in reversed(list(enumerate(self.out_trades))):
-                if oid is None or trade['oid'] == oid:
-                    if trade['oid'] is not None and trade['oid'] != 'filled':
-                        try:
-                            self.cancel_order(trade['oid'], 'SELL')
-                        except OrderNotFound:
-                            pass
-                        except Exception as e:
-                            self.unlock_trade_set()
-                            raise e
-                        time.sleep(1)
-                        count += 1
-                        order_info = self.fetch_order(trade['oid'], 'SELL')
-                        if order_info['filled'] > 0:
-                            logger.warning('(Partly?) filled sell order found during canceling. Updating balance',
-                                           extra=self.th.logger_extras)
-                            trade['oid'] = 'filled'
-                            trade['amount'] = order_info['filled']
-                            if order_info['price'] is not None:
-                                trade['price'] = order_info['price']
-                            return_val = 0.5
-                        else:
-                            trade['oid'] = None
-                    if delete_orders:
-                        if trade['oid'] != 'filled':
-                            self.out_trades.pop(iTrade)
-            if count > 0:
-                logger.info('%d sell orders canceled in total for tradeSet %d (%s)' % (
-                    count, list(self.th.tradeSets.keys()).index(self._uid), self.symbol),
-                            extra=self.th.logger_extras)
-        return return_val
+        amount = float(self.th.exchange.amountToPrecision(self.symbol, self.coins_avail()))
+        if amount <= 0 or not self.th.check_quantity(self.symbol, 'amount', amount):
+            return
+        stop_price = float(self.th.exchange.priceToPrecision(self.symbol, self.sl.value))
+        price = float(self.th.exchange.priceToPrecision(self.symbol, self.sl.value * NATIVE_STOP_LIMIT_RATIO))
+        if self.th.exchange.has.get('createStopLimitOrder'):
+            response = self.safe_run(
+                lambda: self.th.exchange.createStopLimitOrder(self.symbol, 'sell', amount, price, stop_price),
+                i_ts=self.get_uid())
+        else:
+            order_type, stop_param = NATIVE_STOP_ORDERS[self.th.exchange.id]
+            response = self.safe_run(
+                lambda: self.th.exchange.createOrder(self.symbol, order_type, 'sell', amount, price,
+                                                     {stop_param: stop_price}), i_ts=self.get_uid())
+        self.sl_order = {'oid': response['id'], 'price': self.sl.value, 'limit': price, 'amount': amount}
+        self.th.ledger.order_placed(self.symbol, 'sell', amount, price)
+        logger.info('Placed native stop-loss order on %s for %s %s at %s' % (
+            self.th.exchange.name, self.th.nf.amount2Prec(self.symbol, amount), self.coinCurrency,
+            self.th.nf.price2Prec(self.symbol, stop_price)), extra=self.th.logger_extras)
+
+    def check_sl_order(self) -> bool:
+        """
+        Checks if the native stop-loss order was executed. A (partly) filled order is added as filled sell level. If
+        the order was only partly filled before it was closed, the trade set keeps the remaining coins and the
+        stop-loss order is placed again for them during the next update.
+
+        :return: True if the stop-loss order was completely filled
+        """
+        if self.sl_order is None:
+            return False
+        try:
+            order_info = self.fetch_order(self.sl_order['oid'], 'SELL')
+        except OrderNotFound:
+            self.sl_order = None
+            return False
+        if order_info['status'].lower() in ['open', 'new']:
+            return False
+        sl_order = self.sl_order
+        self.sl_order = None
+        # orders placed before the limit price was stored are accounted with the stop price
+        limit_price = sl_order.get('limit', sl_order['price'])
+        filled = order_info['filled'] or 0
+        if not filled:
+            self.th.ledger.order_canceled(self.symbol, 'sell', sl_order['amount'], limit_price)
+        elif filled >= sl_order['amount'] and order_info['cost']:
+            self.th.ledger.order_filled(self.symbol, 'sell', sl_order['amount'], limit_price,
+                                        cost=order_info['cost'])
+        else:
+            self.th.ledger.mark_dirty()
+        if not filled:
+            return False
+        price = order_info['average'] if order_info['average'] is not None else \
+            order_info['price'] if order_info['price'] is not None else limit_price
+        self.out_trades.append({'oid': 'filled', 'price': price, 'amount': filled, 'time': datetime.datetime.now()})
+        if filled < sl_order['amount']:
+            logger.warning('Native stop-loss order of %s on %s was only partly executed: Sold %s of %s %s at %s. The '
+                           'stop-loss is placed again for the remaining coins.' % (
+                               self.symbol, self.th.exchange.name, self.th.nf.amount2Prec(self.symbol, filled),
+                               self.th.nf.amount2Prec(self.symbol, sl_order['amount']), self.coinCurrency,
+                               self.th.nf.price2Prec(self.symbol, price)), extra=self.th.logger_extras)
+            return False
+        logger.warning('Native stop-loss order of %s on %s was executed: Sold %s %s at %s.' % (
+            self.symbol, self.th.exchange.name, self.th.nf.amount2Prec(self.symbol, filled),
+            self.coinCurrency, self.th.nf.price2Prec(self.symbol, price)), extra=self.th.logger_extras)
+        return True
+
+    def cancel_sl_order(self) -> bool:
+        """
+        Cancels the native stop-loss order, if there is one
+
+        :return: True if the stop-loss order was (partly) filled before it could be canceled
+        """
+        if self.sl_order is None:
+            return False
+        try:
+            self.th.cancel_orders(self.symbol, [self.sl_order['oid']], 'SELL')
+        except ExchangeError:
+            pass
+        return self.check_sl_order()
+
+    def update_sl_order(self) -> bool:
+        """
+        Keeps the native stop-loss order in line with the stop-loss and the coins available in this trade set
+
+        :return: True if the stop-loss order was filled in the meantime
+        """
+        if self.sl_order is not None:
+            if self.check_sl_order():
+                return True
+            if self.is_active() and self.supports_native_sl() and self.sl_order['price'] == self.sl.value and \
+                    self.sl_order['amount'] == float(self.th.exchange.amountToPrecision(self.symbol,
+                                                                                       self.coins_avail())):
+                return False
+            if self.cancel_sl_order():
+                return True
+            if self.sl_order is not None:
+                # order could not be canceled, try again next time
+                return False
+        if self.is_active() and self.supports_native_sl():
+            self.place_sl_order()
+        return False
 
     def cancel_buy_orders(self, oid=None, delete_orders=False):
+        return self.cancel_orders('buy', oid, delete_orders)
+
+    def cancel_orders(self, direction, oid=None, delete_orders=False):
+        """
+        Cancels all (or one) open buy or sell orders of the trade set at once and checks them for partial fills
+        afterwards
+
+        :param direction: 'buy' or 'sell'
+        :param oid: Optional id of the only order to cancel
+        :param delete_orders: If True, the canceled levels are removed from the trade set
+        :return: 1 if successful, 0.5 if a (partly) filled order was found
+        """
         self.th.update_down_state(True)
+        trades = self.in_trades if direction == 'buy' else self.out_trades
+        typ = direction.upper()
         return_val = 1
-        if self.num_buy_levels() > 0:
-            count = 0
-            for iTrade, trade in reversed(list(enumerate(self.in_trades))):
-                if oid is None or trade['oid'] == oid:
-                    if trade['oid'] is not None and trade['oid'] != 'filled':
-                        try:
-                            self.cancel_order(trade['oid'], 'BUY')
-                        except OrderNotFound:
-                            pass
-
-                        time.sleep(1)
-                        count += 1
-                        order_info = self.fetch_order(trade['oid'], 'BUY')
-                        if order_info['filled'] > 0:
-                            logger.warning('(Partly?) filled buy order found during canceling. Updating balance',
-                                           extra=self.th.logger_extras)
-                            trade['oid'] = 'filled'
-                            trade['amount'] = order_info['filled']
-                            if order_info['price'] is not None:
-                                trade['price'] = order_info['price']
-                            return_val = 0.5
-                        else:
-                            trade['oid'] = None
-                    if delete_orders:
-                        if trade['oid'] != 'filled':
-                            self.in_trades.pop(iTrade)
-            if count > 0:
-                logger.info('%d buy orders canceled in total for tradeSet %d (%s)' % (
-                    count, list(self.th.tradeSets.keys()).index(self._uid), self.symbol),
-                            extra=self.th.logger_extras)
+        idx = [iTrade for iTrade, trade in enumerate(trades) if oid is None or trade['oid'] == oid]
+        to_cancel = [trades[iTrade]['oid'] for iTrade in idx if trades[iTrade]['oid'] not in [None, 'filled']]
+        if len(to_cancel) > 0:
+            try:
+                self.th.cancel_orders(self.symbol, to_cancel, typ)
+                order_infos = self.fetch_orders(to_cancel, typ)
+            except Exception as e:
+                self.unlock_trade_set()
+                raise e
+            for iTrade in idx:
+                trade = trades[iTrade]
+                if trade['oid'] not in order_infos:
+                    continue
+                order_info = order_infos[trade['oid']]
+                if order_info['filled'] > 0:
+                    self.th.ledger.mark_dirty()
+                    logger.warning('(Partly?) filled %s order found during canceling. Updating balance' % direction,
+                                   extra=self.th.logger_extras)
+                    trade['oid'] = 'filled'
+                    trade['amount'] = order_info['filled']
+                    if order_info['price'] is not None:
+                        trade['price'] = order_info['price']
+                    return_val = 0.5
+                else:
+                    self.th.ledger.order_canceled(self.symbol, direction, trade['amount'], trade['price'])
+                    trade['oid'] = None
+            logger.info('%d %s orders canceled in total for tradeSet %d (%s)' % (
+                len(to_cancel), direction, list(self.th.tradeSets.keys()).index(self._uid), self.symbol),
+                        extra=self.th.logger_extras)
+        if delete_orders:
+            for iTrade in reversed(idx):
+                if trades[iTrade]['oid'] != 'filled':
+                    trades.pop(iTrade)
         return return_val
 
     def init_buy_orders(self):
         self.th.update_down_state(True)
         if self.__active:
             # initialize buy orders
-            for iTrade, trade in enumerate(self.in_trades):
-                if trade['oid'] is None and trade['candleAbove'] is None:
-                    try:
-                        response = self.safe_run(
-                            lambda: self.th.exchange.createLimitBuyOrder(self.symbol, trade['amount'],
-                                                                         trade['price']))
-                    except InsufficientFunds as e:
-                        self.deactivate()
-                        logger.error(f"Insufficient funds on exchange {self.th.exchange.name} for trade set "
-                                     f"{self.name}. Trade set is deactivated now and not updated anymore "
-                                     f"(open orders are still open)! Free the missing funds and reactivate. \n {e}.",
-                                     extra=self.th.logger_extras)
-                        raise e
-                    self.in_trades[iTrade]['oid'] = response['id']
+            to_place = [iTrade for iTrade, trade in enumerate(self.in_trades)
+                        if trade['oid'] is None and trade['candleAbove'] is None]
+            if len(to_place) == 0:
+                return
+            # validate all levels before placing any of them, using the values the exchange rounds them to
+            amounts = self.th.nf.table.round(self.symbol, [self.in_trades[iTrade]['amount'] for iTrade in to_place],
+                                             'amount')
+            prices = self.th.nf.table.round(self.symbol, [self.in_trades[iTrade]['price'] for iTrade in to_place],
+                                            'price')
+            valid = self.th.nf.table.check_levels(self.symbol, amounts, prices)
+            if not valid.all():
+                raise ValueError(f"Buy level #{to_place[int(np.argmin(valid))]} of trade set {self.name} is not "
+                                 f"within the range the exchange accepts")
+            cost = float(np.sum(amounts * prices))
+            bal = self.th.get_balance(self.baseCurrency, exclude=self.get_uid())
+            if bal is not None and bal < cost:
+                # local balance might be outdated, check again with the balance on the exchange
+                self.th.ledger.mark_dirty()
+                self.th.reconcile_balance()
+                bal = self.th.get_balance(self.baseCurrency, exclude=self.get_uid())
+            if bal is not None and bal < cost:
+                error = InsufficientFunds(f"{self.th.nf.cost2Prec(self.symbol, cost)} {self.baseCurrency} needed for "
+                                          f"the buy levels, but only {self.th.nf.cost2Prec(self.symbol, bal)} "
+                                          f"{self.baseCurrency} are free")
+            else:
+                # the validated values are placed and kept in the levels, so that the accounting matches the orders
+                responses = self.th.create_orders([{'symbol': self.symbol, 'type': 'limit', 'side': 'buy',
+                                                    'amount': float(amount), 'price': float(price)}
+                                                   for amount, price in zip(amounts, prices)])
+                error = None
+                for iTrade, amount, price, response in zip(to_place, amounts, prices, responses):
+                    if isinstance(response, Exception):
+                        error = response if error is None else error
+                        continue
+                    self.in_trades[iTrade].update({'oid': response['id'], 'amount': float(amount),
+                                                   'price': float(price)})
+                    self.th.ledger.order_placed(self.symbol, 'buy', float(amount), float(price))
+            if isinstance(error, InsufficientFunds):
+                self.th.ledger.mark_dirty()
+                self.deactivate()
+                logger.error(f"Insufficient funds on exchange {self.th.exchange.name} for trade set "
+                             f"{self.name}. Trade set is deactivated now and not updated anymore "
+                             f"(open orders are still open)! Free the missing funds and reactivate. \n {error}.",
+                             extra=self.th.logger_extras)
+                raise error
+            elif error is not None:
+                raise error
 
     def cancel_order(self, oid, typ):
         self.th.update_down_state(True)
         symbol = self.symbol
         try:
-            return self.safe_run(lambda: self.th.exchange.cancel_order(oid, symbol), False)
+            return self.th.profile.call(
+                'cancel_order', lambda params: self.safe_run(
+                    lambda: self.th.exchange.cancel_order(oid, symbol, params), False), {'type': typ})
         except OrderNotFound as e:
             self.unlock_trade_set()
             raise e
-        except ExchangeError:
-            return self.safe_run(lambda: self.th.exchange.cancel_order(oid, symbol, {'type': typ}), i_ts=self.get_uid())
+
+    def place_candle_level(self, i_trade: int):
+        """
+        Places the order of a candle-above buy level whose candle closed above the chosen value
+
+        :param i_trade: Index of the buy level
+        """
+        trade = self.in_trades[i_trade]
+        response = self.safe_run(lambda: self.th.exchange.createLimitBuyOrder(self.symbol, trade['amount'],
+                                                                              trade['price']), i_ts=self.get_uid())
+        trade['oid'] = response['id']
+        self.th.ledger.order_placed(self.symbol, 'buy', trade['amount'], trade['price'])
+        self.update_triggers()
+        logger.info('%s candle of %s above %s triggering buy level #%d on %s!' % (
+            trade.get('candleTimeframe', '1d'), self.symbol, self.th.nf.price2Prec(self.symbol, trade['candleAbove']),
+            i_trade, self.th.exchange.name), extra=self.th.logger_extras)
+
+    def wait_for_order(self, response: Dict, typ, timeout: float = 5) -> Dict:
+        """
+        Waits until an order is closed or the timeout is reached, polling the order with increasing intervals. If the
+        response of the order creation already reports the order as closed, it is used directly.
+
+        :param response: Response of the order creation
+        :param typ: 'BUY' or 'SELL'
+        :param timeout: Maximum time to wait in seconds
+        :return: The latest order info
+        """
+        if response.get('status') in ['closed', 'canceled'] and response.get('type') is not None and \
+                response.get('amount') is not None:
+            return response
+        deadline = time.time() + timeout
+        delay = 0.2
+        while True:
+            order_info = self.fetch_order(response['id'], typ)
+            if order_info['status'].lower() in ['closed', 'filled', 'canceled'] or time.time() >= deadline:
+                return order_info
+            time.sleep(min(delay, max(0., deadline - time.time())))
+            delay *= 2
+
+    def fetch_orders(self, oids, typ) -> Dict[str, Dict]:
+        """
+        Fetches several orders of the trade set, with one request if the exchange allows to fetch all orders of a symbol
+
+        :param oids: List of order ids
+        :param typ: 'BUY' or 'SELL'
+        :return: Dictionary of the order infos per order id
+        """
+        order_infos = {}
+        if len(oids) > 1 and self.th.exchange.has['fetchOrders']:
+            try:
+                order_infos = {order['id']: order for order in
+                               self.safe_run(lambda: self.th.exchange.fetchOrders(self.symbol), False)
+                               if order['id'] in oids}
+            except ExchangeError:
+                pass
+        for oid in oids:
+            if oid not in order_infos:
+                # not all exchanges return all past orders
+                order_infos[oid] = self.fetch_order(oid, typ)
+        return order_infos
 
     def fetch_order(self, oid, typ):
         symbol = self.symbol
         try:
-            return self.safe_run(lambda: self.th.exchange.fetch_order(oid, symbol), False)
+            return self.th.profile.call(
+                'fetch_order', lambda params: self.safe_run(
+                    lambda: self.th.exchange.fetch_order(oid, symbol, params), False), {'type': typ})
         except OrderNotFound as e:
             self.unlock_trade_set()
             raise e
-        except ExchangeError:
-            return self.safe_run(lambda: self.th.exchange.fetch_order(oid, symbol, {'type': typ}), i_ts=self.get_uid())
 
     def add_init_coins(self, init_price=None, init_coins=0):
         if self.th.check_num(init_coins, init_price) or (init_price is None and self.th.check_num(init_coins)):
             if init_price is not None and init_price < 0:
                 init_price = None
             # check if free balance is indeed sufficient
-            bal = self.th.get_balance(self.coinCurrency)
+            bal = self.th.get_balance(self.coinCurrency, exclude=self.get_uid())
             if bal is None:
                 logger.warning('Free balance could not be determined as exchange does not support this! '
                                'If free balance does not suffice for initial coins there will be an error when trade '
@@ -805,7 +2244,7 @@ class BaseTradeSet:
             elif bal < init_coins:
                 logger.error('Adding initial balance failed: %s %s requested but only %s %s are free!' % (
                     self.th.nf.amount2Prec(self.symbol, init_coins), self.coinCurrency,
-                    self.th.nf.amount2Prec(self.symbol, self.th.get_balance(self.coinCurrency)),
+                    self.th.nf.amount2Prec(self.symbol, bal),
                     self.coinCurrency),
                              extra=self.th.logger_extras)
                 return 0
@@ -821,8 +2260,7 @@ class BaseTradeSet:
         if self.th.check_num(amount):
             self.th.update_down_state(True)
             price = self.th.get_price_obj(self.symbol).get_current_price()
-            est_fee = self.th.exchange.calculate_fee(self.symbol, 'market', 'buy', amount, price, 'taker')
-            do_cost_buy = False
+            est_fee = self.th.fees.calculate_fee(self.symbol, 'buy', amount, price, 'taker')
             if currency == self.coinCurrency:
                 cost = amount * price
                 if not self.th.check_quantity(self.symbol, 'amount', amount):
@@ -831,7 +2269,6 @@ class BaseTradeSet:
                     return 0
 
             elif currency == self.baseCurrency:
-                do_cost_buy = True
                 cost = amount
                 amount = cost / price
                 if not self.th.check_quantity(self.symbol, 'cost', cost):
@@ -857,24 +2294,11 @@ class BaseTradeSet:
                 params['trading_agreement'] = 'agree'
 
             try:
-                if 'createMarketBuyOrderRequiresPrice' in self.th.exchange.options:
-                    # this means the exchange assumes costs as input
-                    old_val = self.th.exchange.options['createMarketBuyOrderRequiresPrice']
-                    if do_cost_buy:
-                        self.th.exchange.options['createMarketBuyOrderRequiresPrice'] = False
-                        response = self.safe_run(lambda: self.th.exchange.createMarketBuyOrder(self.symbol, cost,
-                                                                                               params=params), False)
-                    else:
-                        self.th.exchange.options['createMarketBuyOrderRequiresPrice'] = True
-                        response = self.safe_run(
-                            lambda: self.th.exchange.createOrder(self.symbol, 'market', 'buy', amount, price,
-                                                                 params=params), False)
-                    self.th.exchange.options['createMarketBuyOrderRequiresPrice'] = old_val
-                else:
-                    # this means the exchange assumes amount as input
-                    response = self.safe_run(lambda: self.th.exchange.createMarketBuyOrder(self.symbol, amount,
-                                                                                           params=params), False)
+                response = self.safe_run(lambda: ExchangeProfile.create_market_buy_order(
+                    self.th.exchange, self.symbol, amount, price, cost if currency == self.baseCurrency else None,
+                    params), False)
 
+                self.th.ledger.mark_dirty()
                 bought_amount = amount - (est_fee['cost'] if est_fee['currency'] == self.coinCurrency else 0)
                 self.in_trades.append({'oid': response['id'], 'price': price,
                                       'amount': amount,
@@ -882,6 +2306,7 @@ class BaseTradeSet:
                                       'candleAbove': None})
 
             except InsufficientFunds as e:
+                self.th.ledger.mark_dirty()
                 self.deactivate()
                 logger.error(f"Insufficient funds on exchange {self.th.exchange.name} for trade set "
                              f"#{self.th.exchange.name}. Trade set is deactivated now and not updated anymore "
@@ -894,20 +2319,23 @@ class BaseTradeSet:
         else:
             raise ValueError('Some input was no number')
 
-    def add_buy_level(self, buy_price: float, buy_amount, candle_above=None, lock=True) -> bool:
+    def add_buy_level(self, buy_price: float, buy_amount, candle_above=None, lock=True,
+                      candle_timeframe: str = None) -> bool:
         """
 
         :param buy_price:
         :param buy_amount: If buy price is None, this is the cost (quote currency), else the amount of the coin currency
         :param candle_above:
         :param lock: Boolean if trade set should be locked
+        :param candle_timeframe: Timeframe of the candle that has to close above candle_above, defaults to the
+        candle timeframe of the trade handler
         :return: Boolean if buy level add succeeded
         """
         self.th.update_down_state(True)
         if self.th.check_num(buy_price, buy_amount, candle_above) or (
                 candle_above is None and self.th.check_num(buy_price, buy_amount)):
 
-            fee = self.th.exchange.calculate_fee(self.symbol, 'limit', 'buy', buy_amount, buy_price, 'maker')
+            fee = self.th.fees.calculate_fee(self.symbol, 'buy', buy_amount, buy_price, 'maker')
             if not self.th.check_quantity(self.symbol, 'amount', buy_amount):
                 logger.error('Adding buy level failed, amount is not within the range, the exchange accepts',
                              extra=self.th.logger_extras)
@@ -943,7 +2371,8 @@ class BaseTradeSet:
                 bought_amount -= fee['cost']
 
             self.in_trades.append({'oid': None, 'price': buy_price, 'amount': buy_amount, 'actualAmount': bought_amount,
-                                  'candleAbove': candle_above})
+                                  'candleAbove': candle_above,
+                                  'candleTimeframe': candle_timeframe or self.th.candle_timeframe})
 
             if wasactive:
                 self.activate(False)
@@ -974,7 +2403,7 @@ class BaseTradeSet:
                 logger.error('This order is already filled! No change possible', extra=self.th.logger_extras)
                 return 0
             else:
-                fee = self.th.exchange.calculate_fee(self.symbol, 'limit', 'buy', amount, price, 'maker')
+                fee = self.th.fees.calculate_fee(self.symbol, 'buy', amount, price, 'maker')
                 if not self.th.check_quantity(self.symbol, 'amount', amount):
                     logger.error('Changing buy level failed, amount is not within the range, the exchange accepts',
                                  extra=self.th.logger_extras)
@@ -1006,6 +2435,20 @@ class BaseTradeSet:
                                                                                                   self.coinCurrency):
                     bought_amount -= fee['cost']
 
+                if self.is_active() and self.in_trades[i_trade]['oid'] is not None:
+                    # only the order of this level needs to be changed
+                    self.lock_trade_set()
+                    try:
+                        if self.in_trades[i_trade]['oid'] == 'filled' or \
+                                self.replace_level_order('buy', i_trade, price, amount) == 0.5:
+                            logger.error('Changing buy level failed, the order was (partly) filled in the meantime!',
+                                         extra=self.th.logger_extras)
+                            return 0
+                        self.in_trades[i_trade]['actualAmount'] = bought_amount
+                    finally:
+                        self.unlock_trade_set()
+                    return 1
+
                 wasactive = self.deactivate()
 
                 if self.in_trades[i_trade]['oid'] is not None and self.in_trades[i_trade]['oid'] != 'filled':
@@ -1091,6 +2534,19 @@ class BaseTradeSet:
                     logger.error('Changing sell level failed, return is not within the range, the exchange accepts',
                                  extra=self.th.logger_extras)
                     return 0
+                if self.is_active() and self.out_trades[i_trade]['oid'] is not None:
+                    # only the order of this level needs to be changed
+                    self.lock_trade_set()
+                    try:
+                        if self.out_trades[i_trade]['oid'] == 'filled' or \
+                                self.replace_level_order('sell', i_trade, price, amount) == 0.5:
+                            logger.error('Changing sell level failed, the order was (partly) filled in the meantime!',
+                                         extra=self.th.logger_extras)
+                            return 0
+                    finally:
+                        self.unlock_trade_set()
+                    return 1
+
                 wasactive = self.deactivate()
 
                 if self.out_trades[i_trade]['oid'] is not None and self.out_trades[i_trade]['oid'] != 'filled':
@@ -1106,14 +2562,62 @@ class BaseTradeSet:
         else:
             raise ValueError('Some input was no number')
 
+    def replace_level_order(self, direction, i_trade, price, amount):
+        """
+        Moves the open order of a buy or sell level to a new price and amount, using editOrder if the exchange supports
+        it natively, otherwise by canceling and placing only the order of this level
+
+        :param direction: 'buy' or 'sell'
+        :param i_trade: Index of the level
+        :param price: New price
+        :param amount: New amount
+        :return: 1 if successful, 0.5 if the order was (partly) filled before it could be changed
+        """
+        trade = (self.in_trades if direction == 'buy' else self.out_trades)[i_trade]
+        if self.th.exchange.has.get('editOrder') is True:
+            try:
+                response = self.safe_run(lambda: self.th.exchange.editOrder(trade['oid'], self.symbol, 'limit',
+                                                                            direction, amount, price),
+                                         i_ts=self.get_uid())
+                self.th.ledger.order_canceled(self.symbol, direction, trade['amount'], trade['price'])
+                self.th.ledger.order_placed(self.symbol, direction, amount, price)
+                trade.update({'oid': response['id'], 'amount': amount, 'price': price})
+                return 1
+            except ExchangeError:
+                # e.g. order was filled in the meantime, which is checked when canceling it
+                pass
+        if self.cancel_orders(direction, trade['oid']) == 0.5:
+            return 0.5
+        trade.update({'amount': amount, 'price': price})
+        if direction == 'buy' and trade['candleAbove'] is not None or \
+                direction == 'sell' and self.coins_avail() < amount:
+            # order is placed later on, as for any other level
+            return 1
+        try:
+            response = self.safe_run(lambda: self.th.exchange.createOrder(self.symbol, 'limit', direction, amount,
+                                                                          price), i_ts=self.get_uid())
+        except InsufficientFunds as e:
+            self.th.ledger.mark_dirty()
+            logger.error(f"Insufficient funds on exchange {self.th.exchange.name} for changed {direction} level "
+                         f"#{i_trade} of trade set {self.name}. It will be placed again during the next update.\n {e}",
+                         extra=self.th.logger_extras)
+            return 1
+        trade['oid'] = response['id']
+        self.th.ledger.order_placed(self.symbol, direction, amount, price)
+        return 1
+
     def sell_free_bal(self) -> Union[None, dict]:
-        free_bal = self.th.get_balance(self.coinCurrency)
+        # the exchange reported insufficient funds, so the local balance has to be refreshed
+        self.th.ledger.mark_dirty()
+        self.th.reconcile_balance()
+        # the coins of this trade set are reserved for it, so they have to be counted as free
+        free_bal = self.th.get_balance(self.coinCurrency, exclude=self.get_uid())
         if free_bal is None:
             logger.error(f"When selling {self.symbol}, exchange reported insufficient funds and does not allow to "
                          f"determine free balance of {self.coinCurrency}, thus nothing could be sold automatically! "
                          f"Please sell manually!", extra=self.th.logger_extras)
             return None
-        elif free_bal == 0:
+        elif free_bal <= 0:
             logger.error(f"When selling {self.symbol}, exchange reported insufficient funds. Please sell manually!",
                          extra=self.th.logger_extras)
             return None
@@ -1139,10 +2643,12 @@ class BaseTradeSet:
             self.sl = None
         else:
             raise ValueError('Input was no number')
+        self.update_triggers()
 
     def set_weekly_close_sl(self, value) -> bool:
         if self.th.check_num(value):
             self.sl = WeeklyCloseSL(value=value)
+            self.update_triggers()
             if self.th.get_price_obj(self.symbol).get_current_price() <= value:
                 logger.warning('Weekly-close SL is set but be aware that it is higher than the current market price!',
                                extra=self.th.logger_extras)
@@ -1150,6 +2656,7 @@ class BaseTradeSet:
 
         elif value is None:
             self.sl = None
+            self.update_triggers()
             return True
         else:
             raise ValueError('Input was no number')
@@ -1157,12 +2664,14 @@ class BaseTradeSet:
     def set_daily_close_sl(self, value) -> bool:
         if self.th.check_num(value):
             self.sl = DailyCloseSL(value=value)
+            self.update_triggers()
             if self.th.get_price_obj(self.symbol).get_current_price() <= value:
                 logger.warning('Daily-close SL is set but be aware that it is higher than the current market price!',
                                extra=self.th.logger_extras)
             return True
         elif value is None:
             self.sl = None
+            self.update_triggers()
             return True
         else:
             raise ValueError('Input was no number')
@@ -1171,11 +2680,13 @@ class BaseTradeSet:
         if self.th.check_num(value):
             try:
                 self.sl = BaseSL(value=value)
+                self.update_triggers()
                 return True
             except Exception as e:
                 logger.error(str(e), extra=self.th.logger_extras)
         elif value is None:
             self.sl = None
+            self.update_triggers()
             return True
         else:
             raise ValueError('Input was no number')
@@ -1198,7 +2709,7 @@ class BaseTradeSet:
                          extra=self.th.logger_extras)
             return 0
         else:
-            break_even_price = (self.cost_in() - self.cost_out()) / ((1 - self.th.exchange.fees['trading']['taker']) * (
+            break_even_price = (self.cost_in() - self.cost_out()) / ((1 - self.th.fees.get_rate(self.symbol, 'taker')) * (
                     self.coins_avail() + self.sum_sell_amounts(order='open', subtract_fee=False)))
             price_obj = self.th.get_price_obj(self.symbol)
             if price_obj.get_current_price() < break_even_price:
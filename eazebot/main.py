@@ -3,6 +3,7 @@ import json
 import logging
 import re
 import shutil
+import signal
 import sys
 from logging.handlers import RotatingFileHandler
 import os
@@ -46,6 +47,8 @@ def main(sysargv=None):
                         help='calls a dialog to fill out the configs interactively')
     parser.add_argument('-n', '--no-warning', dest='warning', action='store_false', required=False,
                         help='does not warn for preexisting config files when running the --init flag')
+    parser.add_argument('--headless', dest='headless', action='store_true', required=False,
+                        help='runs the trade set updates without Telegram')
     parser.add_argument('-d', '--user-dir', dest='user_dir', default=None, type=check_dir_arg, required=False,
                         help="Absolute or relative path to the user folder")
 
@@ -101,6 +104,47 @@ def main(sysargv=None):
             config['extraBackupInterval'] = 7
         if 'maxBackupFileCount' not in config:
             config['maxBackupFileCount'] = 12
+        if 'slWatchInterval' not in config:
+            config['slWatchInterval'] = 10
+        if isinstance(config['slWatchInterval'], str):
+            config['slWatchInterval'] = int(config['slWatchInterval'])
+        if 'minUpdateInterval' not in config:
+            config['minUpdateInterval'] = 0
+        if isinstance(config['minUpdateInterval'], str):
+            config['minUpdateInterval'] = int(config['minUpdateInterval'])
+        if 'dormancyTimeout' not in config:
+            config['dormancyTimeout'] = 30
+        if isinstance(config['dormancyTimeout'], str):
+            config['dormancyTimeout'] = int(config['dormancyTimeout'])
+        if 'balanceReconcileInterval' not in config:
+            config['balanceReconcileInterval'] = 15
+        if isinstance(config['balanceReconcileInterval'], str):
+            config['balanceReconcileInterval'] = int(config['balanceReconcileInterval'])
+        if 'candleTimeframe' not in config:
+            config['candleTimeframe'] = '1d'
+        if 'persistPriceHistory' not in config:
+            config['persistPriceHistory'] = False
+        if isinstance(config['persistPriceHistory'], str):
+            config['persistPriceHistory'] = bool(int(config['persistPriceHistory']))
+        if 'recordTraffic' not in config:
+            config['recordTraffic'] = False
+        if isinstance(config['recordTraffic'], str):
+            config['recordTraffic'] = bool(int(config['recordTraffic']))
+        if 'statsFile' not in config:
+            config['statsFile'] = ''
+        if 'nativeStopLoss' not in config:
+            config['nativeStopLoss'] = False
+        if isinstance(config['nativeStopLoss'], str):
+            config['nativeStopLoss'] = bool(int(config['nativeStopLoss']))
+
+        if args.headless:
+            from eazebot.engine import Engine
+            engine = Engine(config=config)
+            signal.signal(signal.SIGINT, lambda *_: engine.stop())
+            signal.signal(signal.SIGTERM, lambda *_: engine.stop())
+            engine.load()
+            engine.run()
+            return engine
 
         telegram_handler = TelegramHandler(Bot(token=config['telegramAPI']), level='INFO')
         telegram_handler.setFormatter(logging.Formatter("%(levelname)s:  %(message)s"))
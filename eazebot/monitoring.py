@@ -0,0 +1,338 @@
+"""Timing statistics of the trade set updates and accounting of the exchange API calls"""
+import functools
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# feature of the bot (e.g. the update cycle or the status render) that the API calls of the current thread belong to
+_api_context = threading.local()
+
+
+class RollingHistogram:
+    """
+    Durations of the last *window* samples, from which the quantiles are computed. Count and sum are kept over all
+    samples, as Prometheus expects them to be monotonic.
+    """
+    quantiles = [0.5, 0.9, 0.99]
+
+    def __init__(self, window: int = 500):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def get_quantiles(self) -> Dict[float, float]:
+        if not self.samples:
+            return {q: float('nan') for q in self.quantiles}
+        values = np.quantile(np.array(self.samples), self.quantiles)
+        return dict(zip(self.quantiles, values))
+
+    def mean(self) -> float:
+        return float(np.mean(self.samples)) if self.samples else float('nan')
+
+
+class UpdateTimer:
+    """
+    Stopwatch of one update cycle. Each lap attributes the time since the previous lap to a phase (and optionally to a
+    trade set), the sums are handed to the UpdateStats when the cycle is finished.
+    """
+    def __init__(self, stats: 'UpdateStats'):
+        self.stats = stats
+        self.start = self.last = time.perf_counter()
+        self.phases = {}
+        self.trade_sets = {}
+
+    def mark(self):
+        # starts the next lap without attributing the time passed since the last one
+        self.last = time.perf_counter()
+
+    def lap(self, phase: str, i_ts: str = None):
+        now = time.perf_counter()
+        duration = now - self.last
+        self.last = now
+        self.phases[phase] = self.phases.get(phase, 0) + duration
+        if i_ts is not None:
+            phases = self.trade_sets.setdefault(i_ts, {})
+            phases[phase] = phases.get(phase, 0) + duration
+
+    def finish(self):
+        self.stats.add_cycle(time.perf_counter() - self.start, self.phases, self.trade_sets)
+
+
+class UpdateStats:
+    """
+    Rolling histograms of the durations of the phases of tradeHandler.update per exchange and per trade set
+    """
+    phases = ['lock', 'down_state', 'balance', 'prices', 'stop_loss', 'native_sl', 'regular_buy', 'buy_checks',
+              'sell_placement', 'sell_checks', 'deletions']
+    window = 500
+    trade_set_window = 50
+
+    def __init__(self, exch_name: str):
+        self.exch_name = exch_name
+        self.total = RollingHistogram(self.window)
+        self.histograms = {phase: RollingHistogram(self.window) for phase in self.phases}
+        self.trade_sets = {}
+        self._lock = threading.Lock()
+
+    def start_cycle(self) -> UpdateTimer:
+        return UpdateTimer(self)
+
+    def add_cycle(self, total: float, phases: Dict[str, float], trade_sets: Dict[str, Dict[str, float]]):
+        with self._lock:
+            self.total.add(total)
+            for phase in self.phases:
+                self.histograms[phase].add(phases.get(phase, 0))
+            for i_ts, ts_phases in trade_sets.items():
+                if i_ts not in self.trade_sets:
+                    self.trade_sets[i_ts] = {phase: RollingHistogram(self.trade_set_window) for phase in self.phases}
+                for phase, duration in ts_phases.items():
+                    self.trade_sets[i_ts][phase].add(duration)
+
+    def forget(self, i_ts: str):
+        # removes the statistics of a deleted trade set
+        with self._lock:
+            self.trade_sets.pop(i_ts, None)
+
+    def slowest_trade_sets(self, n: int = 3) -> List:
+        # returns the trade sets with the highest mean update duration as list of (uid, duration)
+        with self._lock:
+            durations = [(i_ts, sum([hist.mean() for hist in hists.values() if hist.count]))
+                         for i_ts, hists in self.trade_sets.items()]
+        return sorted(durations, key=lambda x: x[1], reverse=True)[:n]
+
+    def get_info(self, names: Dict[str, str] = None) -> str:
+        """
+        Returns a text summary of the update durations
+
+        :param names: Dict of trade set uid -> trade set name used in the summary
+        :return: The text
+        """
+        if self.total.count == 0:
+            return f"<b>{self.exch_name}</b>: no update cycle recorded yet\n"
+        quantiles = self.total.get_quantiles()
+        string = f"<b>{self.exch_name}</b>: {self.total.count} update cycles, median {quantiles[0.5]:.2f} s, " \
+                 f"90% {quantiles[0.9]:.2f} s\n"
+        for phase in self.phases:
+            hist = self.histograms[phase]
+            if hist.mean() >= 0.0005:
+                string += f"  {phase}: mean {hist.mean():.3f} s, 90% {hist.get_quantiles()[0.9]:.3f} s\n"
+        slowest = self.slowest_trade_sets()
+        if slowest:
+            string += '  slowest trade sets: ' + ', '.join(
+                [f"{(names or {}).get(i_ts, i_ts)} ({duration:.2f} s)" for i_ts, duration in slowest]) + '\n'
+        return string
+
+    def to_prometheus(self, labels: Dict[str, str]) -> List[str]:
+        """
+        Returns the samples of the phase histograms in the Prometheus text format
+
+        :param labels: Labels added to all samples, e.g. the user
+        :return: List of lines without the HELP/TYPE lines
+        """
+        lines = []
+        with self._lock:
+            histograms = dict(self.histograms, total=self.total)
+            for phase, hist in histograms.items():
+                label_str = ','.join([f'{key}="{value}"' for key, value in
+                                      dict(labels, exchange=self.exch_name, phase=phase).items()])
+                for q, value in hist.get_quantiles().items():
+                    lines.append(f'eazebot_update_phase_seconds{{{label_str},quantile="{q}"}} {value}')
+                lines.append(f'eazebot_update_phase_seconds_sum{{{label_str}}} {hist.sum}')
+                lines.append(f'eazebot_update_phase_seconds_count{{{label_str}}} {hist.count}')
+        return lines
+
+
+def write_prometheus_file(file: str, stats: Iterable, labels: Optional[List[Dict[str, str]]] = None):
+    """
+    Writes the update statistics to a text file that can be read by the textfile collector of the Prometheus node
+    exporter. The file is replaced atomically, so that the collector never reads a partly written file.
+
+    :param file: Path of the file (should end with .prom)
+    :param stats: UpdateStats objects
+    :param labels: Labels per UpdateStats object
+    """
+    stats = list(stats)
+    labels = labels or [{}] * len(stats)
+    lines = ['# HELP eazebot_update_phase_seconds Duration of the phases of the trade set update cycle',
+             '# TYPE eazebot_update_phase_seconds summary']
+    for stat, label in zip(stats, labels):
+        lines.extend(stat.to_prometheus(label))
+    with open(file + '.tmp', 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+    os.replace(file + '.tmp', file)
+
+
+def get_api_feature() -> str:
+    return getattr(_api_context, 'feature', 'other')
+
+
+def set_api_feature(feature: str) -> str:
+    """
+    Attributes all following API calls of the current thread to a feature (until it is set again or the enclosing
+    function decorated with api_feature returns)
+
+    :param feature: Name of the feature
+    :return: The previous feature
+    """
+    previous = get_api_feature()
+    _api_context.feature = feature
+    return previous
+
+
+def api_feature(feature: str):
+    # decorator attributing the API calls made during the decorated function to a feature
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            previous = set_api_feature(feature)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _api_context.feature = previous
+        return wrapper
+    return decorator
+
+
+class ApiAccounting:
+    """
+    Counts the requests of a ccxt exchange per endpoint and per feature of the bot, together with their rate limit
+    weight, response size, latency and errors. It wraps fetch2 of the exchange, through which all REST requests of ccxt
+    go. The latency is the duration of the http request, without the wait for the rate limiter.
+    """
+    # response headers with the used rate limit weight of the current minute (Binance)
+    weight_headers = ['x-mbx-used-weight-1m', 'x-mbx-used-weight']
+    fields = ['calls', 'weight', 'bytes', 'latency', 'errors']
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.endpoints = {}
+        self.features = {}
+        self.error_types = {}
+        self.last_cycle = self.totals()
+        self.used_weight = None
+        self.used_minute = None
+        self._lock = threading.Lock()
+        # response of the request of the current thread, the last_... attributes of the exchange are shared by all
+        self._response = threading.local()
+        fetch2 = exchange.fetch2
+        fetch = exchange.fetch
+        on_rest_response = exchange.on_rest_response
+
+        def accounted_fetch2(path, api='public', method='GET', params={}, headers=None, body=None):
+            start = time.perf_counter()
+            error = None
+            self._response.headers, self._response.size, self._response.latency = None, 0, None
+            try:
+                return fetch2(path, api, method, params, headers, body)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                # exchanges without http request (e.g. the paper exchange) are timed as a whole
+                latency = self._response.latency if self._response.latency is not None else \
+                    time.perf_counter() - start
+                self.record(f"{api} {path}", get_api_feature(), latency, self._response.size, self._response.headers,
+                            error)
+
+        def accounted_fetch(url, method='GET', headers=None, body=None):
+            # only the http request is timed, not the wait of the rate limiter in fetch2
+            start = time.perf_counter()
+            try:
+                return fetch(url, method, headers, body)
+            finally:
+                self._response.latency = time.perf_counter() - start
+
+        def accounted_on_rest_response(code, reason, url, method, response_headers, response_body, request_headers,
+                                       request_body):
+            # called by ccxt in the thread of the request with the raw response
+            self._response.headers, self._response.size = response_headers, len(response_body or '')
+            return on_rest_response(code, reason, url, method, response_headers, response_body, request_headers,
+                                    request_body)
+        exchange.fetch2 = accounted_fetch2
+        exchange.fetch = accounted_fetch
+        exchange.on_rest_response = accounted_on_rest_response
+
+    def get_weight(self, headers: Optional[Dict] = None) -> int:
+        # weight of a request, derived from the used weight reported by the exchange, 1 if not reported
+        # has to be called with the lock held, as it updates the used weight
+        headers = headers or {}
+        for header in self.weight_headers:
+            if header in headers:
+                try:
+                    used = int(headers[header])
+                except ValueError:
+                    break
+                minute = int(time.time() // 60)
+                if self.used_weight is None or minute != self.used_minute:
+                    # first request or a new minute started
+                    self.used_weight, self.used_minute = used, minute
+                    return max(used, 1)
+                if used <= self.used_weight:
+                    # response of a concurrent request that arrived late, its weight is included in a later one
+                    return 0
+                previous, self.used_weight = self.used_weight, used
+                return used - previous
+        return 1
+
+    def record(self, endpoint: str, feature: str, latency: float, n_bytes: int, headers: Optional[Dict] = None,
+               error: Exception = None):
+        with self._lock:
+            weight = self.get_weight(headers)
+            for key, table in [(endpoint, self.endpoints), (feature, self.features)]:
+                entry = table.setdefault(key, dict.fromkeys(self.fields, 0))
+                entry['calls'] += 1
+                entry['weight'] += weight
+                entry['bytes'] += n_bytes
+                entry['latency'] += latency
+                entry['errors'] += error is not None
+            if error is not None:
+                self.error_types[type(error).__name__] = self.error_types.get(type(error).__name__, 0) + 1
+
+    def totals(self) -> Dict[str, float]:
+        totals = dict.fromkeys(self.fields, 0)
+        for entry in list(self.features.values()):
+            for field in self.fields:
+                totals[field] += entry[field]
+        return totals
+
+    @staticmethod
+    def format(entry: Dict[str, float]) -> str:
+        return f"{entry['calls']} calls, weight {entry['weight']}, {entry['bytes'] / 1e3:.1f} kB, " \
+               f"{entry['latency'] / entry['calls'] * 1e3 if entry['calls'] else 0:.0f} ms avg, {entry['errors']} errors"
+
+    def cycle_summary(self) -> str:
+        # summary of the calls since the last call of this method
+        with self._lock:
+            totals = self.totals()
+            cycle = {field: totals[field] - self.last_cycle[field] for field in self.fields}
+            self.last_cycle = totals
+        return self.format(cycle)
+
+    def get_info(self, n: int = 3) -> str:
+        """
+        Returns a text summary of all calls since the start
+
+        :param n: Number of endpoints with the highest weight that are listed
+        :return: The text
+        """
+        with self._lock:
+            string = f"API calls: {self.format(self.totals())}\n"
+            for feature, entry in sorted(self.features.items(), key=lambda x: x[1]['weight'], reverse=True):
+                string += f"  {feature}: {self.format(entry)}\n"
+            top = sorted(self.endpoints.items(), key=lambda x: x[1]['weight'], reverse=True)[:n]
+            if top:
+                string += '  top endpoints: ' + ', '.join([f"{endpoint} ({entry['weight']})"
+                                                           for endpoint, entry in top]) + '\n'
+            if self.error_types:
+                string += '  errors: ' + ', '.join([f"{typ} ({count})" for typ, count in self.error_types.items()]) + \
+                          '\n'
+        return string
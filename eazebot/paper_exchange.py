@@ -0,0 +1,452 @@
+"""Simulated exchange for paper trading, running EazeBot without exchange keys"""
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+import ccxt
+import numpy as np
+from ccxt.base.decimal_to_precision import DECIMAL_PLACES
+from ccxt.base.errors import InsufficientFunds, InvalidOrder, NetworkError, OrderNotFound, BadSymbol
+
+
+class PricePath:
+    """
+    Price path of a symbol. Either a given array of prices is walked through or a geometric random walk is generated.
+    """
+    def __init__(self, start: float, prices: List[float] = None, volatility: float = 0.002, seed: int = None):
+        """
+
+        :param start: Start price, used if no prices are given
+        :param prices: Optional list of prices that are walked through one by one (and repeated afterwards)
+        :param volatility: Standard deviation of the log returns per step of the random walk
+        :param seed: Seed of the random walk
+        """
+        self.prices = None if prices is None else np.asarray(prices, dtype=float)
+        self.volatility = volatility
+        self.rng = np.random.default_rng(seed)
+        self.step_count = 0
+        self.price = float(self.prices[0]) if self.prices is not None else float(start)
+
+    def step(self) -> float:
+        self.step_count += 1
+        if self.prices is not None:
+            self.price = float(self.prices[self.step_count % len(self.prices)])
+        else:
+            self.price *= float(np.exp(self.rng.normal(0, self.volatility)))
+        return self.price
+
+
+class PaperExchange(ccxt.Exchange):
+    """
+    In-process simulation of the part of the ccxt API that EazeBot uses. Limit orders are matched against the price
+    paths of the symbols, market orders are filled immediately at the current bid/ask. Request latency and random
+    network failures can be injected. The batch endpoints createOrders and cancelOrders and the cancel-replace endpoint
+    editOrder are simulated as well, so that paper trading uses the same code paths as exchanges offering them.
+
+    Options (given in the APIs.json entry under "options"):
+
+    + markets: dict of symbol -> {"price": start price, "prices": optional price list, "amountPrecision",
+      "pricePrecision", "minAmount", "minCost"}
+    + balance: dict of currency -> free start balance
+    + tickInterval: seconds after which the prices move one step (default 10), 0 means prices only move when step() is
+      called
+    + volatility: standard deviation of the log returns per step of the random walks
+    + spread: relative spread between bid and ask
+    + latency: seconds every request takes
+    + failureRate: probability with which a request raises a NetworkError
+    + seed: seed of all random numbers, making runs reproducible
+    + stateFile: json file in which prices, balances, orders and trades are saved after each change and from which they
+      are restored on start, so that the orders of the trade sets still exist after a restart of the bot
+    """
+    default_markets = {'ETH/BTC': {'price': 0.06}, 'BTC/USDT': {'price': 40000}, 'ETH/USDT': {'price': 2400},
+                       'BNB/BTC': {'price': 0.008}, 'BNB/USDT': {'price': 320}}
+    default_balance = {'BTC': 1, 'USDT': 10000, 'ETH': 10, 'BNB': 10}
+    # the market data is generated per instance and must not be shared with other instances (e.g. candle caches)
+    simulated = True
+
+    def describe(self):
+        return self.deep_extend(super().describe(), {
+            'id': 'paper',
+            'name': 'Paper',
+            'rateLimit': 0,
+            'precisionMode': DECIMAL_PLACES,
+            'has': {
+                'cancelOrder': True,
+                'cancelOrders': True,
+                'createOrders': True,
+                'createLimitOrder': True,
+                'createMarketOrder': True,
+                'editOrder': True,
+                'fetchBalance': True,
+                'fetchMyTrades': True,
+                'fetchOHLCV': True,
+                'fetchOpenOrders': True,
+                'fetchOrder': True,
+                'fetchOrders': True,
+                'fetchTicker': True,
+                'fetchTickers': True,
+                'fetchTradingFees': True,
+            },
+            'timeframes': {'1m': '1m', '1h': '1h', '4h': '4h', '1d': '1d', '1w': '1w'},
+            'fees': {'trading': {'maker': 0.001, 'taker': 0.001}},
+            'options': {
+                'markets': None,
+                'balance': None,
+                'tickInterval': 10,
+                'volatility': 0.002,
+                'spread': 0.001,
+                'latency': 0,
+                'failureRate': 0,
+                'seed': None,
+                'stateFile': None,
+            },
+        })
+
+    def __init__(self, config: Dict = None):
+        super().__init__(config or {})
+        self._lock = threading.RLock()
+        self.rng = random.Random(self.options['seed'])
+        market_options = self.options['markets'] or self.default_markets
+        self.paths = {symbol: PricePath(opts.get('price', 1), opts.get('prices'), self.options['volatility'],
+                                        None if self.options['seed'] is None else self.options['seed'] + n)
+                      for n, (symbol, opts) in enumerate(market_options.items())}
+        # tick history per symbol, used for the 24h high/low and the candles
+        self.ticks = {symbol: [(self.milliseconds(), path.price)] for symbol, path in self.paths.items()}
+        self.last_step = time.time()
+        self.paper_balance = {currency: {'free': float(amount), 'used': 0.0}
+                              for currency, amount in (self.options['balance'] or self.default_balance).items()}
+        self.orders = {}
+        self.my_trades = []
+        self.order_count = 0
+        self.request_count = 0
+        if self.options['stateFile'] and os.path.isfile(self.options['stateFile']):
+            self.load_state()
+
+    # persistence
+
+    def load_state(self):
+        with open(self.options['stateFile']) as fh:
+            state = json.load(fh)
+        with self._lock:
+            for symbol, price in state['prices'].items():
+                if symbol in self.paths:
+                    self.paths[symbol].price = price
+                    self.ticks[symbol] = [(self.milliseconds(), price)]
+            self.paper_balance = state['balance']
+            self.orders = state['orders']
+            self.my_trades = state['myTrades']
+            self.order_count = state['orderCount']
+
+    def save_state(self):
+        # the file is replaced atomically, so that a crash during saving does not lose the state
+        if not self.options['stateFile']:
+            return
+        with self._lock:
+            state = {'prices': {symbol: path.price for symbol, path in self.paths.items()},
+                     'balance': self.paper_balance, 'orders': self.orders, 'myTrades': self.my_trades,
+                     'orderCount': self.order_count}
+            if os.path.dirname(self.options['stateFile']):
+                os.makedirs(os.path.dirname(self.options['stateFile']), exist_ok=True)
+            with open(self.options['stateFile'] + '.tmp', 'w') as fh:
+                json.dump(state, fh)
+            os.replace(self.options['stateFile'] + '.tmp', self.options['stateFile'])
+
+    # simulation
+
+    def simulate_request(self, endpoint: str, api: str = 'private'):
+        # requests go through fetch2 like those of real exchanges, so that they are seen by wrappers of fetch2
+        self.fetch2(endpoint, api)
+
+    def fetch2(self, path, api='public', method='GET', params={}, headers=None, body=None):
+        # applies latency and failure injection, and moves the prices if the tick interval has passed
+        self.request_count += 1
+        if self.options['latency']:
+            time.sleep(self.options['latency'])
+        if self.options['failureRate'] and self.rng.random() < self.options['failureRate']:
+            raise NetworkError(f"{self.id} simulated network failure")
+        if self.options['tickInterval']:
+            steps = int((time.time() - self.last_step) / self.options['tickInterval'])
+            if steps > 0:
+                self.last_step += steps * self.options['tickInterval']
+                self.step(steps)
+
+    def step(self, steps: int = 1):
+        """
+        Moves the prices of all symbols by one step of their price path and matches the open orders
+
+        :param steps: Number of steps
+        """
+        with self._lock:
+            for _ in range(steps):
+                for symbol, path in self.paths.items():
+                    self.set_price(symbol, path.step())
+            self.save_state()
+
+    def set_price(self, symbol: str, price: float):
+        # sets the price of a symbol directly and matches its open orders
+        with self._lock:
+            self.paths[symbol].price = price
+            self.ticks[symbol].append((self.milliseconds(), price))
+            if len(self.ticks[symbol]) > 100000:
+                self.ticks[symbol] = self.ticks[symbol][-50000:]
+            for order in list(self.orders.values()):
+                if order['symbol'] != symbol or order['status'] != 'open':
+                    continue
+                if order['side'] == 'buy' and price <= order['price'] or \
+                        order['side'] == 'sell' and price >= order['price']:
+                    self._fill(order, order['price'], 'maker')
+
+    def _bid_ask(self, symbol: str):
+        price = self.paths[symbol].price
+        half_spread = self.options['spread'] / 2
+        return price * (1 - half_spread), price * (1 + half_spread)
+
+    def _add(self, currency: str, free: float = 0, used: float = 0):
+        entry = self.paper_balance.setdefault(currency, {'free': 0.0, 'used': 0.0})
+        entry['free'] += free
+        entry['used'] += used
+
+    def _fill(self, order: Dict, price: float, taker_or_maker: str):
+        market = self.markets[order['symbol']]
+        amount = order['remaining']
+        cost = amount * price
+        fee = self.calculate_fee(order['symbol'], order['type'], order['side'], amount, price, taker_or_maker)
+        if order['side'] == 'buy':
+            if order['type'] == 'limit':
+                # the reserved cost is released, a limit order can be filled at a better price
+                self._add(market['quote'], free=order['remaining'] * order['price'] - cost,
+                          used=-order['remaining'] * order['price'])
+            else:
+                self._add(market['quote'], free=-cost)
+            self._add(market['base'], free=amount)
+        else:
+            if order['type'] == 'limit':
+                self._add(market['base'], used=-amount)
+            else:
+                self._add(market['base'], free=-amount)
+            self._add(market['quote'], free=cost)
+        self._add(fee['currency'], free=-fee['cost'])
+        timestamp = self.milliseconds()
+        trade = {'id': str(len(self.my_trades) + 1), 'order': order['id'], 'symbol': order['symbol'],
+                 'timestamp': timestamp, 'datetime': self.iso8601(timestamp), 'type': order['type'],
+                 'side': order['side'], 'takerOrMaker': taker_or_maker, 'price': price, 'amount': amount,
+                 'cost': cost, 'fee': {'cost': fee['cost'], 'currency': fee['currency']}, 'info': {}}
+        self.my_trades.append(trade)
+        order.update({'filled': order['filled'] + amount, 'remaining': 0.0, 'cost': order['cost'] + cost,
+                      'average': price, 'status': 'closed', 'lastTradeTimestamp': timestamp,
+                      'fee': trade['fee'], 'trades': order['trades'] + [trade]})
+
+    # markets
+
+    def fetch_markets(self, params={}):
+        self.simulate_request('fetch_markets', 'public')
+        markets = []
+        for symbol, opts in (self.options['markets'] or self.default_markets).items():
+            base, quote = symbol.split('/')
+            markets.append({
+                'id': base + quote, 'symbol': symbol, 'base': base, 'quote': quote, 'baseId': base, 'quoteId': quote,
+                'active': True, 'precision': {'amount': opts.get('amountPrecision', 6),
+                                              'price': opts.get('pricePrecision', 8)},
+                'limits': {'amount': {'min': opts.get('minAmount', 10 ** -opts.get('amountPrecision', 6)),
+                                      'max': None},
+                           'price': {'min': 10 ** -opts.get('pricePrecision', 8), 'max': None},
+                           'cost': {'min': opts.get('minCost', 0), 'max': None}},
+                'info': {}})
+        return markets
+
+    def fetch_trading_fees(self, params={}):
+        self.simulate_request('fetch_trading_fees')
+        return {symbol: {'maker': self.fees['trading']['maker'], 'taker': self.fees['trading']['taker']}
+                for symbol in self.paths}
+
+    def _check_symbol(self, symbol: str):
+        self.load_markets()
+        if symbol not in self.paths:
+            raise BadSymbol(f"{self.id} does not have market symbol {symbol}")
+
+    # tickers and candles
+
+    def fetch_ticker(self, symbol: str, params={}):
+        self.simulate_request('fetch_ticker', 'public')
+        self._check_symbol(symbol)
+        return self._ticker(symbol)
+
+    def fetch_tickers(self, symbols: List[str] = None, params={}):
+        self.simulate_request('fetch_tickers', 'public')
+        self.load_markets()
+        return {symbol: self._ticker(symbol) for symbol in (symbols or self.paths) if symbol in self.paths}
+
+    def _ticker(self, symbol: str) -> Dict:
+        timestamp = self.milliseconds()
+        day = [price for tick_time, price in self.ticks[symbol] if tick_time > timestamp - 86400000]
+        bid, ask = self._bid_ask(symbol)
+        last = self.paths[symbol].price
+        return {'symbol': symbol, 'timestamp': timestamp, 'datetime': self.iso8601(timestamp), 'high': max(day),
+                'low': min(day), 'bid': bid, 'ask': ask, 'last': last, 'close': last, 'open': day[0],
+                'baseVolume': None, 'quoteVolume': None, 'info': {}}
+
+    def fetch_ohlcv(self, symbol: str, timeframe='1m', since=None, limit=None, params={}):
+        self.simulate_request('fetch_ohlcv', 'public')
+        self._check_symbol(symbol)
+        duration = self.parse_timeframe(timeframe) * 1000
+        ticks = np.array(self.ticks[symbol], dtype=float)
+        starts = ticks[:, 0] // duration * duration
+        candles = []
+        for start in np.unique(starts):
+            if since is not None and start < since:
+                continue
+            prices = ticks[starts == start, 1]
+            candles.append([int(start), prices[0], prices.max(), prices.min(), prices[-1], 0.0])
+        return candles[-limit:] if limit else candles
+
+    # balance and orders
+
+    def fetch_balance(self, params={}):
+        self.simulate_request('fetch_balance')
+        with self._lock:
+            result = {'info': {}, 'free': {}, 'used': {}, 'total': {}}
+            for currency, entry in self.paper_balance.items():
+                account = {'free': entry['free'], 'used': entry['used'], 'total': entry['free'] + entry['used']}
+                result[currency] = account
+                for typ in ['free', 'used', 'total']:
+                    result[typ][currency] = account[typ]
+            return result
+
+    def create_order(self, symbol: str, type: str, side: str, amount: float, price: float = None, params={}):
+        self.simulate_request('create_order')
+        with self._lock:
+            order = self._create_order(symbol, type, side, amount, price)
+            self.save_state()
+            return order
+
+    def create_orders(self, orders: List[Dict], params={}):
+        # batch endpoint: one request for all orders, and a failing order does not affect the others
+        self.simulate_request('create_orders')
+        results = []
+        with self._lock:
+            for order in orders:
+                try:
+                    results.append(self._create_order(order['symbol'], order['type'], order['side'],
+                                                      order['amount'], order.get('price')))
+                except (BadSymbol, InvalidOrder, InsufficientFunds) as e:
+                    results.append(e)
+            self.save_state()
+        return results
+
+    def edit_order(self, id: str, symbol: str, type: str, side: str, amount: float, price: float = None,
+                   params={}):
+        # like a cancel-replace endpoint: the order is canceled and placed anew with one request
+        self.simulate_request('edit_order')
+        self.load_markets()
+        with self._lock:
+            self._cancel_order(id, symbol)
+            try:
+                return self._create_order(symbol, type, side, amount, price)
+            finally:
+                self.save_state()
+
+    def _create_order(self, symbol: str, type: str, side: str, amount: float, price: float = None) -> Dict:
+        self._check_symbol(symbol)
+        with self._lock:
+            market = self.markets[symbol]
+            amount = float(self.amount_to_precision(symbol, amount))
+            if type == 'limit':
+                price = float(self.price_to_precision(symbol, price))
+            elif type == 'market':
+                bid, ask = self._bid_ask(symbol)
+                price = ask if side == 'buy' else bid
+            else:
+                raise InvalidOrder(f"{self.id} does not support order type {type}")
+            if amount <= 0 or amount < (market['limits']['amount']['min'] or 0) or \
+                    amount * price < (market['limits']['cost']['min'] or 0):
+                raise InvalidOrder(f"{self.id} order amount or cost is too small")
+            currency, needed = (market['quote'], amount * price) if side == 'buy' else (market['base'], amount)
+            if self.paper_balance.get(currency, {'free': 0})['free'] < needed:
+                raise InsufficientFunds(f"{self.id} account has insufficient balance for the requested action")
+            self.order_count += 1
+            timestamp = self.milliseconds()
+            order = {'id': str(self.order_count), 'clientOrderId': None, 'timestamp': timestamp,
+                     'datetime': self.iso8601(timestamp), 'lastTradeTimestamp': None, 'symbol': symbol,
+                     'type': type, 'side': side, 'price': price, 'amount': amount, 'cost': 0.0, 'average': None,
+                     'filled': 0.0, 'remaining': amount, 'status': 'open', 'fee': None, 'trades': [], 'info': {}}
+            self.orders[order['id']] = order
+            if type == 'market':
+                self._fill(order, price, 'taker')
+            else:
+                self._add(currency, free=-needed, used=needed)
+                # limit orders crossing the current price are filled immediately as taker
+                if side == 'buy' and price >= self.paths[symbol].price or \
+                        side == 'sell' and price <= self.paths[symbol].price:
+                    self._fill(order, self.paths[symbol].price, 'taker')
+            return self.extend(order, {'trades': list(order['trades'])})
+
+    def _get_order(self, id: str, symbol: Optional[str]) -> Dict:
+        if id not in self.orders or symbol is not None and self.orders[id]['symbol'] != symbol:
+            raise OrderNotFound(f"{self.id} order {id} not found")
+        return self.orders[id]
+
+    def cancel_order(self, id: str, symbol: str = None, params={}):
+        self.simulate_request('cancel_order')
+        self.load_markets()
+        with self._lock:
+            order = self._cancel_order(id, symbol)
+            self.save_state()
+            return order
+
+    def cancel_orders(self, ids: List[str], symbol: str = None, params={}):
+        # batch endpoint: all open orders are canceled, but like real exchanges the whole request fails if one of
+        # the orders is not open anymore
+        self.simulate_request('cancel_orders')
+        self.load_markets()
+        with self._lock:
+            results, missing = [], []
+            for id in ids:
+                try:
+                    results.append(self._cancel_order(id, symbol))
+                except OrderNotFound:
+                    missing.append(id)
+            self.save_state()
+        if missing:
+            raise OrderNotFound(f"{self.id} orders {', '.join(missing)} not found or not open anymore")
+        return results
+
+    def _cancel_order(self, id: str, symbol: Optional[str]) -> Dict:
+        with self._lock:
+            order = self._get_order(id, symbol)
+            if order['status'] != 'open':
+                raise OrderNotFound(f"{self.id} order {id} is not open anymore")
+            market = self.markets[order['symbol']]
+            if order['side'] == 'buy':
+                self._add(market['quote'], free=order['remaining'] * order['price'],
+                          used=-order['remaining'] * order['price'])
+            else:
+                self._add(market['base'], free=order['remaining'], used=-order['remaining'])
+            order['status'] = 'canceled'
+            return self.extend(order, {})
+
+    def fetch_order(self, id: str, symbol: str = None, params={}):
+        self.simulate_request('fetch_order')
+        with self._lock:
+            return self.extend(self._get_order(id, symbol), {})
+
+    def fetch_orders(self, symbol: str = None, since=None, limit=None, params={}):
+        self.simulate_request('fetch_orders')
+        with self._lock:
+            orders = [self.extend(order, {}) for order in self.orders.values()
+                      if (symbol is None or order['symbol'] == symbol) and
+                      (since is None or order['timestamp'] >= since)]
+        return orders[-limit:] if limit else orders
+
+    def fetch_open_orders(self, symbol: str = None, since=None, limit=None, params={}):
+        orders = [order for order in self.fetch_orders(symbol, since, None, params) if order['status'] == 'open']
+        return orders[-limit:] if limit else orders
+
+    def fetch_my_trades(self, symbol: str = None, since=None, limit=None, params={}):
+        self.simulate_request('fetch_my_trades')
+        with self._lock:
+            trades = [trade for trade in self.my_trades if (symbol is None or trade['symbol'] == symbol) and
+                      (since is None or trade['timestamp'] >= since)]
+        return trades[-limit:] if limit else trades
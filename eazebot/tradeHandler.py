@@ -28,13 +28,17 @@ import time
 import datetime
 import sys
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
-import requests
 from ccxt.base.errors import (AuthenticationError, NetworkError, OrderNotFound, InvalidNonce, ExchangeError,
                               InsufficientFunds)
 
 from eazebot.handling import ValueType, Price, DailyCloseSL, WeeklyCloseSL, TrailingSL, BaseTradeSet, \
-    NumberFormatter, ExchContainer, OrderType
+    NumberFormatter, ExchContainer, OrderType, TriggerIndex, TradeSetScheduler, BalanceLedger, \
+    ExchangeProfile, FeeSchedule, FeeTokenResolver, ConversionGraph, CandleCache, PriceHistoryStore
+from eazebot.monitoring import UpdateStats, api_feature, get_api_feature
 
 logger = logging.getLogger(__name__)
 
@@ -48,30 +52,39 @@ class tradeHandler:
         if exch_name == 'kucoin2':
             exch_name = 'kucoin'
         self.exch_name = exch_name
+        self.scheduler = TradeSetScheduler()
         self.price_dict = {}
         self.updating = False
         self.waiting = []
+        # held by the full update, the stop-loss watcher and trade set deletions, so that they do not interleave
+        self._update_lock = threading.RLock()
+        # concurrent sells refreshing the balance after insufficient funds errors fetch it only once
+        self._balance_lock = threading.Lock()
         self.down = False
         self.authenticated = False
-        self.balance = {}
+        self.native_sl = False
+        self.candle_timeframe = '1d'
+        # open time of the last evaluated candle per (symbol, timeframe), saved with the trade sets
+        self.candle_checked = {}
+        self.dormancy_timeout = 30 * 60
+        self.last_interaction = time.time()
+        self.ledger = BalanceLedger()
+        self.stats = UpdateStats(exch_name)
         self.lastUpdate = time.time() - 10
         self.set_user(user)
 
     def __reduce__(self):
         # function needes for serializing the object
-        if hasattr(self, 'exchange'):
-            return (
-                self.__class__, (self.exchange.__class__.__name__, ),
-                self.__getstate__(),
-                None, None)
-        else:
-            return (
-                self.__class__, (self.exch_name,),
-                self.__getstate__(),
-                None, None)
+        # the exchange name (not the class name) is used, as it is the key of the exchange in the ExchContainer
+        return (
+            self.__class__, (self.exch_name,),
+            self.__getstate__(),
+            None, None)
 
     def __setstate__(self, state):
-        if isinstance(state, tuple):
+        if isinstance(state, tuple) and len(state) == 3:
+            state, tshs, self.candle_checked = state
+        elif isinstance(state, tuple):
             state, tshs = state
         else:
             tshs = []
@@ -87,9 +100,9 @@ class tradeHandler:
 
     def __getstate__(self):
         if hasattr(self, 'tradeSetHistory'):
-            return self.tradeSets, self.tradeSetHistory
+            return self.tradeSets, self.tradeSetHistory, getattr(self, 'candle_checked', {})
         else:
-            return self.tradeSets, []
+            return self.tradeSets, [], getattr(self, 'candle_checked', {})
 
     @staticmethod
     def check_num(*value):
@@ -100,17 +113,59 @@ class tradeHandler:
     def check_quantity(self, symbol, typ, qty):
         if typ not in ['amount', 'price', 'cost']:
             raise ValueError('Type is not amount, price or cost')
-        if typ in self.exchange.markets[symbol]['limits']:
-            return (self.exchange.markets[symbol]['limits'][typ]['min'] is None or qty >=
-                    self.exchange.markets[symbol]['limits'][typ]['min']) and (
-                           self.exchange.markets[symbol]['limits'][typ]['max'] is None or
-                           self.exchange.markets[symbol]['limits'][typ]['max'] == 0 or qty <=
-                           self.exchange.markets[symbol]['limits'][typ]['max'])
+        if self.nf.table.has_limit(symbol, typ):
+            return bool(self.nf.table.check(symbol, typ, qty))
         else:
             logger.warning('Exchange %s does not provide limits for %s' % (self.exchange.name, typ),
                            extra=self.logger_extras)
             return True
 
+    def apply_config(self, config: Dict):
+        """
+        Applies the optional bot configuration settings concerning the trade handler
+
+        :param config: The bot configuration dictionary
+        """
+        self.native_sl = config.get('nativeStopLoss', False)
+        self.candle_timeframe = config.get('candleTimeframe', '1d')
+        self.dormancy_timeout = 60 * config.get('dormancyTimeout', 30)
+        self.ledger.reconcile_interval = 60 * config.get('balanceReconcileInterval', 15)
+        # adaptive scheduling is disabled if no minimum update interval is given
+        self.scheduler.set_intervals(config.get('minUpdateInterval', 0) or 60 * config['updateInterval'],
+                                     60 * config['updateInterval'])
+
+    def has_open_orders(self) -> bool:
+        # checks if any trade set (active or not) still has orders on the exchange
+        for ts in self.tradeSets.values():
+            if ts.sl_order is not None or any([trade['oid'] not in [None, 'filled']
+                                               for trade in ts.in_trades + ts.out_trades]):
+                return True
+        return False
+
+    def is_dormant(self) -> bool:
+        """
+        An exchange is dormant if it has no active trade sets, no open orders and the user did not interact with it
+        for a while. Dormant exchanges are skipped by all update jobs.
+        """
+        if not self.dormancy_timeout or time.time() - self.last_interaction < self.dormancy_timeout:
+            return False
+        return not any([ts.is_active() for ts in self.tradeSets.values()]) and not self.has_open_orders()
+
+    def wake_up(self, refresh=True):
+        """
+        Marks an interaction of the user with this exchange. If the exchange was dormant, markets and balance are
+        reloaded, as they were not updated in the meantime.
+
+        :param refresh: If False, markets and balance are not reloaded (e.g. if the caller reloads them anyway)
+        """
+        was_dormant = self.is_dormant()
+        self.last_interaction = time.time()
+        if was_dormant and refresh:
+            try:
+                self.update_balance()
+            except (AuthenticationError, ccxt.ExchangeError, NetworkError):
+                logger.warning('Could not reload balance of %s' % self.exchange.name, extra=self.logger_extras)
+
     def set_user(self, user: str):
         """
         Method required for backward compatibility if pickled tradeHandler is loaded which had no user info
@@ -121,14 +176,23 @@ class tradeHandler:
         self.user = user
         if user is not None:
             self.exchange = ExchContainer(user).get(self.exch_name)
+            # trailing stop-losses are raised in the index, so it must not be shared with other users
+            self.trigger_index = TriggerIndex(self.exch_name, user)
+            self.profile = ExchangeProfile(self.exchange.id)
             self.nf = NumberFormatter(exchange=self.exchange)
+            self.fees = FeeSchedule(self.exchange)
+            self.fee_token = FeeTokenResolver(self)
+            self.conversion = ConversionGraph(self.exchange)
+            self.candles = CandleCache(self.exchange)
+            self.history = PriceHistoryStore(self.exchange.id)
 
-            if not all([self.exchange.has[x] for x in self.check_these]):
+            if not self.profile.supports(self.exchange, self.check_these):
                 text = f"Exchange {self.exch_name} does not support all required features {', '.join(self.check_these)}"
                 logger.error(text, extra=self.logger_extras)
                 raise Exception(text)
             self.check_keys()
             self.logger_extras = {'chatId': user}
+            self.update_triggers()
         else:
             self.logger_extras = {}
 
@@ -137,8 +201,10 @@ class tradeHandler:
         wasdown = self.down
         while True:
             try:
+                result = func()
+                # only a successful call resets the state, as concurrent calls might just have found the exchange down
                 self.down = False
-                return func()
+                return result
             except InvalidNonce:
                 count += 1
                 # this tries to resync the system timestamp with the exchange's timestamp
@@ -232,23 +298,254 @@ class tradeHandler:
         if symbol not in self.price_dict:
             ticker = self.safe_run(lambda: self.exchange.fetchTicker(symbol))
             self.price_dict[symbol] = Price(symbol, current=ticker['last'], high=ticker['high'], low=ticker['low'])
+            self.history.add_ticker(symbol, ticker)
         elif (datetime.datetime.now() - self.price_dict[symbol].time).seconds > 5:
             # update price
             ticker = self.safe_run(lambda: self.exchange.fetchTicker(symbol))
             self.price_dict[symbol].set_price(current=ticker['last'], high=ticker['high'], low=ticker['low'])
+            self.history.add_ticker(symbol, ticker)
         return self.price_dict[symbol]
 
+    def get_candles(self, symbol: str, timeframe: str):
+        # gets the closed candles of a symbol from the candle cache shared by all users of the exchange
+        return self.candles.get_closed(self.exchange, symbol, timeframe,
+                                       lambda func: self.safe_run(func, print_error=False))
+
+    def get_prices(self, symbols) -> Dict[str, float]:
+        # gets the current prices of several symbols from the price cache, fetching all outdated ones at once
+        outdated = [symbol for symbol in symbols if symbol not in self.price_dict or
+                    (datetime.datetime.now() - self.price_dict[symbol].time).seconds > 5]
+        if len(outdated) > 0:
+            self.fetch_tickers(outdated)
+        return {symbol: self.price_dict[symbol].get_current_price() for symbol in symbols if symbol in self.price_dict}
+
+    def create_orders(self, orders: List[Dict]) -> List:
+        """
+        Places several orders at once, using the batch order endpoint of the exchange if available or otherwise
+        concurrent requests that are staggered by the rate limit of the exchange
+
+        :param orders: List of dicts with the keys symbol, type, side, amount, price and optionally params
+        :return: List with the order response or the raised exception for each order
+        """
+        if len(orders) == 0:
+            return []
+        if self.exchange.has.get('createOrders'):
+            try:
+                return self.safe_run(lambda: self.exchange.createOrders(orders))
+            except Exception as e:
+                return [e] * len(orders)
+
+        return self.run_concurrently(
+            [lambda order=order: self.safe_run(lambda: self.exchange.createOrder(
+                order['symbol'], order['type'], order['side'], order['amount'], order['price'],
+                order.get('params', {}))) for order in orders])
+
+    def cancel_orders(self, symbol, oids: List[str], typ: str = None):
+        """
+        Cancels several orders of a symbol at once, using the batch cancel endpoint of the exchange if available. If the
+        batch fails, e.g. because one of the orders was filled meanwhile, the orders are canceled one by one. Orders
+        that do not exist anymore are ignored.
+
+        :param symbol: The symbol of the orders
+        :param oids: List of order ids
+        :param typ: 'BUY' or 'SELL', needed by some exchanges
+        """
+        if len(oids) == 0:
+            return
+        if self.exchange.has.get('cancelOrders'):
+            def cancel_batch():
+                # an order filled or canceled in the meantime fails the whole batch, which is not worth retrying
+                try:
+                    self.exchange.cancelOrders(oids, symbol)
+                    return True
+                except OrderNotFound:
+                    return False
+            try:
+                if self.safe_run(cancel_batch, False):
+                    return
+            except ExchangeError as e:
+                logger.debug(f"Batch cancel of {len(oids)} {symbol} orders on {self.exchange.name} failed, canceling "
+                             f"them one by one: {e}", extra=self.logger_extras)
+
+        def cancel(oid):
+            try:
+                return self.profile.call('cancel_order', lambda params: self.safe_run(
+                    lambda: self.exchange.cancel_order(oid, symbol, params), False), {'type': typ})
+            except OrderNotFound:
+                return None
+
+        for result in self.run_concurrently([lambda oid=oid: cancel(oid) for oid in oids]):
+            if isinstance(result, Exception) and not isinstance(result, OrderNotFound):
+                raise result
+
+    def run_concurrently(self, funcs: List) -> List:
+        """
+        Runs several exchange requests concurrently, with their starts staggered by the rate limit of the exchange
+
+        :param funcs: List of functions without arguments
+        :return: List with the return value or the raised exception of each function
+        """
+        start = time.time()
+        # the API calls of the workers are attributed to the feature of the calling thread
+        feature = get_api_feature()
+
+        @api_feature(feature)
+        def run(i_func, func):
+            time.sleep(max(0, start + i_func * self.exchange.rateLimit / 1000 - time.time()))
+            return func()
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(funcs), 8))) as pool:
+            futures = [pool.submit(run, i_func, func) for i_func, func in enumerate(funcs)]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def fetch_tickers(self, symbols) -> Dict[str, Price]:
+        """
+        Fetches the tickers of several symbols with as few requests as the exchange allows and updates the price cache
+
+        :param symbols: Iterable of symbols
+        :return: Dictionary of the updated price objects of the symbols
+        """
+        symbols = list(symbols)
+        if len(symbols) == 0:
+            return {}
+        if self.exchange.has['fetchTickers']:
+            tickers = self.safe_run(lambda: self.exchange.fetchTickers(symbols), print_error=False)
+        else:
+            tickers = {symbol: self.safe_run(lambda: self.exchange.fetchTicker(symbol), print_error=False)
+                       for symbol in symbols}
+        for symbol in symbols:
+            if symbol not in tickers or tickers[symbol]['last'] is None:
+                continue
+            ticker = tickers[symbol]
+            self.history.add_ticker(symbol, ticker)
+            if symbol in self.price_dict:
+                self.price_dict[symbol].set_price(current=ticker['last'], high=ticker['high'], low=ticker['low'])
+            else:
+                self.price_dict[symbol] = Price(symbol, current=ticker['last'], high=ticker['high'], low=ticker['low'])
+        return {symbol: self.price_dict[symbol] for symbol in symbols if symbol in self.price_dict}
+
+    def update_triggers(self):
+        # (re-)registers the triggers of all trade sets, e.g. after loading them from file
+        for i_ts in self.tradeSets:
+            self.trigger_index.update_trade_set(self.user, self.tradeSets[i_ts])
+
+    def get_sl_triggered(self, symbol, price_obj: Price):
+        """
+        Returns the uids of all active trade sets of this user with the given symbol, whose (trailing) stop-loss was
+        reached by the price tick. Trailing stop-losses are updated with the tick, too.
+
+        :param symbol: Symbol of the price tick
+        :param price_obj: Price object of the tick
+        :return: List of trade set uids
+        """
+        return [i_ts for user, i_ts in self.trigger_index.sl_triggered(symbol, price_obj)
+                if user == self.user and i_ts in self.tradeSets]
+
+    def sell_all_now(self, sells: Dict[str, float]) -> List[str]:
+        """
+        Sells the coins of several trade sets (e.g. whose stop-losses were reached) concurrently. The requests of the
+        sells are sent one after another on the shared exchange instance (see serialize_requests), only the waits for
+        the orders to fill overlap.
+
+        :param sells: Dictionary of the current price per trade set uid
+        :return: List of the uids of the trade sets that were sold completely
+        """
+        def sell(i_ts, price):
+            ts = self.tradeSets[i_ts]
+            ts.lock_trade_set()
+            try:
+                if not ts.is_active():
+                    return False
+                return ts.sell_all_now(price=price)
+            finally:
+                ts.unlock_trade_set()
+
+        uids = list(sells.keys())
+        results = self.run_concurrently([lambda i_ts=i_ts: sell(i_ts, sells[i_ts]) for i_ts in uids])
+        sold = []
+        for i_ts, result in zip(uids, results):
+            if isinstance(result, Exception):
+                logger.error('Selling %s on %s failed: %s' % (self.tradeSets[i_ts].symbol, self.exchange.name, result),
+                             extra=self.logger_extras)
+            elif result:
+                sold.append(i_ts)
+        return sold
+
+    def check_stop_losses(self, prices: Dict[str, Price] = None):
+        """
+        Lightweight check of the price based (trailing) stop-losses of all active trade sets, meant to be run much more
+        often than the full update. Balances and orders are only touched if a stop-loss is reached.
+
+        :param prices: Optional dictionary of already fetched price objects per symbol. Missing symbols are fetched.
+        """
+        if self.down:
+            return
+        symbols = self.trigger_index.get_symbols(self.user, 'sl')
+        if len(symbols) == 0:
+            return
+        if prices is None:
+            prices = {}
+        prices.update(self.fetch_tickers(symbols - set(prices.keys())))
+        if not self._update_lock.acquire(blocking=False):
+            # the full update is running, it checks the stop-losses itself
+            return
+        try:
+            sl_sells = {}
+            for symbol in symbols:
+                if symbol not in prices:
+                    continue
+                price_obj = prices[symbol]
+                for i_ts in self.get_sl_triggered(symbol, price_obj):
+                    ts = self.tradeSets[i_ts]
+                    logger.warning('Price closed below chosen SL of %s for pair %s! Selling now!' % (
+                        self.nf.price2Prec(ts.symbol, ts.sl.value), ts.symbol), extra=self.logger_extras)
+                    sl_sells[i_ts] = price_obj.get_current_price()
+            for i_ts in self.sell_all_now(sl_sells):
+                self.delete_trade_set(i_ts)
+        finally:
+            self._update_lock.release()
+
+    @property
+    def balance(self):
+        return self.ledger.balance
+
     def update_balance(self):
         self.update_down_state(True)
         # reloads the exchange market and private balance and, if successful, sets the exchange as authenticated
         self.safe_run(self.exchange.loadMarkets)
-        self.balance = self.safe_run(self.exchange.fetch_balance)
+        self.ledger.set(self.safe_run(self.exchange.fetch_balance))
         self.authenticated = True
+        self.fees.refresh()
+
+    def reconcile_balance(self):
+        # fetches the balance from the exchange only if the locally maintained balance is outdated
+        with self._balance_lock:
+            if self.ledger.needs_reconcile():
+                self.update_balance()
+                return
+        self.update_down_state(True)
 
-    def get_balance(self, coin, balance_type='free'):
+    def get_balance(self, coin, balance_type='free', exclude=None):
+        """
+        Returns the balance of a coin. The free balance does not include funds reserved by active trade sets.
+
+        :param coin: The coin
+        :param balance_type: 'free' or 'total'
+        :param exclude: Optional uid of a trade set whose reserved funds should be counted as free
+        :return: The balance
+        """
         assert balance_type in ['free', 'total'], f"Unknown balance type {balance_type}"
         if coin in self.balance:
-            return self.balance[coin][balance_type]
+            bal = self.balance[coin][balance_type]
+            if balance_type == 'free' and bal is not None:
+                bal -= self.ledger.reserved(coin, self.tradeSets, exclude)
+            return bal
         else:
             return 0
 
@@ -278,7 +575,7 @@ class tradeHandler:
                     print('The following error occured at exchange %s:\n%s' % (self.exchange.name, str(e)))
 
     def init_trade_set(self, symbol, add=True) -> BaseTradeSet:
-        self.update_balance()
+        self.reconcile_balance()
 
         ts = BaseTradeSet(symbol=symbol, trade_handler=self)
 
@@ -345,7 +642,7 @@ class tradeHandler:
             raise ValueError(
                 'It seems at least one of your sell prices is lower than one of your buy, which does not make sense')
 
-        if self.balance[ts.baseCurrency]['free'] < sum(buy_levels * buy_amounts):
+        if self.get_balance(ts.baseCurrency) < sum(buy_levels * buy_amounts):
             raise ValueError('Free balance of %s not sufficient to initiate trade set' % ts.baseCurrency)
 
         success = True
@@ -406,7 +703,9 @@ class tradeHandler:
                 if trade['candleAbove'] is None:
                     tmpstr = tmpstr + '_Order not initiated_\n'
                 else:
-                    tmpstr = tmpstr + 'if DC > %s\n' % self.nf.price2Prec(ts.symbol, trade['candleAbove'])
+                    timeframe = trade.get('candleTimeframe', '1d')
+                    tmpstr = tmpstr + 'if %s > %s\n' % ('DC' if timeframe == '1d' else f'{timeframe} close',
+                                                        self.nf.price2Prec(ts.symbol, trade['candleAbove']))
             elif trade['oid'] == 'filled':
                 tmpstr = tmpstr + '_Order filled_\n'
                 if trade['price'] is not None and trade['amount'] is not None:
@@ -468,8 +767,8 @@ class tradeHandler:
             if (ts.init_coins == 0 or ts.init_price is not None) and ts.cost_in() > 0 and (
                     sum_buys > 0 or ts.init_coins > 0):
                 total_amount_to_sell = ts.coins_avail() + ts.sum_sell_amounts('open')
-                fee = self.exchange.calculate_fee(ts.symbol, 'market', 'sell', total_amount_to_sell,
-                                                  price_obj.get_current_price(), 'taker')
+                fee = self.fees.calculate_fee(ts.symbol, 'sell', total_amount_to_sell, price_obj.get_current_price(),
+                                              'taker')
                 cost_sells = ts.cost_out() + price_obj.get_current_price() * total_amount_to_sell - (
                     fee['cost'] if fee['currency'] == ts.baseCurrency else 0)
                 gain = cost_sells - ts.cost_in()
@@ -494,14 +793,9 @@ class tradeHandler:
             gain_btc, curr = self.convert_amount(gain, ts.baseCurrency, 'BTC')
             if curr != 'BTC':
                 gain_btc = None
-            if gain_btc:
-                # try to convert btc gain into usd currency
-                gain_usd, curr = self.convert_amount(gain_btc, 'BTC', 'USD')
-                if curr != 'USD':
-                    gain_usd, curr = self.convert_amount(gain_btc, 'BTC', 'USDT')
-                    if curr != 'USDT':
-                        gain_usd = None
-            else:
+            # try to convert gain amount into usd currency
+            gain_usd, curr = self.convert_amount(gain, ts.baseCurrency, ['USD', 'USDT'])
+            if curr not in ['USD', 'USDT']:
                 gain_usd = None
             self.tradeSetHistory.append({'time': time.time(),
                                          'days': (time.time() - ts.createdAt) / 60 / 60 / 24,
@@ -539,47 +833,31 @@ class tradeHandler:
         :param fee_currency: Currency name in which the fees are paid
         :return:
         """
-        try:
-            if self.exchange.name.lower() == 'binance':
-                if self.exchange.request('bnbBurn', api='sapi', method='GET')['spotBNBBurn']:
-                    # if paying fees via BNB is active, check current market price of bnb and if there is enough bnb
-                    # to pay the fee
-                    fee_in_bnb = requests.get('https://min-api.cryptocompare.com/data/price',
-                                              params={'fsym': fee_currency, 'tsyms': 'BNB'}).json()['BNB'] * cost
-                    # add a factor of 5 to the fee to avoid problems with bnb market fluctuations, and multiple
-                    # orders that are set
-                    if 5 * fee_in_bnb < self.get_balance('BNB'):
-                        return True
-            elif self.exchange.name.lower() == 'kucoin':
-                # yet it is not possible to check via API if fees are paid via kcs...
-                pass
-        except Exception as e:
-            logger.error(f'Failed to check for fee payment:\n{e}',
-                         extra=self.logger_extras)
-        return False
+        return self.fee_token.are_paid([cost], fee_currency)[0]
 
     def convert_amount(self, amount, currency, target_currency):
         self.update_down_state(True)
         if isinstance(target_currency, str):
             target_currency = [target_currency]
 
-        conversion_pairs = [('%s/%s' % (currency, cur) in self.exchange.symbols and
-                            self.exchange.markets['%s/%s' % (currency, cur)]['active']) + 2 * (
-                                   '%s/%s' % (cur, currency) in self.exchange.symbols and
-                                   self.exchange.markets['%s/%s' % (cur, currency)]['active']) for cur in
-                            target_currency]
-        ind = next((i for i, x in enumerate(conversion_pairs) if x), None)
-        if ind is not None:
-            this_cur = target_currency[ind]
-            if conversion_pairs[ind] == 1:
-                amount *= self.get_price_obj(f'{currency}/{this_cur}').get_current_price()
-            else:
-                amount /= self.get_price_obj(f'{this_cur}/{currency}').get_current_price()
+        for this_cur in target_currency:
+            path = self.conversion.get_path(currency, this_cur)
+            if path is None:
+                continue
+            prices = self.get_prices([symbol for symbol, _ in path])
+            if any([prices.get(symbol) is None for symbol, _ in path]):
+                continue
+            for symbol, inverted in path:
+                amount = amount / prices[symbol] if inverted else amount * prices[symbol]
             return amount, this_cur
-        else:
-            return amount, currency
+        return amount, currency
+
+    def delete_trade_set(self, i_ts, sell_all=False) -> bool:
+        # returns if the trade set was deleted, i.e. False if the coins could not be sold immediately
+        with self._update_lock:
+            return self._delete_trade_set(i_ts, sell_all)
 
-    def delete_trade_set(self, i_ts, sell_all=False):
+    def _delete_trade_set(self, i_ts, sell_all=False) -> bool:
         self.update_down_state(True)
         ts = self.tradeSets[i_ts]
         ts.lock_trade_set()
@@ -595,8 +873,42 @@ class tradeHandler:
                 self.nf.cost2Prec(ts.symbol, ts.coins_avail()), ts.coinCurrency), extra=self.logger_extras)
             self.create_trade_history_entry(i_ts)
             self.tradeSets.pop(i_ts)
+            self.trigger_index.remove_trade_set(self.user, i_ts)
+            self.scheduler.remove(i_ts)
+            self.stats.forget(i_ts)
         else:
             self.tradeSets[i_ts].unlock_trade_set()
+        return sold
+
+    def check_candle_triggers(self):
+        """
+        Checks the candle-above buy levels of all trade sets on the candles that closed since the last check. All levels
+        of a symbol and timeframe are matched against the candle close at once.
+        """
+        if not self.exchange.has['fetchOHLCV'] or self.update_down_state():
+            return
+        for symbol, timeframe in self.trigger_index.get_candle_timeframes(self.user):
+            candles = self.get_candles(symbol, timeframe)
+            if len(candles) == 0:
+                continue
+            checked = self.candle_checked.get((symbol, timeframe))
+            self.candle_checked[(symbol, timeframe)] = candles[-1, 0]
+            if checked is None or candles[-1, 0] <= checked:
+                # the first candle seen is only remembered, as it might have closed before the levels were set
+                continue
+            # all candles closed since the last check count, e.g. those closed while the bot was not running
+            close = candles[candles[:, 0] > checked, 4].max()
+            for user, i_ts, i_trade in self.trigger_index.candle_triggered(symbol, close, timeframe):
+                if user != self.user or i_ts not in self.tradeSets:
+                    continue
+                ts = self.tradeSets[i_ts]
+                if not ts.is_active() or ts.in_trades[i_trade]['oid'] is not None:
+                    continue
+                ts.lock_trade_set()
+                try:
+                    ts.place_candle_level(i_trade)
+                finally:
+                    ts.unlock_trade_set()
 
     def update_down_state(self, raise_error=False):
         if self.down:
@@ -610,17 +922,32 @@ class tradeHandler:
     def update(self, special_check=0):
         # goes through all trade sets and checks/updates the buy/sell/stop loss orders
         # daily check is for checking if a candle closed above a certain value
+        with self._update_lock:
+            return self._update(special_check)
+
+    def _update(self, special_check=0):
         if not special_check:
             # fix for accumulating update jobs if update interval is set too small
             if (time.time() - self.lastUpdate) < 1:
                 return None
 
+        if self.is_dormant():
+            # nothing to check, markets and balance are reloaded when the user interacts with the exchange again
+            return None
+
+        if not special_check and self.scheduler.is_enabled() and not any(
+                [ts.is_active() and self.scheduler.is_due(i_ts) for i_ts, ts in self.tradeSets.items()]):
+            # no trade set needs to be checked in this cycle
+            return
+
+        timer = self.stats.start_cycle()
         if self.update_down_state():
             # check if exchange is still down, if yes, return
             return
         else:
+            timer.lap('down_state')
             try:
-                self.update_balance()
+                self.reconcile_balance()
             except AuthenticationError:  #
                 logger.error('Failed to authenticate at exchange %s. Please check your keys' % self.exchange.name,
                              extra=self.logger_extras)
@@ -634,34 +961,81 @@ class tradeHandler:
                     logger.error('Some error occured at exchange %s. Maybe it is down.' % self.exchange.name,
                                  extra=self.logger_extras)
                 return
+        timer.lap('balance')
 
+        sl_triggered = {}
         trade_sets_to_delete = []
         try:
+            # check all stop losses first, so that the triggered ones are sold as early and as concurrently as possible
+            sl_sells = {}
+            sl_sold = []
+            if special_check < 2:
+                for i_ts, ts in self.tradeSets.items():
+                    if not ts.is_active() or ts.sl is None or (not special_check and not self.scheduler.is_due(i_ts)):
+                        continue
+                    if isinstance(ts.sl, (DailyCloseSL, WeeklyCloseSL)) and self.exchange.has['fetchOHLCV']:
+                        # close-based stop-losses are evaluated on the actual candle closes, once a candle has closed
+                        # since the last evaluation
+                        if time.time() * 1000 < ts.sl.next_close():
+                            continue
+                        try:
+                            candles = self.get_candles(ts.symbol, ts.sl.timeframe)
+                        except Exception as e:
+                            logger.error(f"Could not get the candles of {ts.symbol} for the close stop-loss of trade "
+                                         f"set {ts.name}: {e}", extra=self.logger_extras)
+                            continue
+                        sl_reached = ts.sl.is_close_below(candles, self.candles.duration(ts.sl.timeframe))
+                        if sl_reached:
+                            sl_sells[i_ts] = candles[-1, 4]
+                            logger.warning(f"{'Weekly' if isinstance(ts.sl, WeeklyCloseSL) else 'Daily'} candle closed "
+                                           f"below chosen SL of {self.nf.price2Prec(ts.symbol, ts.sl.value)} for pair "
+                                           f"{ts.symbol}! Selling now!", extra=self.logger_extras)
+                        continue
+                    price_obj = self.get_price_obj(ts.symbol)  # get and update the price
+                    if isinstance(ts.sl, (DailyCloseSL, WeeklyCloseSL)):
+                        sl_reached = ts.sl.is_below(price_obj)
+                    else:
+                        # price-based stop-losses are looked up once per symbol in the trigger index
+                        if ts.symbol not in sl_triggered:
+                            sl_triggered[ts.symbol] = set(self.get_sl_triggered(ts.symbol, price_obj))
+                        sl_reached = i_ts in sl_triggered[ts.symbol]
+                    if sl_reached:
+                        if isinstance(ts.sl, WeeklyCloseSL):
+                            msg = 'Weekly candle'
+                        elif isinstance(ts.sl, DailyCloseSL):
+                            msg = 'Daily candle'
+                        else:
+                            msg = 'Price'
+                        logger.warning(msg + ' closed below chosen SL of %s for pair %s! Selling now!' % (
+                            self.nf.price2Prec(ts.symbol, ts.sl.value), ts.symbol), extra=self.logger_extras)
+                        sl_sells[i_ts] = price_obj.get_current_price()
+                # cancel all sell orders, create market sell order, save resulting amount of currency
+                sl_sold = self.sell_all_now(sl_sells)
+                trade_sets_to_delete.extend(sl_sold)
+            timer.lap('stop_loss')
+
             for indTs, i_ts in enumerate(self.tradeSets):
                 ts = self.tradeSets[i_ts]
+                timer.mark()
+                if not special_check and not self.scheduler.is_due(i_ts) or i_ts in sl_sold:
+                    continue
                 try:
                     if not ts.is_active():
                         continue
                     ts.lock_trade_set()
+                    timer.lap('lock', i_ts)
                     price_obj = self.get_price_obj(ts.symbol)  # get and update the price
+                    timer.lap('prices', i_ts)
                     # check if stop loss is reached
                     if special_check < 2:
-                        if ts.sl is not None:
-                            if ts.sl.is_below(price_obj):
-                                if isinstance(ts.sl, WeeklyCloseSL):
-                                    msg = 'Weekly candle'
-                                elif isinstance(ts.sl, DailyCloseSL):
-                                    msg = 'Daily candle'
-                                else:
-                                    msg = 'Price'
-                                logger.warning(msg + ' closed below chosen SL of %s for pair %s! Selling now!' % (
-                                    self.nf.price2Prec(ts.symbol, ts.sl.value), ts.symbol), extra=self.logger_extras)
-                                # cancel all sell orders, create market sell order, save resulting amount of currency
-                                sold = ts.sell_all_now(price=price_obj.get_current_price())
-                                if sold:
-                                    trade_sets_to_delete.append(i_ts)
-                                    ts.unlock_trade_set()
-                                    continue
+                        if ts.check_sl_order():
+                            # native stop-loss order was executed by the exchange
+                            ts.deactivate(2)
+                            ts.sl = None
+                            trade_sets_to_delete.append(i_ts)
+                            ts.unlock_trade_set()
+                            timer.lap('native_sl', i_ts)
+                            continue
 
                     else:  # tax warning check
                         for iTrade, trade in enumerate(ts.in_trades):
@@ -674,6 +1048,7 @@ class tradeHandler:
                                     f"after which gains/losses are not eligible for reporting in the tax report in most"
                                     f" countries!", extra=self.logger_extras)
                         continue
+                    timer.lap('native_sl', i_ts)
 
                     if ts.regular_buy is not None:
                         rb = ts.regular_buy
@@ -701,21 +1076,18 @@ class tradeHandler:
                                                  lock=False)
                             else:
                                 raise ValueError('Unknown order type')
+                    timer.lap('regular_buy', i_ts)
 
                     order_executed = 0
                     # go through buy trades 
                     for iTrade, trade in enumerate(ts.in_trades):
                         if trade['oid'] == 'filled':
                             continue
-                        elif special_check == 1 and trade['oid'] is None and trade['candleAbove'] is not None:
+                        elif special_check == 1 and trade['oid'] is None and trade['candleAbove'] is not None \
+                                and not self.exchange.has['fetchOHLCV'] and trade.get('candleTimeframe', '1d') == '1d':
+                            # exchanges without candles are checked with the ticker price at the daily close
                             if price_obj.get_current_price() > trade['candleAbove']:
-                                response = self.safe_run(
-                                    lambda: self.exchange.createLimitBuyOrder(ts.symbol, trade['amount'],
-                                                                              trade['price']), i_ts=i_ts)
-                                ts.in_trades[iTrade]['oid'] = response['id']
-                                logger.info('Daily candle of %s above %s triggering buy level #%d on %s!' % (
-                                    ts.symbol, self.nf.price2Prec(ts.symbol, trade['candleAbove']), iTrade,
-                                    self.exchange.name), extra=self.logger_extras)
+                                ts.place_candle_level(iTrade)
                         elif trade['oid'] is not None:
                             try:
                                 order_info = ts.fetch_order(trade['oid'], 'BUY')
@@ -751,6 +1123,12 @@ class tradeHandler:
                                         order_info['price'] = order_info['average']
 
                                 if order_info['status'].lower() in ['closed', 'filled']:
+                                    if order_info['type'].lower() == 'market':
+                                        self.ledger.mark_dirty()
+                                    else:
+                                        self.ledger.order_filled(ts.symbol, 'buy', trade['amount'], trade['price'],
+                                                                 cost=order_info['cost'],
+                                                                 received=trade.get('actualAmount'))
                                     order_executed = 1
                                     trade['oid'] = 'filled'
                                     trade['time'] = datetime.datetime.now()
@@ -770,6 +1148,7 @@ class tradeHandler:
                                         f"{list(self.tradeSets.keys()).index(i_ts)} on {self.exchange.name}) was " \
                                         f"canceled by exchange or someone else (reason: {reason}) "
                                     if order_info['cost'] > 0:
+                                        self.ledger.mark_dirty()
                                         ts.in_trades[iTrade]['oid'] = 'filled'
                                         ts.in_trades[iTrade]['price'] = order_info['price']
                                         if trades is not None:
@@ -779,7 +1158,10 @@ class tradeHandler:
                                                                   'order as closed and updating trade set info.',
                                                      extra=self.logger_extras)
                                     else:
+                                        self.ledger.order_canceled(ts.symbol, 'buy', trade['amount'], trade['price'])
                                         ts.in_trades[iTrade]['oid'] = None
+                                        # a candle-above level waits for its candle again
+                                        ts.update_triggers()
                                         logger.error(cancel_msg + 'Will be reinitialized during next update.',
                                                      extra=self.logger_extras)
 
@@ -791,35 +1173,50 @@ class tradeHandler:
                                     f" 'not initiated', will be initiated on next trade set update!",
                                     extra=self.logger_extras)
                                 ts.in_trades[iTrade]['oid'] = None
+                                ts.update_triggers()
 
                         else:
                             ts.init_buy_orders()
-                            time.sleep(1)
+                    timer.lap('buy_checks', i_ts)
 
                     if not special_check:
+                        if ts.sl_order is not None and any(
+                                [trade['oid'] is None and ts.coins_avail() >= trade['amount']
+                                 for trade in ts.out_trades]):
+                            # coins of the native stop-loss order are needed for the sell levels, it is re-placed
+                            # with the remaining coins afterwards
+                            ts.cancel_sl_order()
                         # go through all selling positions and create those for which the bought coins suffice
-                        for iTrade, _ in enumerate(ts.out_trades):
-                            if ts.out_trades[iTrade]['oid'] is None and ts.coins_avail() >= \
-                                    ts.out_trades[iTrade]['amount']:
-                                try:
-                                    response = self.safe_run(lambda: self.exchange.createLimitSellOrder(ts.symbol,
-                                                                                                        ts.out_trades[
-                                                                                                            iTrade][
-                                                                                                            'amount'],
-                                                                                                        ts.out_trades[
-                                                                                                            iTrade][
-                                                                                                            'price']),
-                                                             i_ts=i_ts)
-                                except InsufficientFunds as e:
-                                    ts.deactivate()
-                                    logger.error(f"Insufficient funds on exchange {self.exchange.name} for trade set "
-                                                 f"#{list(self.tradeSets.keys()).index(i_ts)}. Trade set is deactivated"
-                                                 f" now and not updated anymore (open orders are still open)! "
-                                                 f"Free the missing funds and reactivate. \n {e}.",
-                                                 extra=self.logger_extras)
-
-                                    raise e
-                                ts.out_trades[iTrade]['oid'] = response['id']
+                        coins_avail = ts.coins_avail()
+                        to_place = []
+                        for iTrade, trade in enumerate(ts.out_trades):
+                            if trade['oid'] is None and coins_avail >= trade['amount']:
+                                to_place.append(iTrade)
+                                coins_avail -= trade['amount']
+                        responses = self.create_orders([{'symbol': ts.symbol, 'type': 'limit', 'side': 'sell',
+                                                         'amount': ts.out_trades[iTrade]['amount'],
+                                                         'price': ts.out_trades[iTrade]['price']}
+                                                        for iTrade in to_place])
+                        error = None
+                        for iTrade, response in zip(to_place, responses):
+                            if isinstance(response, Exception):
+                                error = response if error is None else error
+                                continue
+                            ts.out_trades[iTrade]['oid'] = response['id']
+                            self.ledger.order_placed(ts.symbol, 'sell', ts.out_trades[iTrade]['amount'],
+                                                     ts.out_trades[iTrade]['price'])
+                        if isinstance(error, InsufficientFunds):
+                            self.ledger.mark_dirty()
+                            ts.deactivate()
+                            logger.error(f"Insufficient funds on exchange {self.exchange.name} for trade set "
+                                         f"#{list(self.tradeSets.keys()).index(i_ts)}. Trade set is deactivated"
+                                         f" now and not updated anymore (open orders are still open)! "
+                                         f"Free the missing funds and reactivate. \n {error}.",
+                                         extra=self.logger_extras)
+                            raise error
+                        elif error is not None:
+                            raise error
+                        timer.lap('sell_placement', i_ts)
                         # go through sell trades
                         for iTrade, trade in enumerate(ts.out_trades):
                             if trade['oid'] == 'filled':
@@ -840,6 +1237,8 @@ class tradeHandler:
                                     else:
                                         trades = None
                                     if any([order_info['status'].lower() == val for val in ['closed', 'filled']]):
+                                        self.ledger.order_filled(ts.symbol, 'sell', trade['amount'], trade['price'],
+                                                                 cost=order_info['cost'])
                                         order_executed = 2
                                         ts.out_trades[iTrade]['oid'] = 'filled'
                                         ts.out_trades[iTrade]['time'] = datetime.datetime.now()
@@ -855,6 +1254,7 @@ class tradeHandler:
                                         else:
                                             reason = 'N/A'
                                         if order_info['cost'] > 0:
+                                            self.ledger.mark_dirty()
                                             ts.out_trades[iTrade]['oid'] = 'filled'
                                             ts.out_trades[iTrade]['price'] = order_info['price']
                                             if trades is not None:
@@ -868,6 +1268,8 @@ class tradeHandler:
                                                 f"already partly filled! Treating order as closed and updating trade "
                                                 f"set info.", extra=self.logger_extras)
                                         else:
+                                            self.ledger.order_canceled(ts.symbol, 'sell', trade['amount'],
+                                                                       trade['price'])
                                             ts.out_trades[iTrade]['oid'] = None
                                             logger.error(
                                                 f"Sell order (level {iTrade} of trade set "
@@ -884,6 +1286,15 @@ class tradeHandler:
                                         f"order had probably been executed. In this case please delete the trade set.",
                                         extra=self.logger_extras)
                                     ts.out_trades[iTrade]['oid'] = None
+                        timer.lap('sell_checks', i_ts)
+
+                        update_sl = ts.update_sl_order()
+                        timer.lap('native_sl', i_ts)
+                        if update_sl:
+                            ts.deactivate(2)
+                            ts.sl = None
+                            trade_sets_to_delete.append(i_ts)
+                            continue
 
                         # delete Tradeset when all orders have been filled (but only if there were any to execute
                         # and if no significant coin amount is left)
@@ -901,8 +1312,13 @@ class tradeHandler:
                             trade_sets_to_delete.append(i_ts)
                 finally:
                     ts.unlock_trade_set()
+                    if not special_check:
+                        self.scheduler.schedule(ts, self.price_dict.get(ts.symbol), self.history.get(ts.symbol))
         finally:
             # makes sure that the tradeSet deletion takes place even if some error occurred in another trade
             for i_ts in trade_sets_to_delete:
                 self.delete_trade_set(i_ts, sell_all=False)
+            timer.lap('deletions')
+            if not special_check:
+                timer.finish()
             self.lastUpdate = time.time()
@@ -0,0 +1,181 @@
+"""Recording and deterministic replay of the exchange API traffic, e.g. to reproduce problems without exchange access"""
+import gzip
+import json
+import os
+import threading
+from typing import Dict, List
+
+import ccxt
+
+
+class ReplayError(Exception):
+    # raised if a request is made during the replay for which no response was recorded
+    pass
+
+
+def request_key(path: str, api, method: str) -> str:
+    return f"{api} {method} {path}"
+
+
+class TrafficRecorder:
+    """
+    Records the requests of a ccxt exchange and their raw (not yet parsed) responses or errors. The records are
+    appended as gzip compressed json lines, one line per request:
+
+    {"k": "<api> <method> <path>", "p": params, "r": response} or {"k": ..., "p": ..., "e": [error class, message]}
+
+    Headers and signatures are not recorded, but the responses contain the account data (e.g. balances and orders).
+    """
+    def __init__(self, exchange: ccxt.Exchange, file: str):
+        self.exchange = exchange
+        self.file = file
+        self.count = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(file):
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+        # a new gzip member is appended to the records of earlier runs
+        self._fh = gzip.open(file, 'at', encoding='utf-8')
+        fetch2 = exchange.fetch2
+
+        def recorded_fetch2(path, api='public', method='GET', params={}, headers=None, body=None):
+            record = {'k': request_key(path, api, method), 'p': params}
+            try:
+                record['r'] = fetch2(path, api, method, params, headers, body)
+                return record['r']
+            except Exception as e:
+                record['e'] = [type(e).__name__, str(e)]
+                raise
+            finally:
+                self.write(record)
+        exchange.fetch2 = recorded_fetch2
+
+    def write(self, record: Dict):
+        line = json.dumps(record, separators=(',', ':'), default=str) + '\n'
+        with self._lock:
+            self._fh.write(line)
+            # flushing completes the compressed block, so that the records are readable even if the bot is killed
+            self._fh.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
+
+
+def read_traffic(file: str) -> List[Dict]:
+    records = []
+    with gzip.open(file, 'rt', encoding='utf-8') as fh:
+        try:
+            for line in fh:
+                if line.strip():
+                    records.append(json.loads(line))
+        except EOFError:
+            # the recording bot was stopped without closing the file, all flushed records have been read
+            pass
+    return records
+
+
+class TrafficReplayer:
+    """
+    Answers the requests of a ccxt exchange with recorded responses instead of sending them. Responses are handed out
+    per endpoint in the recorded order, taking the first recorded request with the same parameters, so that the replay
+    does not depend on the order in which e.g. the orders of different trade sets are checked. Parameters that depend on
+    the time of the request (e.g. the start of fetched candles) are ignored if no request matches exactly. Recorded
+    errors are raised again.
+    """
+    # request parameters that differ between recording and replay, as they are derived from the current time or are
+    # random client order ids added by ccxt (e.g. newClientOrderId on Binance)
+    varying_params = ('since', 'startTime', 'endTime', 'newClientOrderId', 'clientOrderId', 'clOrdId', 'clientOid',
+                      'client_oid')
+
+    def __init__(self, exchange: ccxt.Exchange, file: str, strict: bool = True):
+        """
+
+        :param exchange: The exchange, whose fetch2 is replaced
+        :param file: The recorded traffic
+        :param strict: If True, a ReplayError is raised for requests without recorded response with the same parameters,
+            otherwise the next recorded response of the endpoint or None is returned
+        """
+        self.exchange = exchange
+        self.strict = strict
+        self.queues = {}
+        self.missing = []
+        self._lock = threading.Lock()
+        for record in read_traffic(file):
+            self.queues.setdefault(record['k'], []).append(record)
+        exchange.fetch2 = self.fetch2
+
+    def fetch2(self, path, api='public', method='GET', params={}, headers=None, body=None):
+        key = request_key(path, api, method)
+        with self._lock:
+            queue = self.queues.get(key, [])
+            if not queue:
+                self.missing.append(key)
+                if self.strict:
+                    raise ReplayError(f"No recorded response left for request {key} with params {params}")
+                return None
+            params = json.loads(json.dumps(params, default=str))
+            index = next((n for n, record in enumerate(queue) if record['p'] == params), None)
+            if index is None:
+                index = next((n for n, record in enumerate(queue)
+                              if self.strip_varying(record['p']) == self.strip_varying(params)), None)
+            if index is None:
+                if self.strict:
+                    self.missing.append(key)
+                    raise ReplayError(f"No recorded response left for request {key} with params {params}")
+                index = 0
+            record = queue.pop(index)
+        if 'e' in record:
+            raise getattr(ccxt, record['e'][0], ccxt.ExchangeError)(record['e'][1])
+        return record['r']
+
+    def strip_varying(self, params) -> Dict:
+        if not isinstance(params, dict):
+            return params
+        return {key: value for key, value in params.items() if key not in self.varying_params}
+
+    def remaining(self) -> int:
+        # number of recorded responses that have not been replayed yet
+        return sum([len(queue) for queue in self.queues.values()])
+
+
+def install(exchange: ccxt.Exchange, file: str, mode: str = 'record'):
+    """
+    Records the traffic of an exchange to a file or replays it from the file
+
+    :param exchange: The exchange
+    :param file: The traffic file
+    :param mode: 'record' or 'replay'
+    :return: The TrafficRecorder or TrafficReplayer
+    """
+    if mode == 'record':
+        return TrafficRecorder(exchange, file)
+    elif mode == 'replay':
+        return TrafficReplayer(exchange, file)
+    else:
+        raise ValueError(f"Unknown traffic mode {mode}")
+
+
+def replay_trade_handler(exch_name: str, file: str, user=None, config: Dict = None):
+    """
+    Creates a trade handler on an exchange that replays the recorded traffic, so that update(), new_trade_set() or
+    sell_all_now() get the recorded responses without exchange access. The replay follows the recording as long as
+    the same requests are made, so the trade sets should be restored e.g. from the user data file saved at the start
+    of the recording before calling these methods.
+
+    :param exch_name: Name of the exchange as during the recording
+    :param file: The traffic file
+    :param user: User id under which the exchange is added (defaults to a replay-only id)
+    :param config: Bot configuration applied to the trade handler
+    :return: The tradeHandler
+    """
+    from eazebot.handling import ExchContainer
+    from eazebot.tradeHandler import tradeHandler
+
+    user = user if user is not None else f"replay_{exch_name}"
+    container = ExchContainer(user)
+    container.add(exch_name, 'replay', 'replay', traffic=(file, 'replay'))
+    th = tradeHandler(exch_name, user=user)
+    if config is not None:
+        th.apply_config(config)
+    return th
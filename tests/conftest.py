@@ -0,0 +1,35 @@
+import itertools
+
+import pytest
+
+from eazebot.handling import ExchContainer, ExchangeProfile
+from eazebot.paper_exchange import PaperExchange
+from eazebot.tradeHandler import tradeHandler
+
+_users = itertools.count(1)
+
+
+@pytest.fixture(autouse=True)
+def user_dir(tmp_path, monkeypatch):
+    # exchange profiles are written to a temporary folder instead of the user folder
+    monkeypatch.setattr(ExchangeProfile, 'user_dir', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def paper():
+    """Paper exchange whose prices only move when stepped, added to the exchange container of a new user"""
+    exchange = PaperExchange({'options': {'seed': 0, 'tickInterval': 0}})
+    exchange.apiKey = 'paper'
+    exchange.secret = 'paper'
+    user = f'test{next(_users)}'
+    ExchContainer(user).exchanges['paper'] = exchange
+    return exchange, user
+
+
+@pytest.fixture
+def th(paper):
+    """Trade handler of a new user on a paper exchange"""
+    handler = tradeHandler('paper', user=paper[1])
+    handler.apply_config({'updateInterval': 1})
+    return handler
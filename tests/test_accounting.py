@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ccxt
+
+from eazebot.monitoring import ApiAccounting, api_feature
+from eazebot.paper_exchange import PaperExchange
+
+
+def make_accounting():
+    exchange = PaperExchange({'options': {'seed': 0, 'tickInterval': 0}})
+    exchange.load_markets()
+    return exchange, ApiAccounting(exchange)
+
+
+def headers(used):
+    return {'x-mbx-used-weight-1m': str(used)}
+
+
+def test_weight_from_used_weight_headers():
+    _, accounting = make_accounting()
+    accounting.used_minute = int(time.time() // 60)
+    accounting.used_weight = 10
+    with accounting._lock:
+        assert accounting.get_weight(headers(15)) == 5
+        # the response of a concurrent request arrived after a later one
+        assert accounting.get_weight(headers(12)) == 0
+        assert accounting.get_weight(headers(16)) == 1
+        assert accounting.get_weight(None) == 1
+        # a new minute starts with the reported weight
+        accounting.used_minute -= 1
+        assert accounting.get_weight(headers(3)) == 3
+
+
+def test_concurrent_requests_sum_up_to_the_used_weight(monkeypatch):
+    _, accounting = make_accounting()
+    # all requests are made within one minute
+    monkeypatch.setattr(time, 'time', lambda: 6000.)
+    used = iter(range(2, 402, 2))
+
+    def request(n):
+        accounting.record('public ticker', 'test', 0.01, 100, headers(next(used)))
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(request, range(200)))
+    entry = accounting.features['test']
+    assert entry['calls'] == 200
+    # responses arriving late do not count again, so the requests together have the weight reported last
+    assert entry['weight'] == 400
+
+
+def test_requests_are_accounted_per_feature_and_endpoint():
+    exchange, accounting = make_accounting()
+
+    @api_feature('prices')
+    def get_prices():
+        exchange.fetch_tickers()
+    get_prices()
+    exchange.fetch_balance()
+    assert accounting.features['prices']['calls'] == 1
+    assert accounting.endpoints['public fetch_tickers']['calls'] == 1
+    assert accounting.endpoints['private fetch_balance']['calls'] == 1
+    assert accounting.totals()['calls'] == 2
+    assert accounting.cycle_summary().startswith('2 calls')
+    assert accounting.cycle_summary().startswith('0 calls')
+
+
+def test_latency_excludes_the_rate_limiter_wait():
+    exchange = ccxt.binance({'enableRateLimit': True})
+    exchange.throttle = lambda: time.sleep(0.2)
+    exchange.sign = lambda path, api, method, params, headers, body: {'url': path, 'method': method,
+                                                                      'headers': headers, 'body': body}
+
+    def fetch(url, method='GET', headers=None, body=None):
+        time.sleep(0.01)
+        return {}
+    exchange.fetch = fetch
+    accounting = ApiAccounting(exchange)
+    exchange.fetch2('ping')
+    assert accounting.endpoints['public ping']['latency'] < 0.1
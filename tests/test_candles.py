@@ -0,0 +1,99 @@
+import time
+
+import ccxt
+import numpy as np
+
+from eazebot.handling import CandleCache, DailyCloseSL, WeeklyCloseSL
+
+DAY = 24 * 60 * 60 * 1000
+
+
+def make_candles(closes, start=0):
+    return np.array([[start + n * DAY, close, close, close, close, 1.] for n, close in enumerate(closes)])
+
+
+def test_close_sl_only_evaluates_new_candles():
+    sl = DailyCloseSL(1.)
+    sl.checked_until = 2 * DAY
+    # the candle closing below the stop-loss was evaluated already
+    assert not sl.is_close_below(make_candles([0.5, 1.5]), DAY)
+    assert sl.checked_until == 2 * DAY
+    assert not sl.is_close_below(make_candles([0.5, 1.5, 1.2]), DAY)
+    assert sl.checked_until == 3 * DAY
+    # candles that closed while the bot was not running count as well
+    assert sl.is_close_below(make_candles([0.5, 1.5, 1.2, 0.9, 1.1]), DAY)
+
+
+def test_weeks_are_aggregated_from_days(paper):
+    cache = CandleCache(paper[0])
+    monday = CandleCache.week_offset
+    weeks = cache._aggregate_weeks(make_candles(range(1, 10), start=monday))
+    assert weeks[:, 0].tolist() == [monday, monday + 7 * DAY]
+    assert weeks[:, 4].tolist() == [7, 9]
+    assert weeks[:, 2].tolist() == [7, 9]
+    assert weeks[:, 3].tolist() == [1, 8]
+    assert weeks[:, 5].tolist() == [7, 2]
+
+
+def test_candles_are_fetched_only_after_a_close(th):
+    now = th.exchange.milliseconds()
+    th.exchange.ticks['ETH/BTC'] = [(now - n * DAY / 4, 0.06) for n in range(12, -1, -1)]
+    candles = th.get_candles('ETH/BTC', '1d')
+    # the candle of the current day has not closed yet
+    assert len(candles) == 3 and candles[-1, 0] + DAY <= now
+    requests = th.exchange.request_count
+    assert th.get_candles('ETH/BTC', '1d') is candles
+    assert th.exchange.request_count == requests
+
+
+def test_candle_triggers_place_levels(th, monkeypatch):
+    th.update_balance()
+    ts = th.init_trade_set('ETH/BTC')
+    ts.in_trades.append({'oid': None, 'price': 0.05, 'amount': 1, 'actualAmount': 0.999, 'candleAbove': 0.07,
+                         'candleTimeframe': '1d'})
+    ts.activate(False)
+    candles = make_candles([0.06, 0.065])
+    monkeypatch.setattr(th, 'get_candles', lambda symbol, timeframe: candles)
+    # the first candle seen is only remembered
+    th.check_candle_triggers()
+    assert ts.in_trades[0]['oid'] is None
+    candles = make_candles([0.06, 0.065, 0.068])
+    th.check_candle_triggers()
+    assert ts.in_trades[0]['oid'] is None
+    # a close above the level places its order, also if a later candle closed below again
+    candles = make_candles([0.06, 0.065, 0.068, 0.071, 0.069])
+    th.check_candle_triggers()
+    assert ts.in_trades[0]['oid'] not in [None, 'filled']
+
+
+def test_close_sl_next_close():
+    sl = DailyCloseSL(1.)
+    sl.checked_until = 10 * DAY + 5
+    assert sl.next_close() == 11 * DAY
+    sl.checked_until = 11 * DAY
+    assert sl.next_close() == 12 * DAY
+    weekly = WeeklyCloseSL(1.)
+    weekly.checked_until = CandleCache.week_offset + 3 * DAY
+    assert weekly.next_close() == CandleCache.week_offset + 7 * DAY
+
+
+def test_close_sl_candle_errors_skip_the_trade_set(th, monkeypatch):
+    ts = th.init_trade_set('ETH/BTC')
+    ts.add_init_coins(0.05, 1)
+    ts.activate(False)
+    ts.sl = DailyCloseSL(0.055)
+    ts.sl.checked_until = 0
+    requested = []
+
+    def get_candles(symbol, timeframe):
+        requested.append(symbol)
+        raise ccxt.NetworkError('no candles')
+    monkeypatch.setattr(th, 'get_candles', get_candles)
+    th.lastUpdate = 0
+    th.update(special_check=1)
+    assert requested == ['ETH/BTC']
+    assert ts.get_uid() in th.tradeSets and ts.is_active()
+    # no candle closed since the last evaluation, so the candles are not requested
+    ts.sl.checked_until = time.time() * 1000
+    th.update(special_check=1)
+    assert requested == ['ETH/BTC']
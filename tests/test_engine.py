@@ -0,0 +1,68 @@
+import itertools
+import json
+import threading
+
+import pytest
+
+from eazebot.engine import Engine
+from eazebot.handling import ExchContainer, PriceHistoryStore
+
+_users = itertools.count(1)
+
+
+@pytest.fixture
+def config(user_dir, monkeypatch):
+    """Configuration of a new user with a paper exchange in the APIs.json file"""
+    # the engine points these folders to the user folder, they are restored after the test
+    monkeypatch.setattr(ExchContainer, 'paper_dir', None)
+    monkeypatch.setattr(PriceHistoryStore, 'directory', PriceHistoryStore.directory)
+    with open(user_dir / 'APIs.json', 'w') as fh:
+        json.dump([{'exchange': 'paper', 'key': 'paper', 'secret': 'paper',
+                    'options': {'seed': 0, 'tickInterval': 0}}], fh)
+    return {'telegramUserId': [f'engine{next(_users)}'], 'updateInterval': 1, 'slWatchInterval': 1}
+
+
+def test_load_and_update(config, user_dir):
+    engine = Engine(config, str(user_dir))
+    engine.load()
+    ts = engine.new_trade_set('paper', 'ETH/BTC', buy_levels=[0.05], buy_amounts=[1], sell_levels=[0.07],
+                              sell_amounts=[1], sl=0.04)
+    th = engine.get_trade_handler('paper')
+    assert th.exchange.fetch_order(ts.in_trades[0]['oid'])['status'] == 'open'
+    th.exchange.set_price('ETH/BTC', 0.049)
+    # updates within a second of the last one are skipped
+    th.lastUpdate = 0
+    engine.update()
+    assert ts.in_trades[0]['oid'] == 'filled'
+    engine.save()
+    # the trade set and the paper balance are restored by a new engine
+    engine = Engine(config, str(user_dir))
+    engine.load()
+    i_ts = ts.get_uid()
+    assert engine.get_trade_sets('paper')[i_ts].in_trades[0]['oid'] == 'filled'
+    assert engine.get_trade_handler('paper').exchange.fetch_balance()['ETH']['total'] == pytest.approx(11, rel=1e-2)
+    assert engine.sell_all_now('paper', i_ts) is True
+    assert i_ts not in engine.get_trade_sets('paper')
+
+
+def test_stop_loss_watcher_is_not_blocked_by_update(config, user_dir):
+    engine = Engine(config, str(user_dir))
+    engine.start_delay = 0
+    updating, release, watched = threading.Event(), threading.Event(), threading.Event()
+
+    def slow_update():
+        updating.set()
+        release.wait(10)
+    engine.update = slow_update
+    engine.watch_stop_losses = watched.set
+    runner = threading.Thread(target=engine.run)
+    runner.start()
+    try:
+        assert updating.wait(5)
+        assert watched.wait(5)
+        assert not release.is_set()
+    finally:
+        release.set()
+        engine.stop()
+        runner.join(10)
+    assert not runner.is_alive()
@@ -0,0 +1,80 @@
+import pytest
+
+from eazebot.handling import BalanceLedger
+
+
+def make_ledger():
+    ledger = BalanceLedger()
+    ledger.set({'BTC': {'free': 1., 'used': 0., 'total': 1.}, 'ETH': {'free': 10., 'used': 0., 'total': 10.},
+                'free': {'BTC': 1., 'ETH': 10.}, 'used': {'BTC': 0., 'ETH': 0.}, 'total': {'BTC': 1., 'ETH': 10.}})
+    return ledger
+
+
+def test_buy_order_placed_filled():
+    ledger = make_ledger()
+    ledger.order_placed('ETH/BTC', 'buy', 2, 0.05)
+    assert ledger.balance['BTC'] == pytest.approx({'free': 0.9, 'used': 0.1, 'total': 1.})
+    assert ledger.balance['free']['BTC'] == pytest.approx(0.9)
+    # the order was filled cheaper than its limit and the fee was paid in the coin
+    ledger.order_filled('ETH/BTC', 'buy', 2, 0.05, cost=0.098, received=1.998)
+    assert ledger.balance['BTC'] == pytest.approx({'free': 0.902, 'used': 0., 'total': 0.902})
+    assert ledger.balance['ETH']['free'] == pytest.approx(11.998)
+
+
+def test_sell_order_placed_canceled():
+    ledger = make_ledger()
+    ledger.order_placed('ETH/BTC', 'sell', 3, 0.07)
+    assert ledger.balance['ETH'] == pytest.approx({'free': 7., 'used': 3., 'total': 10.})
+    ledger.order_canceled('ETH/BTC', 'sell', 3, 0.07)
+    assert ledger.balance['ETH'] == pytest.approx({'free': 10., 'used': 0., 'total': 10.})
+    assert not ledger.needs_reconcile()
+    ledger.mark_dirty()
+    assert ledger.needs_reconcile()
+
+
+def test_free_balance_excludes_reserved_funds(th):
+    th.update_balance()
+    ts = th.init_trade_set('ETH/BTC')
+    ts.in_trades.append({'oid': None, 'price': 0.05, 'amount': 2, 'actualAmount': 1.998, 'candleAbove': 0.1,
+                         'candleTimeframe': '1d'})
+    ts.add_init_coins(0.05, 1)
+    ts.activate(False)
+    # the buy level waits for a candle above, so its cost is reserved but not placed
+    assert th.get_balance('BTC') == pytest.approx(1 - 0.1)
+    assert th.get_balance('ETH') == pytest.approx(10 - 1)
+    assert th.get_balance('BTC', exclude=ts.get_uid()) == pytest.approx(1)
+    assert th.get_balance('BTC', 'total') == pytest.approx(1)
+
+
+def test_ledger_follows_placed_orders(th):
+    th.update_balance()
+    ts = th.init_trade_set('ETH/BTC')
+    ts.in_trades.append({'oid': None, 'price': 0.05, 'amount': 2, 'actualAmount': 1.998, 'candleAbove': None,
+                         'candleTimeframe': '1d'})
+    ts.activate(False)
+    requests = th.exchange.request_count
+    assert th.balance['BTC']['used'] == pytest.approx(0.1)
+    assert th.get_balance('BTC') == pytest.approx(0.9)
+    assert th.exchange.request_count == requests
+    th.reconcile_balance()
+    # the local balance was up to date, so it is not fetched again
+    assert th.exchange.request_count == requests
+    assert th.exchange.fetch_balance()['used']['BTC'] == pytest.approx(th.balance['BTC']['used'])
+
+
+def test_reserved_funds_are_cached_until_changed(th, monkeypatch):
+    th.update_balance()
+    ts = th.init_trade_set('ETH/BTC')
+    ts.add_init_coins(0.05, 1)
+    ts.activate(False)
+    calls = []
+    reserved_by = BalanceLedger.reserved_by
+    monkeypatch.setattr(BalanceLedger, 'reserved_by',
+                        staticmethod(lambda *args: calls.append(args) or reserved_by(*args)))
+    assert th.get_balance('ETH') == pytest.approx(9)
+    assert th.get_balance('ETH') == pytest.approx(9)
+    assert len(calls) == 1
+    # the coins are not reserved anymore by the deactivated trade set
+    ts.deactivate()
+    assert th.get_balance('ETH') == pytest.approx(10)
+    assert len(calls) == 2
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from ccxt.base.decimal_to_precision import TICK_SIZE
+
+from eazebot.handling import ConversionGraph, FeeSchedule, MarketTable
+from eazebot.paper_exchange import PaperExchange
+
+
+def make_exchange(**markets):
+    exchange = PaperExchange({'options': {'seed': 0, 'tickInterval': 0, 'markets': markets or None}})
+    exchange.load_markets()
+    return exchange
+
+
+def test_market_table_rounds_like_ccxt():
+    exchange = make_exchange(**{'ETH/BTC': {'price': 0.06, 'amountPrecision': 3, 'pricePrecision': 5}})
+    table = MarketTable(exchange)
+    amounts = [1.23456, 0.0019999, 2.]
+    prices = [0.061234, 0.0612351, 0.06]
+    assert table.round('ETH/BTC', amounts, 'amount') == pytest.approx(
+        [float(exchange.amount_to_precision('ETH/BTC', amount)) for amount in amounts])
+    assert table.round('ETH/BTC', prices, 'price') == pytest.approx(
+        [float(exchange.price_to_precision('ETH/BTC', price)) for price in prices])
+
+
+def test_market_table_tick_size():
+    exchange = make_exchange()
+    exchange.precisionMode = TICK_SIZE
+    exchange.markets['ETH/BTC']['precision'] = {'amount': 0.01, 'price': 0.0005}
+    exchange.markets = dict(exchange.markets)
+    table = MarketTable(exchange)
+    assert table.round('ETH/BTC', [1.239, 0.0], 'amount') == pytest.approx([1.23, 0.])
+    assert table.round('ETH/BTC', [0.06026, 0.06024], 'price') == pytest.approx([0.0605, 0.06])
+
+
+def test_market_table_checks_limits_and_recompiles():
+    exchange = make_exchange(**{'ETH/BTC': {'price': 0.06, 'minAmount': 0.01, 'minCost': 0.0001}})
+    table = MarketTable(exchange)
+    assert list(table.check_levels('ETH/BTC', [0.001, 0.01, 1], [0.06, 0.001, 0.06])) == [False, False, True]
+    assert table.has_limit('ETH/BTC', 'amount')
+    assert not table.refresh()
+    exchange.markets = dict(exchange.markets)
+    assert table.refresh()
+
+
+def test_fee_schedule_uses_account_fees():
+    exchange = make_exchange()
+    exchange.apiKey = 'paper'
+    exchange.fees['trading']['maker'] = 0.0005
+    fees = FeeSchedule(exchange)
+    costs, currency = fees.calculate('ETH/BTC', 'buy', np.array([1., 2.]), np.array([0.05, 0.04]), 'maker')
+    assert currency == 'BTC'
+    assert costs == pytest.approx([0.05 * 0.0005, 0.08 * 0.0005])
+    assert fees.calculate_fee('ETH/BTC', 'sell', 1, 0.05)['cost'] == pytest.approx(
+        exchange.calculate_fee('ETH/BTC', 'limit', 'sell', 1, 0.05, 'taker')['cost'])
+    # the rates are only fetched again after the time to live
+    requests = exchange.request_count
+    fees.get_rate('ETH/BTC')
+    assert exchange.request_count == requests
+
+
+def test_conversion_paths():
+    graph = ConversionGraph(make_exchange())
+    assert graph.get_path('ETH', 'BTC') == [('ETH/BTC', False)]
+    assert graph.get_path('BTC', 'ETH') == [('ETH/BTC', True)]
+    assert len(graph.get_path('BNB', 'USDT')) == 1
+    assert graph.get_path('ETH', 'EUR') is None
+    assert graph.get_symbols(['ETH', 'BNB'], 'BTC') == {'ETH/BTC', 'BNB/BTC'}
+
+
+def test_convert_amount(th):
+    amount, currency = th.convert_amount(2, 'ETH', 'BTC')
+    assert currency == 'BTC'
+    assert amount == pytest.approx(2 * th.get_prices(['ETH/BTC'])['ETH/BTC'])
+    # currencies without a path are not converted
+    assert th.convert_amount(2, 'ETH', 'EUR') == (2, 'ETH')
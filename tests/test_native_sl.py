@@ -0,0 +1,42 @@
+
+
+def trade_set_with_sl_order(th, monkeypatch, status, filled):
+    ts = th.init_trade_set('ETH/BTC')
+    ts.add_init_coins(0.05, 2)
+    ts.sl_order = {'oid': 'sl', 'price': 0.05, 'limit': 0.0495, 'amount': 2}
+    monkeypatch.setattr(ts, 'fetch_order', lambda oid, typ: {
+        'id': oid, 'status': status, 'amount': 2, 'filled': filled, 'price': None,
+        'average': 0.0496 if filled else None, 'cost': 0.0496 * filled})
+    return ts
+
+
+def test_sl_order_filled(th, monkeypatch):
+    ts = trade_set_with_sl_order(th, monkeypatch, 'closed', 2)
+    assert ts.check_sl_order()
+    assert ts.sl_order is None
+    assert ts.out_trades[-1]['amount'] == 2
+
+
+def test_sl_order_partly_filled_keeps_trade_set(th, monkeypatch):
+    ts = trade_set_with_sl_order(th, monkeypatch, 'canceled', 0.5)
+    # the trade set is not deleted and the stop-loss is placed again for the remaining coins
+    assert not ts.check_sl_order()
+    assert ts.sl_order is None
+    assert ts.out_trades[-1]['amount'] == 0.5
+    assert abs(ts.coins_avail() - 1.5) < 1e-9
+
+
+def test_sl_order_canceled_without_price(th, monkeypatch):
+    ts = trade_set_with_sl_order(th, monkeypatch, 'canceled', 0)
+    assert not ts.check_sl_order()
+    assert ts.out_trades == []
+
+
+def test_reserved_excludes_sl_order(th):
+    ts = th.init_trade_set('ETH/BTC')
+    ts.add_init_coins(0.05, 2)
+    ts.activate(False)
+    assert th.ledger.reserved('ETH', th.tradeSets) == 2
+    ts.sl_order = {'oid': 'sl', 'price': 0.05, 'limit': 0.0495, 'amount': 1.5}
+    th.ledger.order_placed('ETH/BTC', 'sell', 1.5, 0.0495)
+    assert th.ledger.reserved('ETH', th.tradeSets) == 0.5
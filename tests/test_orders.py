@@ -0,0 +1,151 @@
+import time
+
+import pytest
+from ccxt.base.errors import OrderNotFound
+
+from eazebot.handling import ExchContainer
+from eazebot.paper_exchange import PaperExchange
+from eazebot.tradeHandler import tradeHandler
+
+
+def place_buy_orders(th, n=3, symbol='ETH/BTC'):
+    responses = th.create_orders([{'symbol': symbol, 'type': 'limit', 'side': 'buy', 'amount': 1,
+                                   'price': 0.05 - 0.001 * i} for i in range(n)])
+    return [response['id'] for response in responses]
+
+
+def open_ids(th):
+    return {order['id'] for order in th.exchange.fetch_open_orders()}
+
+
+def test_create_orders_reports_failures_per_order(th):
+    responses = th.create_orders([{'symbol': 'ETH/BTC', 'type': 'limit', 'side': 'buy', 'amount': 1, 'price': 0.05},
+                                  {'symbol': 'ETH/BTC', 'type': 'limit', 'side': 'buy', 'amount': 1e6,
+                                   'price': 0.05}])
+    assert responses[0]['status'] == 'open'
+    assert isinstance(responses[1], Exception)
+    assert open_ids(th) == {responses[0]['id']}
+
+
+def test_create_orders_one_by_one(th):
+    th.exchange.has['createOrders'] = False
+    oids = place_buy_orders(th)
+    assert open_ids(th) == set(oids)
+
+
+def test_cancel_orders_batch(th):
+    oids = place_buy_orders(th)
+    before = th.exchange.request_count
+    th.cancel_orders('ETH/BTC', oids)
+    assert th.exchange.request_count - before == 1
+    assert open_ids(th) == set()
+
+
+def test_cancel_orders_batch_falls_back_if_order_is_gone(th, monkeypatch):
+    oids = place_buy_orders(th)
+    th.exchange.cancel_order(oids[1], 'ETH/BTC')
+
+    def reject_batch(ids, symbol=None, params={}):
+        # like most exchanges, the whole batch is rejected because of the canceled order
+        raise OrderNotFound('order is not open anymore')
+    monkeypatch.setattr(th.exchange, 'cancelOrders', reject_batch)
+    th.cancel_orders('ETH/BTC', oids)
+    assert open_ids(th) == set()
+
+
+def test_cancel_orders_one_by_one_ignores_missing(th):
+    th.exchange.has['cancelOrders'] = False
+    oids = place_buy_orders(th)
+    th.exchange.cancel_order(oids[0], 'ETH/BTC')
+    th.cancel_orders('ETH/BTC', oids)
+    assert open_ids(th) == set()
+
+
+def active_trade_set(th):
+    th.update_balance()
+    ts = th.init_trade_set('ETH/BTC')
+    for price in [0.05, 0.04]:
+        ts.in_trades.append({'oid': None, 'price': price, 'amount': 1, 'actualAmount': 0.999, 'candleAbove': None,
+                             'candleTimeframe': '1d'})
+    ts.activate(False)
+    return ts
+
+
+def test_buy_levels_are_placed_with_rounded_values(th):
+    th.update_balance()
+    ts = th.init_trade_set('ETH/BTC')
+    ts.in_trades.append({'oid': None, 'price': 0.0512345678901, 'amount': 1.23456789012, 'actualAmount': 1.2,
+                         'candleAbove': None, 'candleTimeframe': '1d'})
+    amount = float(th.nf.table.round('ETH/BTC', 1.23456789012, 'amount'))
+    price = float(th.nf.table.round('ETH/BTC', 0.0512345678901, 'price'))
+    ts.activate(False)
+    order = th.exchange.fetch_order(ts.in_trades[0]['oid'])
+    assert (order['amount'], order['price']) == (ts.in_trades[0]['amount'], ts.in_trades[0]['price']) == \
+        (amount, price)
+    assert th.balance['BTC']['used'] == pytest.approx(amount * price)
+
+
+def test_replace_level_order_with_edit(th):
+    ts = active_trade_set(th)
+    other_oid = ts.in_trades[1]['oid']
+    assert ts.set_buy_level(0, 0.045, 2) == 1
+    order = th.exchange.fetch_order(ts.in_trades[0]['oid'])
+    assert (order['status'], order['price'], order['amount']) == ('open', 0.045, 2)
+    # the other level is not touched and the trade set stays active
+    assert ts.in_trades[1]['oid'] == other_oid
+    assert ts.is_active()
+    assert th.balance['BTC']['used'] == pytest.approx(0.09 + 0.04)
+    assert open_ids(th) == {ts.in_trades[0]['oid'], other_oid}
+
+
+def test_replace_level_order_by_cancel_and_place(th):
+    th.exchange.has['editOrder'] = False
+    ts = active_trade_set(th)
+    old_oid = ts.in_trades[0]['oid']
+    assert ts.set_buy_level(0, 0.045, 2) == 1
+    assert th.exchange.fetch_order(old_oid)['status'] == 'canceled'
+    assert th.exchange.fetch_order(ts.in_trades[0]['oid'])['amount'] == 2
+    assert th.balance['BTC']['used'] == pytest.approx(0.09 + 0.04)
+
+
+def test_wait_for_order(th):
+    ts = th.init_trade_set('ETH/BTC')
+    closed = th.exchange.create_order('ETH/BTC', 'market', 'buy', 1)
+    requests = th.exchange.request_count
+    # a closed order in the creation response is not fetched again
+    assert ts.wait_for_order(closed, 'BUY') is closed
+    assert th.exchange.request_count == requests
+    order = th.exchange.create_order('ETH/BTC', 'limit', 'buy', 1, 0.05)
+    start = time.time()
+    assert ts.wait_for_order({'id': order['id']}, 'BUY', timeout=0.5)['status'] == 'open'
+    assert 0.5 <= time.time() - start < 1.5
+    th.exchange.set_price('ETH/BTC', 0.049)
+    assert ts.wait_for_order({'id': order['id']}, 'BUY')['status'] == 'closed'
+
+
+def test_concurrent_sells_send_one_request_at_a_time(monkeypatch):
+    active, peak = [0], [0]
+    fetch2 = PaperExchange.fetch2
+
+    def slow_fetch2(self, *args):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        try:
+            time.sleep(0.01)
+            return fetch2(self, *args)
+        finally:
+            active[0] -= 1
+    monkeypatch.setattr(PaperExchange, 'fetch2', slow_fetch2)
+    user = 'test_serialized_requests'
+    ExchContainer(user).add('paper', 'paper', 'paper', options={'seed': 0, 'tickInterval': 0})
+    th = tradeHandler('paper', user=user)
+    th.apply_config({'updateInterval': 1})
+    # the sells are not staggered, so that only the serialization keeps their requests apart
+    th.exchange.rateLimit = 0
+    for _ in range(4):
+        ts = th.init_trade_set('ETH/BTC')
+        ts.add_init_coins(0.05, 1)
+        ts.activate(False)
+    sold = th.sell_all_now({i_ts: 0.06 for i_ts in th.tradeSets})
+    assert sorted(sold) == sorted(th.tradeSets)
+    assert peak[0] == 1
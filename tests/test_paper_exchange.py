@@ -0,0 +1,71 @@
+import pytest
+from ccxt.base.errors import InsufficientFunds, InvalidOrder, OrderNotFound
+
+from eazebot.paper_exchange import PaperExchange
+
+
+def make_exchange(**options):
+    exchange = PaperExchange({'options': dict({'seed': 0, 'tickInterval': 0}, **options)})
+    exchange.load_markets()
+    return exchange
+
+
+def test_limit_order_filled_when_price_is_reached():
+    exchange = make_exchange()
+    order = exchange.create_order('ETH/BTC', 'limit', 'buy', 1, 0.05)
+    assert exchange.fetch_balance()['used']['BTC'] == pytest.approx(0.05)
+    exchange.set_price('ETH/BTC', 0.051)
+    assert exchange.fetch_order(order['id'])['status'] == 'open'
+    exchange.set_price('ETH/BTC', 0.049)
+    order = exchange.fetch_order(order['id'])
+    assert order['status'] == 'closed'
+    assert order['filled'] == 1
+    balance = exchange.fetch_balance()
+    assert balance['used']['BTC'] == pytest.approx(0)
+    assert balance['ETH']['total'] == pytest.approx(11)
+    # limit orders are filled at their price and the maker fee is paid in the quote currency
+    assert balance['BTC']['total'] == pytest.approx(1 - 0.05 - 0.05 * 0.001)
+
+
+def test_market_order_filled_at_bid_or_ask():
+    exchange = make_exchange(spread=0.01)
+    order = exchange.create_order('ETH/BTC', 'market', 'buy', 1)
+    assert order['status'] == 'closed'
+    assert order['price'] > 0.06
+    order = exchange.create_order('ETH/BTC', 'market', 'sell', 1)
+    assert order['price'] < 0.06
+
+
+def test_crossing_limit_order_is_filled_immediately():
+    exchange = make_exchange()
+    order = exchange.create_order('ETH/BTC', 'limit', 'sell', 1, 0.05)
+    assert order['status'] == 'closed'
+
+
+def test_order_checks():
+    exchange = make_exchange()
+    with pytest.raises(InsufficientFunds):
+        exchange.create_order('ETH/BTC', 'limit', 'buy', 100, 0.05)
+    with pytest.raises(InvalidOrder):
+        exchange.create_order('ETH/BTC', 'limit', 'buy', 0, 0.05)
+    order = exchange.create_order('ETH/BTC', 'limit', 'buy', 1, 0.05)
+    exchange.cancel_order(order['id'], 'ETH/BTC')
+    assert exchange.fetch_balance()['BTC']['free'] == pytest.approx(1)
+    with pytest.raises(OrderNotFound):
+        exchange.cancel_order(order['id'], 'ETH/BTC')
+
+
+def test_price_paths_are_reproducible():
+    first, second = make_exchange(seed=1), make_exchange(seed=1)
+    first.step(10)
+    second.step(10)
+    assert first.fetch_ticker('BTC/USDT')['last'] == second.fetch_ticker('BTC/USDT')['last']
+
+
+def test_state_is_restored(tmp_path):
+    state_file = str(tmp_path / 'paper.json')
+    exchange = make_exchange(stateFile=state_file)
+    order = exchange.create_order('ETH/BTC', 'limit', 'buy', 1, 0.05)
+    restored = make_exchange(stateFile=state_file)
+    assert restored.fetch_order(order['id'])['status'] == 'open'
+    assert restored.fetch_balance()['used']['BTC'] == pytest.approx(0.05)
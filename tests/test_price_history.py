@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from eazebot.handling import PriceHistory
+
+
+def test_ring_buffer_keeps_the_latest_ticks():
+    history = PriceHistory(size=5)
+    for n in range(8):
+        history.append(float(n), tick_time=1000. + n)
+    assert len(history) == 5
+    assert history.count == 8
+    assert history.get()[:, 1].tolist() == [3., 4., 5., 6., 7.]
+
+
+def test_ticks_not_newer_than_the_last_are_ignored():
+    history = PriceHistory(size=5)
+    history.append(1., tick_time=1000.)
+    history.append(2., tick_time=1000.)
+    history.append(None, tick_time=1001.)
+    assert history.get()[:, 1].tolist() == [1.]
+
+
+def test_window_statistics():
+    history = PriceHistory(size=100)
+    now = time.time()
+    for n, price in enumerate([1., 2., 1.5, 3.]):
+        history.append(price, tick_time=now - 60 * (3 - n))
+    assert history.min(2.5) == 1.5
+    assert history.max(10) == 3.
+    assert history.ret(10) == pytest.approx(2.)
+    assert history.volatility(10) is not None
+    assert history.volatility(1000) is None
+
+
+def test_memory_mapped_history_survives_restarts(tmp_path):
+    file = str(tmp_path / 'ETH-BTC.npy')
+    history = PriceHistory(size=5, file=file)
+    history.append(1., 0.9, 1.1, tick_time=1000.)
+    history.buffer.flush()
+    del history
+    restored = PriceHistory(size=5, file=file)
+    assert restored.get().tolist() == [[1000., 1., 0.9, 1.1]]
+    # a history of another size is started anew
+    assert len(PriceHistory(size=6, file=file)) == 0
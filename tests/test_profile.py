@@ -0,0 +1,101 @@
+import json
+import os
+
+import ccxt
+import pytest
+from ccxt.base.errors import ExchangeError, OrderNotFound
+
+from eazebot.handling import ExchangeProfile
+
+
+class FakeExchange:
+    # exchange method that needs the order type for some orders only
+    def __init__(self, needs_type):
+        self.needs_type = needs_type
+        self.calls = []
+
+    def cancel_order(self, params):
+        self.calls.append(params)
+        if self.needs_type and 'type' not in params or not self.needs_type and 'type' in params:
+            raise ExchangeError('wrong parameters')
+        return 'ok'
+
+
+def make_profile(name):
+    ExchangeProfile._saved_instances.pop(name, None)
+    return ExchangeProfile(name)
+
+
+def test_typed_variant_is_learned_and_saved(user_dir):
+    profile = make_profile('fake_typed')
+    exchange = FakeExchange(needs_type=True)
+    assert profile.call('cancel_order', exchange.cancel_order, {'type': 'SELL'}) == 'ok'
+    assert profile.variants['cancel_order'] == 'type'
+    with open(os.path.join(user_dir, ExchangeProfile.file_name)) as fh:
+        saved = json.load(fh)['fake_typed']
+    assert saved == {'ccxt': ccxt.__version__, 'variants': {'cancel_order': 'type'}, 'supported': {}}
+    # the learned variant is used directly, also after a restart
+    exchange.calls = []
+    assert make_profile('fake_typed').call('cancel_order', exchange.cancel_order, {'type': 'SELL'}) == 'ok'
+    assert exchange.calls == [{'type': 'SELL'}]
+
+
+def test_learned_typed_variant_falls_back_to_plain():
+    profile = make_profile('fake_both')
+    profile.call('cancel_order', FakeExchange(needs_type=True).cancel_order, {'type': 'SELL'})
+    exchange = FakeExchange(needs_type=False)
+    assert profile.call('cancel_order', exchange.cancel_order, {'type': 'SELL'}) == 'ok'
+    assert exchange.calls == [{'type': 'SELL'}, {}]
+    assert profile.variants['cancel_order'] == 'plain'
+
+
+class FakeCostExchange:
+    # exchange that expects the cost of market buys, like e.g. Huobi
+    def __init__(self):
+        self.options = {'createMarketBuyOrderRequiresPrice': True}
+        self.orders = []
+
+    def createOrder(self, symbol, type, side, amount, price=None, params={}):
+        if self.options['createMarketBuyOrderRequiresPrice']:
+            amount = amount * price
+        self.orders.append(amount)
+        return {'id': str(len(self.orders))}
+
+    def createMarketBuyOrder(self, symbol, amount, params={}):
+        return self.createOrder(symbol, 'market', 'buy', amount, None, params)
+
+
+def test_market_buy_of_cost_or_amount():
+    exchange = FakeCostExchange()
+    ExchangeProfile.create_market_buy_order(exchange, 'ETH/BTC', 2, 0.05)
+    ExchangeProfile.create_market_buy_order(exchange, 'ETH/BTC', 2, 0.05, cost=0.11)
+    assert exchange.orders == [pytest.approx(0.1), 0.11]
+    assert exchange.options['createMarketBuyOrderRequiresPrice'] is True
+
+
+def test_plain_error_is_raised_if_no_variant_works():
+    profile = make_profile('fake_failing')
+
+    def fail(params):
+        raise ExchangeError('plain' if not params else 'typed')
+    with pytest.raises(ExchangeError, match='plain'):
+        profile.call('cancel_order', fail, {'type': 'SELL'})
+    assert 'cancel_order' not in profile.variants
+
+
+def test_order_not_found_is_not_retried():
+    profile = make_profile('fake_not_found')
+    calls = []
+
+    def not_found(params):
+        calls.append(params)
+        raise OrderNotFound('gone')
+    with pytest.raises(OrderNotFound):
+        profile.call('cancel_order', not_found, {'type': 'SELL'})
+    assert calls == [{}]
+
+
+def test_profiles_of_other_ccxt_versions_are_ignored(user_dir):
+    with open(os.path.join(user_dir, ExchangeProfile.file_name), 'w') as fh:
+        json.dump({'fake_old': {'ccxt': '0.0.1', 'variants': {'cancel_order': 'type'}, 'supported': {}}}, fh)
+    assert make_profile('fake_old').variants == {}
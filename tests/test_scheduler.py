@@ -0,0 +1,32 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from eazebot.handling import DailyCloseSL, Price, TradeSetScheduler
+
+DAY = 24 * 60 * 60
+
+
+def make_trade_set(levels, sl=None):
+    return SimpleNamespace(in_trades=[{'oid': None, 'price': price} for price in levels], out_trades=[], sl=sl,
+                           regular_buy=None, get_uid=lambda: 'ts')
+
+
+def price_obj(price, low, high):
+    return Price('BTC', price, high=high, low=low)
+
+
+def test_near_levels_are_checked_often():
+    scheduler = TradeSetScheduler(10, 600)
+    assert scheduler.schedule(make_trade_set([0.0999]), price_obj(0.1, 0.09, 0.11)) == 10
+    assert scheduler.schedule(make_trade_set([0.05]), price_obj(0.1, 0.099, 0.101)) == 600
+    assert not scheduler.is_due('ts')
+
+
+def test_close_sl_is_checked_after_the_utc_close():
+    scheduler = TradeSetScheduler(10, 2 * DAY)
+    sl = DailyCloseSL(0.01)
+    interval = scheduler.schedule(make_trade_set([0.01], sl), price_obj(0.1, 0.099, 0.101))
+    # the next check is 5 s after the next midnight UTC
+    assert (time.time() + interval) % DAY == pytest.approx(5, abs=1)
@@ -0,0 +1,56 @@
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from eazebot.handling import ExchContainer
+from eazebot.tradeHandler import tradeHandler
+from eazebot.traffic import TrafficRecorder, TrafficReplayer, ReplayError, read_traffic
+
+_users = itertools.count(1)
+
+
+def run_trade_handler(file, mode):
+    user = f'traffic{next(_users)}'
+    ExchContainer(user).add('paper', 'paper', 'paper', options={'seed': 0, 'tickInterval': 0}, traffic=(file, mode))
+    th = tradeHandler('paper', user=user)
+    th.apply_config({'updateInterval': 1})
+    ts = th.init_trade_set('ETH/BTC')
+    ts.in_trades.append({'oid': None, 'price': 0.05, 'amount': 1, 'actualAmount': 0.999, 'candleAbove': None,
+                         'candleTimeframe': '1d'})
+    ts.activate(False)
+    th.lastUpdate = 0
+    th.update()
+    return th, ExchContainer(user).traffic['paper']
+
+
+def test_record_and_replay(tmp_path):
+    file = str(tmp_path / 'traffic.jsonl.gz')
+    _, recorder = run_trade_handler(file, 'record')
+    recorder.close()
+    assert len(read_traffic(file)) == recorder.count > 0
+    # the same calls are answered from the recording without any request left over or missing
+    _, replayer = run_trade_handler(file, 'replay')
+    assert replayer.missing == []
+    assert replayer.remaining() == 0
+
+
+def test_replay_ignores_client_order_ids(tmp_path):
+    file = str(tmp_path / 'traffic.jsonl.gz')
+    recorder = TrafficRecorder(SimpleNamespace(fetch2=lambda *args: {'id': '1'}), file)
+    recorder.exchange.fetch2('order', 'private', 'POST', {'symbol': 'ETHBTC', 'newClientOrderId': 'x_abc'})
+    recorder.close()
+    replayer = TrafficReplayer(SimpleNamespace(), file)
+    with pytest.raises(ReplayError):
+        replayer.fetch2('order', 'private', 'POST', {'symbol': 'BNBBTC', 'newClientOrderId': 'x_def'})
+    assert replayer.fetch2('order', 'private', 'POST', {'symbol': 'ETHBTC', 'newClientOrderId': 'x_def'}) == \
+        {'id': '1'}
+
+
+def test_re_adding_exchange_closes_recorder(tmp_path):
+    container = ExchContainer(f'traffic{next(_users)}')
+    container.add('paper', 'paper', 'paper', traffic=(str(tmp_path / 'a.jsonl.gz'), 'record'))
+    recorder = container.traffic['paper']
+    container.add('paper', 'paper', 'paper', traffic=(str(tmp_path / 'b.jsonl.gz'), 'record'))
+    assert recorder._fh.closed
+    assert not container.traffic['paper']._fh.closed
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from eazebot.handling import _SortedKeys, TriggerIndex, TrailingSL, Price, ValueType
+
+
+def make_trade_set(uid, sl, symbol='ETH/BTC'):
+    return SimpleNamespace(symbol=symbol, sl=sl, in_trades=[], get_uid=lambda: uid, is_active=lambda: True)
+
+
+def test_sorted_keys_remove_duplicate_values():
+    keys = _SortedKeys()
+    for key in ['a', 'b', 'c']:
+        keys.add(1., key)
+    keys.add(0.5, 'd')
+    keys.remove(1., 'b')
+    assert keys.values == [0.5, 1., 1.]
+    assert keys.keys == ['d', 'a', 'c']
+
+
+def test_sorted_keys_remove_value_changed_outside():
+    keys = _SortedKeys()
+    keys.add(1., 'a')
+    keys.add(2., 'b')
+    keys.add(3., 'c')
+    # the value of b is no longer the indexed one, the key is searched instead
+    keys.remove(2.5, 'b')
+    assert keys.values == [1., 3.]
+    assert keys.keys == ['a', 'c']
+
+
+def test_raise_trailing_anchor():
+    index = TriggerIndex('test_raise_trailing_anchor')
+    sl = TrailingSL(0.1, ValueType.ABSOLUTE, Price('BTC', 1.))
+    index.update_trade_set(1, make_trade_set('ts1', sl))
+    assert index.sl_triggered('ETH/BTC', Price('BTC', 0.95)) == []
+    # a higher price raises the stop-loss, which then triggers at a price that was safe before
+    assert index.sl_triggered('ETH/BTC', Price('BTC', 1.2)) == []
+    assert abs(sl.value - 1.1) < 1e-9
+    assert index.symbols['ETH/BTC'].trailing_anchors.values == [sl.get_anchor()]
+    assert index.sl_triggered('ETH/BTC', Price('BTC', 1.05)) == [(1, 'ts1')]
+    index.remove_trade_set(1, 'ts1')
+    assert 'ETH/BTC' not in index.symbols
+
+
+def test_trailing_sl_of_other_user_is_not_raised():
+    sl = TrailingSL(0.1, ValueType.ABSOLUTE, Price('BTC', 1.))
+    TriggerIndex('test_other_user', 1).update_trade_set(1, make_trade_set('ts1', sl))
+    # the price ticks seen by another user on the same exchange do not touch the trailing stop-loss
+    assert TriggerIndex('test_other_user', 2).sl_triggered('ETH/BTC', Price('BTC', 1.2)) == []
+    assert abs(sl.value - 0.9) < 1e-9
+    assert TriggerIndex('test_other_user', 1) is not TriggerIndex('test_other_user', 2)